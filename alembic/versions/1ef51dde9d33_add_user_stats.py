@@ -0,0 +1,109 @@
+"""Add user stats
+
+Revision ID: 1ef51dde9d33
+Revises: d44547e87647
+Create Date: 2026-10-18 05:19:19.118044
+
+"""
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = "1ef51dde9d33"
+down_revision = "d44547e87647"
+branch_labels = None
+depends_on = None
+
+# Counters of the items of each user, updated by statement level triggers
+COUNT_ITEMS_FUNCTION = """
+    CREATE FUNCTION count_user_items() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        IF TG_OP = 'INSERT' THEN
+            INSERT INTO user_stats AS stats (user_id, items, active_items)
+            SELECT user_id, sum(items), sum(active_items) FROM (
+                SELECT user_id, 1 AS items, (archived_at IS NULL)::int AS active_items FROM new_items
+            ) AS changes
+            WHERE user_id IS NOT NULL GROUP BY user_id
+            HAVING sum(items) <> 0 OR sum(active_items) <> 0 ORDER BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET
+                items = stats.items + excluded.items,
+                active_items = stats.active_items + excluded.active_items,
+                updated_at = TIMEZONE('utc', CURRENT_TIMESTAMP);
+        ELSIF TG_OP = 'UPDATE' THEN
+            INSERT INTO user_stats AS stats (user_id, items, active_items)
+            SELECT user_id, sum(items), sum(active_items) FROM (
+                SELECT user_id, 1 AS items, (archived_at IS NULL)::int AS active_items FROM new_items
+                UNION ALL
+                SELECT user_id, -1 AS items, -(archived_at IS NULL)::int AS active_items FROM old_items
+            ) AS changes
+            WHERE user_id IS NOT NULL GROUP BY user_id
+            HAVING sum(items) <> 0 OR sum(active_items) <> 0 ORDER BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET
+                items = stats.items + excluded.items,
+                active_items = stats.active_items + excluded.active_items,
+                updated_at = TIMEZONE('utc', CURRENT_TIMESTAMP);
+        ELSE
+            INSERT INTO user_stats AS stats (user_id, items, active_items)
+            SELECT user_id, sum(items), sum(active_items) FROM (
+                SELECT user_id, -1 AS items, -(archived_at IS NULL)::int AS active_items FROM old_items
+            ) AS changes
+            WHERE user_id IS NOT NULL GROUP BY user_id
+            HAVING sum(items) <> 0 OR sum(active_items) <> 0 ORDER BY user_id
+            ON CONFLICT (user_id) DO UPDATE SET
+                items = stats.items + excluded.items,
+                active_items = stats.active_items + excluded.active_items,
+                updated_at = TIMEZONE('utc', CURRENT_TIMESTAMP);
+        END IF;
+        RETURN NULL;
+    END
+    $$
+"""
+COUNT_ITEMS_TRIGGERS = [
+    "CREATE TRIGGER item_count_inserts AFTER INSERT ON item "
+    "REFERENCING NEW TABLE AS new_items "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_user_items()",
+    "CREATE TRIGGER item_count_updates AFTER UPDATE ON item "
+    "REFERENCING OLD TABLE AS old_items NEW TABLE AS new_items "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_user_items()",
+    "CREATE TRIGGER item_count_deletes AFTER DELETE ON item "
+    "REFERENCING OLD TABLE AS old_items "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_user_items()",
+]
+
+
+def upgrade():
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.create_table(
+        "user_stats",
+        sa.Column("user_id", sa.UUID(), nullable=False),
+        sa.Column("items", sa.Integer(), nullable=False),
+        sa.Column("active_items", sa.Integer(), nullable=False),
+        sa.Column(
+            "created_at",
+            sa.DateTime(timezone=True),
+            server_default=sa.text("TIMEZONE('utc', CURRENT_TIMESTAMP)"),
+            nullable=False,
+        ),
+        sa.Column("updated_at", sa.DateTime(timezone=True), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["person.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id"),
+    )
+    # ### end Alembic commands ###
+    op.execute(COUNT_ITEMS_FUNCTION)
+    # The triggers lock the item table against writes until the counters of the
+    # existing items are computed and committed
+    for trigger in COUNT_ITEMS_TRIGGERS:
+        op.execute(trigger)
+    op.execute(
+        "INSERT INTO user_stats (user_id, items, active_items) "
+        "SELECT user_id, count(*), count(*) FILTER (WHERE archived_at IS NULL) "
+        "FROM item WHERE user_id IS NOT NULL GROUP BY user_id"
+    )
+
+
+def downgrade():
+    op.execute("DROP FUNCTION count_user_items() CASCADE")
+    # ### commands auto generated by Alembic - please adjust! ###
+    op.drop_table("user_stats")
+    # ### end Alembic commands ###
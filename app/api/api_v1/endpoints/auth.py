@@ -5,34 +5,36 @@ from fastapi.responses import RedirectResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi_sso.sso.base import SSOBase
 from fastapi_sso.sso.google import OpenID
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, models, schemas
 from app.api import deps
 from app.api.exceptions import HTTPException
 from app.core import security
-from app.core.security import get_password_hash
 from app.email_service.auth import send_reset_password_email
 
 router = APIRouter()
 
 
 @router.post("/register", response_model=schemas.AuthResponse)
-def register_email_user(
+async def register_email_user(
     *,
-    db: Session = Depends(deps.get_db),
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
     user_in: schemas.UserCreate,
 ) -> Any:
     """
     Register as new user to the application.
     """
-    user = crud.user.get_by_email(db, email=user_in.email)
+    await deps.check_login_throttle(request, email=user_in.email)
+    user = await crud.user.get_by_email_async(db, email=user_in.email)
     if user:
+        await deps.record_login_failure(user_in.email)
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="The user with this username already exists in the system.",
         )
-    user = crud.user.create(db, obj_in=user_in)
+    user = await crud.user.create_async(db, obj_in=user_in)
     return create_login_response(user)
 
 
@@ -49,7 +51,7 @@ async def sso_login(
 @router.get("/{provider}/callback")
 async def sso_callback(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
     sso: SSOBase = Depends(deps.get_generic_sso),
     request: Request,
     provider: models.SSOProvider,
@@ -58,12 +60,12 @@ async def sso_callback(
     Callback url automatically called by the provider at the end of the authentication process. This endpoint is not meant to be called by the client directly
     """
     sso_user: OpenID = await sso.verify_and_process(request)
-    token = create_sso_user(db, provider, sso_user)
+    token = await create_sso_user(db, provider, sso_user)
     return RedirectResponse(f"{sso.state}?token={token}")
 
 
 @router.post("/sso/confirm", response_model=schemas.AuthResponse)
-def get_sso_access_token(
+async def get_sso_access_token(
     user: models.User = Depends(deps.get_user_after_sso_confirmation),
 ) -> Any:
     """
@@ -73,16 +75,20 @@ def get_sso_access_token(
 
 
 @router.post("/login/access-token", response_model=schemas.AuthResponse)
-def login_access_token(
-    db: Session = Depends(deps.get_db), form_data: OAuth2PasswordRequestForm = Depends()
+async def login_access_token(
+    request: Request,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    form_data: OAuth2PasswordRequestForm = Depends(),
 ) -> Any:
     """
     OAuth2 compatible token login, get an access token for future requests
     """
-    user = crud.user.authenticate(
+    await deps.check_login_throttle(request, email=form_data.username)
+    user = await crud.user.authenticate_async(
         db, email=form_data.username, password=form_data.password
     )
     if not user:
+        await deps.record_login_failure(form_data.username)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
@@ -91,15 +97,32 @@ def login_access_token(
 
 
 @router.post("/refresh", response_model=schemas.AuthResponse)
-def refresh_token(user: models.User = Depends(deps.get_user_from_refresh_token)) -> Any:
+async def refresh_token(
+    user: models.User = Depends(deps.get_user_from_refresh_token),
+) -> Any:
     """
     Refresh authentication information using a refresh token
     """
     return create_login_response(user)
 
 
+@router.post("/logout", response_model=schemas.Msg)
+async def logout(
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    refresh_token: str = Body(...),
+) -> Any:
+    """
+    Revoke a refresh token
+    """
+    token_data = deps.verify_token(refresh_token, schemas.TokenContext.REFRESH_TOKEN)
+    await crud.revoked_token.revoke_async(db, token_data=token_data)
+    return {"msg": "Refresh token revoked"}
+
+
 @router.post("/login/test-token", response_model=schemas.User)
-def test_token(current_user: models.User = Depends(deps.get_current_user)) -> Any:
+async def test_token(
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
     """
     Test access token
     """
@@ -107,13 +130,15 @@ def test_token(current_user: models.User = Depends(deps.get_current_user)) -> An
 
 
 @router.post("/password-recovery/{email}", response_model=schemas.Msg)
-def recover_password(
-    background_tasks: BackgroundTasks, email: str, db: Session = Depends(deps.get_db)
+async def recover_password(
+    background_tasks: BackgroundTasks,
+    email: str,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
 ) -> Any:
     """
     Password Recovery
     """
-    user = crud.user.get_by_email(db, email=email)
+    user = await crud.user.get_by_email_async(db, email=email)
 
     if not user:
         raise HTTPException(
@@ -131,29 +156,28 @@ def recover_password(
 
 
 @router.post("/reset-password/", response_model=schemas.Msg)
-def reset_password(
+async def reset_password(
+    request: Request,
     token: str = Body(...),
     new_password: str = Body(...),
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
 ) -> Any:
     """
     Reset password
     """
     email = security.verify_password_reset_token(token)
+    await deps.check_login_throttle(request, email=email)
     if not email:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
         )
-    user = crud.user.get_by_email(db, email=email)
+    user = await crud.user.get_by_email_async(db, email=email)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="The user with this username does not exist in the system.",
         )
-    password_hash = get_password_hash(new_password)
-    user.password_hash = password_hash
-    db.add(user)
-    db.commit()
+    await crud.user.update_password_async(db, db_obj=user, new_password=new_password)
     return {"msg": "Password updated successfully"}
 
 
@@ -166,15 +190,17 @@ def create_login_response(user: models.User) -> schemas.AuthResponse:
     )
 
 
-def create_sso_user(db: Session, provider: models.Provider, openid_user: OpenID) -> str:
-    user = crud.user.get_by_sso_provider_id(
+async def create_sso_user(
+    db: AsyncSession, provider: models.Provider, openid_user: OpenID
+) -> str:
+    user = await crud.user.get_by_sso_provider_id_async(
         db, sso_provider_id=openid_user.id, provider=provider
     )
 
     if user is None:
         # Verify if user exists with email
         # This can happen when the user has already registered with email or facebook and now wants to login with Google
-        user = crud.user.get_by_email(db, email=openid_user.email)
+        user = await crud.user.get_by_email_async(db, email=openid_user.email)
         if user is not None:
             raise HTTPException(
                 status_code=status.HTTP_409_CONFLICT,
@@ -188,7 +214,7 @@ def create_sso_user(db: Session, provider: models.Provider, openid_user: OpenID)
             first_name=openid_user.first_name,
             last_name=openid_user.last_name,
         )
-        user = crud.user.create(db, obj_in=user_in)
-    user = crud.user.update_sso_confirmation_code(db, user)
+        user = await crud.user.create_async(db, obj_in=user_in)
+    user = await crud.user.update_sso_confirmation_code_async(db, user)
     token = security.create_sso_confirmation_token(user.sso_confirmation_code)
     return token
@@ -1,121 +1,353 @@
-from typing import Any, List
+from typing import Any, Dict, List, Optional
+from uuid import UUID
 
-from fastapi import APIRouter, Depends
-from pydantic.types import UUID4
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, models, schemas
 from app.api import deps
-from app.api.exceptions import HTTPItemNotFound, HTTPNotEnoughPermissions
+from app.api.exceptions import HTTPException, HTTPItemNotFound, HTTPNotEnoughPermissions
+from app.api.export import ExportFormat, export_response
+from app.core.config import settings
+from app.core.etag import compute_etag, compute_page_etag
 from app.models import Role
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[schemas.Item])
-def read_items(
-    db: Session = Depends(deps.get_db),
-    skip: int = 0,
-    limit: int = 100,
-    current_user: models.User = Depends(deps.get_current_user),
+async def read_items(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    page: schemas.Pagination = Depends(deps.get_pagination),
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
 ) -> Any:
     """
     Retrieve items of the current user. Admin users retrieves all items.
+
+    Items are ordered by creation date, the `X-Next-Cursor` header holds the
+    `cursor` of the next page. Admin users also get the number of items in the
+    `X-Total-Count` header, estimated on large tables as flagged by
+    `X-Total-Count-Estimated`.
+
+    A page whose `ETag` matches the `If-None-Match` header is answered with a
+    304 Not Modified response.
     """
     if current_user.is_admin:
-        items = crud.item.get_multi(db, skip=skip, limit=limit)
+        versions, next_cursor = await crud.item.get_page_versions_async(
+            db, cursor=page.cursor, skip=page.skip, limit=page.limit
+        )
+    else:
+        versions, next_cursor = await crud.item.get_page_versions_by_user_async(
+            db,
+            user=current_user,
+            cursor=page.cursor,
+            skip=page.skip,
+            limit=page.limit,
+        )
+    etag = compute_page_etag(versions, next_cursor is not None)
+    if not_modified := deps.not_modified(request, response, etag):
+        return not_modified
+
+    if current_user.is_admin:
+        items, next_cursor = await crud.item.get_page_async(
+            db, cursor=page.cursor, skip=page.skip, limit=page.limit
+        )
+        deps.set_total_count(response, await crud.item.count_async(db))
     else:
-        items = crud.item.get_multi_by_user(
-            db, user=current_user, skip=skip, limit=limit
+        items, next_cursor = await crud.item.get_page_by_user_async(
+            db,
+            user=current_user,
+            cursor=page.cursor,
+            skip=page.skip,
+            limit=page.limit,
         )
+    deps.set_next_cursor(response, next_cursor)
+
+    return items
 
+
+@router.get("/search", response_model=List[schemas.Item])
+async def search_items(
+    response: Response,
+    q: str = Query(min_length=1, max_length=settings.MAX_SEARCH_LENGTH),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    page: schemas.Pagination = Depends(deps.get_search_pagination),
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    """
+    Search the items of the current user, all the items for admin users, in
+    their name and description. `q` supports quoted phrases, `or` and `-` to
+    exclude a word, and is stemmed according to the language of the user.
+
+    Items are ordered by relevance, the `X-Next-Cursor` header holds the
+    `cursor` of the next page.
+    """
+    items, next_cursor = await crud.item.search_async(
+        db,
+        text=q,
+        language=current_user.language,
+        user=None if current_user.is_admin else current_user,
+        cursor=page.cursor,
+        limit=page.limit,
+    )
+    deps.set_next_cursor(response, next_cursor)
     return items
 
 
 @router.post("/", response_model=schemas.Item)
-def create_item(
+async def create_item(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
     item_in: schemas.ItemCreate,
-    current_user: models.User = Depends(deps.get_current_user),
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
 ) -> Any:
     """
     Create new item. Admin cannot create an item for themselves. Use the dedicated admin endpoint instead.
     """
-    item = crud.item.create_with_user(db=db, obj_in=item_in, user=current_user)
+    item = await crud.item.create_with_user_async(
+        db=db, obj_in=item_in, user=current_user
+    )
     return item
 
 
 @router.post("/admin", response_model=schemas.Item)
-def create_item_admin(
+async def create_item_admin(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
     item_in: schemas.ItemCreate,
-    current_user: models.User = Depends(deps.require_role(Role.ADMIN)),
-    user_id: UUID4,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+    user_id: UUID,
 ) -> Any:
     """
     ADMIN: Create new item for another user.
     """
-    user = crud.user.get(db=db, id=user_id)
+    user = await crud.user.get_async(db=db, id=user_id)
     if not user:
         raise HTTPItemNotFound(current_user.language)
-    item = crud.item.create_with_user(db=db, obj_in=item_in, user=user)
+    item = await crud.item.create_with_user_async(db=db, obj_in=item_in, user=user)
     return item
 
 
+async def get_owned_item(
+    db: AsyncSession, id: UUID, current_user: schemas.Principal
+) -> models.Item:
+    item = await crud.item.get_async(db=db, id=id)
+    if item is None:
+        raise HTTPItemNotFound(current_user.language)
+    if not current_user.is_admin and (item.user_id != current_user.id):
+        raise HTTPNotEnoughPermissions(current_user.language)
+    return item
+
+
+async def bulk_result(
+    db: AsyncSession,
+    ids: List[UUID],
+    succeeded: List[UUID],
+    current_user: schemas.Principal,
+    with_archived: bool = False,
+) -> schemas.BulkResult:
+    """
+    Outcome of a bulk statement checking the ownership itself: only the ids it
+    didn't return load their owners, with a single query, to report them.
+    """
+    done = set(succeeded)
+    missing = [id for id in dict.fromkeys(ids) if id not in done]
+    owners: Dict[UUID, Optional[UUID]] = {}
+    if missing:
+        owners = await crud.item.get_owners_async(
+            db, ids=missing, with_archived=with_archived
+        )
+    failed, unchanged = [], []
+    for id in missing:
+        if id not in owners:
+            error: HTTPException = HTTPItemNotFound(current_user.language)
+        elif not current_user.is_admin and owners[id] != current_user.id:
+            error = HTTPNotEnoughPermissions(current_user.language)
+        else:
+            # Owned and found, the item already held the changes
+            unchanged.append(id)
+            continue
+        failed.append(schemas.BulkFailure(id=id, detail=error.detail))
+    return schemas.BulkResult(succeeded=succeeded, failed=failed, unchanged=unchanged)
+
+
+@router.post("/bulk", response_model=List[schemas.Item])
+async def create_items(
+    *,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    items_in: schemas.ItemBulkCreate,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    """
+    Create new items for the current user.
+    """
+    items = await crud.item.create_multi_with_user_async(
+        db=db, objs_in=items_in.items, user=current_user
+    )
+    return items
+
+
+@router.put("/bulk", response_model=schemas.BulkResult)
+async def update_items(
+    *,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    items_in: schemas.ItemBulkUpdate,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    """
+    Apply the same changes to items. The items that don't exist or that the
+    current user doesn't own are reported as failed, the items that already
+    hold the changes as unchanged.
+    """
+    updated = await crud.item.update_multi_owned_async(
+        db, ids=items_in.ids, obj_in=items_in.changes, user=current_user
+    )
+    return await bulk_result(db, items_in.ids, updated, current_user)
+
+
+@router.delete("/bulk/archive", response_model=schemas.BulkResult)
+async def archive_items(
+    *,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    items_in: schemas.BulkIds,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    """
+    Archive items.
+    """
+    archived = await crud.item.archive_multi_owned_async(
+        db, ids=items_in.ids, user=current_user
+    )
+    return await bulk_result(db, items_in.ids, archived, current_user)
+
+
+@router.put("/bulk/unarchive", response_model=schemas.BulkResult)
+async def unarchive_items(
+    *,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    items_in: schemas.BulkIds,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    """
+    Unarchive items.
+    """
+    unarchived = await crud.item.unarchive_multi_owned_async(
+        db, ids=items_in.ids, user=current_user
+    )
+    return await bulk_result(
+        db, items_in.ids, unarchived, current_user, with_archived=True
+    )
+
+
+@router.delete("/bulk", response_model=schemas.BulkResult)
+async def delete_items(
+    *,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    items_in: schemas.BulkIds,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    """
+    Delete items.
+    """
+    deleted = await crud.item.remove_multi_owned_async(
+        db, ids=items_in.ids, user=current_user
+    )
+    return await bulk_result(db, items_in.ids, deleted, current_user)
+
+
+ITEM_EXPORT_COLUMNS = [
+    models.Item.id,
+    models.Item.name,
+    models.Item.description,
+    models.Item.user_id,
+    models.Item.created_at,
+    models.Item.updated_at,
+    models.Item.archived_at,
+]
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_items(
+    format: ExportFormat = ExportFormat.NDJSON,
+    with_archived: bool = False,
+    _: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+) -> Any:
+    """
+    ADMIN: Export all the items as NDJSON or CSV, ordered by creation date.
+    """
+    return export_response(
+        crud.item,
+        ITEM_EXPORT_COLUMNS,
+        format=format,
+        name="items",
+        with_archived=with_archived,
+    )
+
+
 @router.put("/{id}", response_model=schemas.Item)
-def update_item(
+async def update_item(
     *,
-    db: Session = Depends(deps.get_db),
-    id: UUID4,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    id: UUID,
     item_in: schemas.ItemUpdate,
-    current_user: models.User = Depends(deps.get_current_user),
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
 ) -> Any:
     """
     Update an item.
     """
-    item = crud.item.get(db=db, id=id)
-    if item is None:
-        raise HTTPItemNotFound(current_user.language)
-    if not current_user.is_admin and (item.user_id != current_user.id):
-        raise HTTPNotEnoughPermissions(current_user.language)
-    item = crud.item.update(db=db, db_obj=item, obj_in=item_in)
+    item = await crud.item.update_owned_async(
+        db, id=id, obj_in=item_in, user=current_user
+    )
+    if item is not None:
+        return item
+    # Missing, not owned or unchanged: only this path loads the item
+    item = await get_owned_item(db, id, current_user)
     return item
 
 
 @router.get("/{id}", response_model=schemas.Item)
-def read_item(
+async def read_item(
     *,
-    db: Session = Depends(deps.get_db),
-    id: UUID4,
-    current_user: models.User = Depends(deps.get_current_user),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    id: UUID,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
 ) -> Any:
     """
-    Get item by ID.
+    Get item by ID, a 304 Not Modified response when its `ETag` matches the
+    `If-None-Match` header.
     """
-    item = crud.item.get(db=db, id=id)
-    if item is None:
+    version = await crud.item.get_version_async(db, id, columns=[models.Item.user_id])
+    if version is None:
         raise HTTPItemNotFound(current_user.language)
-    if not current_user.is_admin and (item.user_id != current_user.id):
+    if not current_user.is_admin and (version.user_id != current_user.id):
         raise HTTPNotEnoughPermissions(current_user.language)
+    if not_modified := deps.not_modified(request, response, compute_etag([version])):
+        return not_modified
+    item = await crud.item.get_async(db=db, id=id)
+    if item is None:
+        raise HTTPItemNotFound(current_user.language)
     return item
 
 
 @router.delete("/{id}", response_model=schemas.Item)
-def delete_item(
+async def delete_item(
     *,
-    db: Session = Depends(deps.get_db),
-    id: UUID4,
-    current_user: models.User = Depends(deps.get_current_user),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    id: UUID,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
 ) -> Any:
     """
     Delete an item.
     """
-    item = crud.item.get(db=db, id=id)
-    if item is None:
-        raise HTTPItemNotFound(current_user.language)
-    if not current_user.is_admin and (item.user_id != current_user.id):
-        raise HTTPNotEnoughPermissions(current_user.language)
-    item = crud.item.remove(db, item)
-    return item
+    item = await crud.item.remove_owned_async(db, id=id, user=current_user)
+    if item is not None:
+        return item
+    # Missing or not owned: only this path loads the item, to tell them apart.
+    # Still found, it was deleted by a concurrent request since the DELETE
+    await get_owned_item(db, id, current_user)
+    raise HTTPItemNotFound(current_user.language)
@@ -1,30 +1,77 @@
-from typing import Any, List
+from typing import Any, List, Optional
+from uuid import UUID
 
-from fastapi import APIRouter, BackgroundTasks, Depends, status
-from pydantic.types import UUID4
-from sqlalchemy.orm import Session
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Depends,
+    Query,
+    Request,
+    Response,
+    status,
+)
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, models, schemas
 from app.api import deps
-from app.api.exceptions import HTTPException, HTTPNotEnoughPermissions, HTTPUserNotFound
+from app.api.exceptions import (
+    HTTPException,
+    HTTPImportNotFound,
+    HTTPImportTooLarge,
+    HTTPNotEnoughPermissions,
+    HTTPUserNotFound,
+)
+from app.api.export import ExportFormat, export_response
+from app.api.imports import ImportTooLargeError, run_user_import, spool_body
+from app.core.config import settings
+from app.core.etag import compute_etag, compute_page_etag
 from app.email_service.auth import send_new_account_email
-from app.models.user import Role
+from app.models.user import Provider, Role
 
 router = APIRouter()
 
 
 @router.get("/", response_model=List[schemas.User])
-def read_users(
-    db: Session = Depends(deps.get_db),
-    skip: int = 0,
-    limit: int = 100,
+async def read_users(
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    page: schemas.Pagination = Depends(deps.get_pagination),
     with_archived: bool = False,
-    _: models.User = Depends(deps.require_role(Role.ADMIN)),
+    _: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
     ADMIN: Retrieve users.
+
+    Users are ordered by creation date, the `X-Next-Cursor` header holds the
+    `cursor` of the next page. The `X-Total-Count` header holds the number of
+    users, estimated on large tables as flagged by `X-Total-Count-Estimated`.
+
+    A page whose `ETag` matches the `If-None-Match` header is answered with a
+    304 Not Modified response, the users are not counted.
     """
-    users = crud.user.get_multi(db, skip=skip, limit=limit, with_archived=with_archived)
+    versions, next_cursor = await crud.user.get_page_versions_async(
+        db,
+        cursor=page.cursor,
+        skip=page.skip,
+        limit=page.limit,
+        with_archived=with_archived,
+    )
+    etag = compute_page_etag(versions, next_cursor is not None)
+    if not_modified := deps.not_modified(request, response, etag):
+        return not_modified
+
+    users, next_cursor = await crud.user.get_page_async(
+        db,
+        cursor=page.cursor,
+        skip=page.skip,
+        limit=page.limit,
+        with_archived=with_archived,
+    )
+    deps.set_next_cursor(response, next_cursor)
+    count = await crud.user.count_async(db, with_archived=with_archived)
+    deps.set_total_count(response, count)
     return users
 
 
@@ -32,146 +79,318 @@ def read_users(
 async def create_user(
     *,
     background_tasks: BackgroundTasks,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
     user_in: schemas.UserCreate,
     role: Role = Role.CUSTOMER,
-    current_user: models.User = Depends(deps.require_role(Role.ADMIN)),
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
     ADMIN: Create new user.
     """
-    user = crud.user.get_by_email(db, email=user_in.email)
+    user = await crud.user.get_by_email_async(db, email=user_in.email)
     if user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
             detail="The user with this username already exists in the system.",
             locale=current_user.language,
         )
-    user = crud.user.create(db, obj_in=user_in, role=role)
+    user = await crud.user.create_async(db, obj_in=user_in, role=role)
     background_tasks.add_task(send_new_account_email, email=user_in.email)
     return user
 
 
 @router.put("/me", response_model=schemas.User)
-def update_user_me(
+async def update_user_me(
     *,
-    db: Session = Depends(deps.get_db),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
     user_in: schemas.UserUpdate,
     current_user: models.User = Depends(deps.get_current_user),
 ) -> Any:
     """
     Update current user.
     """
-    user = crud.user.update(db, db_obj=current_user, obj_in=user_in)
+    user = await crud.user.update_async(db, db_obj=current_user, obj_in=user_in)
     return user
 
 
 @router.get("/me", response_model=schemas.User)
-def read_user_me(
-    current_user: models.User = Depends(deps.get_current_user),
+async def read_user_me(
+    request: Request,
+    response: Response,
+    current_user: schemas.Principal = Depends(deps.get_current_principal),
 ) -> Any:
     """
-    Read current user.
+    Read current user, a 304 Not Modified response when its `ETag` matches the
+    `If-None-Match` header.
     """
+    version = (
+        current_user.id,
+        current_user.created_at,
+        current_user.updated_at,
+        current_user.profile_picture_url,
+        current_user.stats.items,
+        current_user.stats.active_items,
+    )
+    if not_modified := deps.not_modified(request, response, compute_etag([version])):
+        return not_modified
     return current_user
 
 
+@router.post("/me/revoke-tokens", response_model=schemas.Msg)
+async def revoke_tokens_me(
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    current_user: models.User = Depends(deps.get_current_user),
+) -> Any:
+    """
+    Revoke all the tokens of the current user, logging them out of every device.
+    """
+    await crud.user.revoke_tokens_async(db, db_obj=current_user)
+    return {"msg": "Tokens revoked"}
+
+
 @router.delete("/me/archive", response_model=schemas.User)
-def archive_user_me(
-    db: Session = Depends(deps.get_db),
+async def archive_user_me(
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
     current_user: models.User = Depends(deps.get_current_user),
 ) -> Any:
     """
     Archive the current user. Only admin users can unarchive users.
     """
-    user = crud.user.archive(db, obj=current_user)
+    user = await crud.user.archive_async(db, obj=current_user)
     return user
 
 
+# Exported columns, the credentials are left out
+USER_EXPORT_COLUMNS = [
+    models.User.id,
+    models.User.email,
+    models.User.first_name,
+    models.User.last_name,
+    models.User.role,
+    models.User.language,
+    models.User.provider,
+    models.User.confirmed,
+    models.User.created_at,
+    models.User.updated_at,
+    models.User.archived_at,
+]
+
+
+@router.get("/export", response_class=StreamingResponse)
+async def export_users(
+    format: ExportFormat = ExportFormat.NDJSON,
+    with_archived: bool = False,
+    _: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+) -> Any:
+    """
+    ADMIN: Export all the users as NDJSON or CSV, ordered by creation date.
+    """
+    return export_response(
+        crud.user,
+        USER_EXPORT_COLUMNS,
+        format=format,
+        name="users",
+        with_archived=with_archived,
+    )
+
+
+@router.post(
+    "/import",
+    response_model=schemas.UserImport,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def import_users(
+    *,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    format: ExportFormat = ExportFormat.NDJSON,
+    role: Role = Role.CUSTOMER,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+) -> Any:
+    """
+    ADMIN: Import users from the body of the request, NDJSON or CSV with a
+    header, one `UserCreate` per line.
+
+    The users are imported in the background, the progress and the rows not
+    imported are read with `GET /users/import/{import_id}`. The users whose
+    email is taken are skipped, the others get a new account email once the
+    import finished.
+    """
+    try:
+        file = await spool_body(request)
+    except ImportTooLargeError:
+        raise HTTPImportTooLarge(current_user.language)
+    job = await crud.user_import.create_async(
+        db, obj_in=schemas.UserImportCreate(format=format)
+    )
+    background_tasks.add_task(run_user_import, job.id, file, format, role)
+    return job
+
+
+@router.get("/import/{import_id}", response_model=schemas.UserImport)
+async def read_user_import(
+    *,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    import_id: UUID,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+) -> Any:
+    """
+    ADMIN: Read the progress of an import of users.
+    """
+    job = await crud.user_import.get_async(db, id=import_id)
+    if job is None:
+        raise HTTPImportNotFound(current_user.language)
+    return job
+
+
+@router.get("/search", response_model=List[schemas.User])
+async def search_users(
+    response: Response,
+    q: str = Query(min_length=3, max_length=settings.MAX_SEARCH_LENGTH),
+    fuzzy: bool = False,
+    role: Optional[Role] = None,
+    provider: Optional[Provider] = None,
+    with_archived: bool = False,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    page: schemas.Pagination = Depends(deps.get_search_pagination),
+    _: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+) -> Any:
+    """
+    ADMIN: Search users by the start of their email, first name or last name,
+    or by similar words with `fuzzy`, optionally filtered by role and provider.
+
+    Users are ordered by decreasing similarity to `q`, the `X-Next-Cursor`
+    header holds the `cursor` of the next page.
+    """
+    users, next_cursor = await crud.user.search_async(
+        db,
+        text=q,
+        fuzzy=fuzzy,
+        role=role,
+        provider=provider,
+        with_archived=with_archived,
+        cursor=page.cursor,
+        limit=page.limit,
+    )
+    deps.set_next_cursor(response, next_cursor)
+    return users
+
+
 @router.get("/{user_id}", response_model=schemas.User)
-def read_user(
+async def read_user(
     *,
-    db: Session = Depends(deps.get_db),
-    user_id: UUID4,
-    current_user: models.User = Depends(deps.require_role(Role.ADMIN)),
+    request: Request,
+    response: Response,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    user_id: UUID,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
-    ADMIN: Read a specific user by id.
+    ADMIN: Read a specific user by id, a 304 Not Modified response when its
+    `ETag` matches the `If-None-Match` header.
     """
-    user = crud.user.get(db, id=user_id, with_archived=True)
-    if user is None:
-        raise
-    if user == current_user:
-        return user
-    if not current_user.is_admin:
+    version = await crud.user.get_version_async(db, user_id, with_archived=True)
+    if version is None:
+        raise HTTPUserNotFound(current_user.language)
+    if version.id != current_user.id and not current_user.is_admin:
         raise HTTPNotEnoughPermissions(current_user.language)
+    if not_modified := deps.not_modified(request, response, compute_etag([version])):
+        return not_modified
+    user = await crud.user.get_async(db, id=user_id, with_archived=True)
+    if user is None:
+        raise HTTPUserNotFound(current_user.language)
     return user
 
 
 @router.put("/{user_id}", response_model=schemas.User)
-def update_user(
+async def update_user(
     *,
-    db: Session = Depends(deps.get_db),
-    user_id: UUID4,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    user_id: UUID,
     user_in: schemas.UserUpdate,
-    current_user: models.User = Depends(deps.require_role(Role.ADMIN)),
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
     ADMIN: Update a user.
     """
-    user = crud.user.get(db, id=user_id, with_archived=True)
+    user = await crud.user.get_async(db, id=user_id, with_archived=True)
     if user is None:
         raise HTTPUserNotFound(current_user.language)
-    user = crud.user.update(db, db_obj=user, obj_in=user_in)
+    user = await crud.user.update_async(db, db_obj=user, obj_in=user_in)
     return user
 
 
+@router.post("/{user_id}/revoke-tokens", response_model=schemas.Msg)
+async def revoke_tokens(
+    *,
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    user_id: UUID,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+) -> Any:
+    """
+    ADMIN: Revoke all the tokens of a user.
+    """
+    user = await crud.user.get_async(db, id=user_id, with_archived=True)
+    if user is None:
+        raise HTTPUserNotFound(current_user.language)
+    await crud.user.revoke_tokens_async(db, db_obj=user)
+    return {"msg": "Tokens revoked"}
+
+
 @router.delete("/{user_id}/archive", response_model=schemas.User)
-def archive_user(
+async def archive_user(
     *,
-    db: Session = Depends(deps.get_db),
-    user_id: UUID4,
-    current_user: models.User = Depends(deps.require_role(Role.ADMIN)),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    user_id: UUID,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
     ADMIN: Archive a user.
     """
-    user = crud.user.get(db, id=user_id)
+    user = await crud.user.get_async(db, id=user_id)
     if user is None:
         raise HTTPUserNotFound(current_user.language)
-    user = crud.user.archive(db, user)
+    user = await crud.user.archive_async(db, user)
     return user
 
 
 @router.put("/{user_id}/unarchive", response_model=schemas.User)
-def unarchive_user(
+async def unarchive_user(
     *,
-    db: Session = Depends(deps.get_db),
-    user_id: UUID4,
-    current_user: models.User = Depends(deps.require_role(Role.ADMIN)),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    user_id: UUID,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
     ADMIN: Unarchive a user.
     """
-    user = crud.user.get(db, id=user_id, with_archived=True)
+    user = await crud.user.get_async(db, id=user_id, with_archived=True)
     if user is None:
         raise HTTPUserNotFound(current_user.language)
-    user = crud.user.unarchive(db, user)
+    # The email may have been taken by a new user since the archive
+    if await crud.user.get_by_email_async(db, email=user.email):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="The user with this username already exists in the system.",
+            locale=current_user.language,
+        )
+    user = await crud.user.unarchive_async(db, user)
     return user
 
 
 @router.delete("/{user_id}", response_model=schemas.User)
-def delete_user(
+async def delete_user(
     *,
-    db: Session = Depends(deps.get_db),
-    user_id: UUID4,
-    current_user: models.User = Depends(deps.require_role(Role.ADMIN)),
+    db: AsyncSession = Depends(deps.get_db, scope="function"),
+    user_id: UUID,
+    current_user: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
     ADMIN: Permanently delete a user.
     """
-    user = crud.user.get(db, id=user_id)
+    user = await crud.user.get_async(db, id=user_id)
     if user is None:
         raise HTTPUserNotFound(current_user.language)
-    user = crud.user.remove(db, id=user_id)
+    user = await crud.user.remove_async(db, user)
     return user
@@ -3,8 +3,11 @@ from typing import Any
 from fastapi import APIRouter, Depends, status
 from pydantic.networks import EmailStr
 
-from app import models, schemas
+from app import schemas
 from app.api import deps
+from app.core.security import token_cache
+from app.core.throttling import login_throttle
+from app.db.session import pool_stats
 from app.email_service.test import send_test_email
 from app.models import Role
 
@@ -16,10 +19,24 @@ router = APIRouter()
 )
 def test_email(
     email_to: EmailStr,
-    _: models.User = Depends(deps.require_role(Role.ADMIN)),
+    _: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
 ) -> Any:
     """
     Test emails.
     """
     send_test_email(email_to=email_to)
     return {"msg": "Test email sent"}
+
+
+@router.get("/metrics")
+def read_metrics(
+    _: schemas.Principal = Depends(deps.require_role(Role.ADMIN)),
+) -> Any:
+    """
+    ADMIN: Read the in-process metrics of the worker handling the request.
+    """
+    return {
+        "token_cache": token_cache.stats(),
+        "login_throttle": login_throttle.stats(),
+        "db_pool": pool_stats(),
+    }
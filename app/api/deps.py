@@ -1,7 +1,9 @@
-from typing import Callable, Generator
+from ipaddress import ip_address
+from typing import Any, AsyncGenerator, Callable, Optional, Union
 
+import anyio
 import jwt
-from fastapi import Body, Depends, status
+from fastapi import Body, Depends, Query, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer
 from fastapi_sso.sso.base import SSOBase
 from fastapi_sso.sso.facebook import FacebookSSO
@@ -9,13 +11,29 @@ from fastapi_sso.sso.github import GithubSSO
 from fastapi_sso.sso.google import GoogleSSO
 from jwt import ExpiredSignatureError, PyJWTError
 from pydantic import ValidationError
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app import crud, models, schemas
-from app.api.exceptions import HTTPException, HTTPNotEnoughPermissions
+from app.api.exceptions import (
+    HTTPException,
+    HTTPInvalidCursor,
+    HTTPNotEnoughPermissions,
+    HTTPTooManyRequests,
+)
 from app.core import security
 from app.core.config import settings
-from app.db.session import SessionLocal
+from app.core.etag import ETAG_HEADER, IF_NONE_MATCH_HEADER, etag_matches
+from app.core.pagination import (
+    NEXT_CURSOR_HEADER,
+    TOTAL_COUNT_ESTIMATED_HEADER,
+    TOTAL_COUNT_HEADER,
+    decode_cursor,
+    decode_ranked_cursor,
+)
+from app.core.throttling import login_throttle
+from app.crud.base import UNIT_OF_WORK, Count
+from app.db.routing import CONSISTENCY_TOKEN_HEADER
+from app.db.session import AsyncSessionLocal, replica_engines
 
 reusable_oauth2 = OAuth2PasswordBearer(
     tokenUrl=f"{settings.API_V1_STR}/auth/login/access-token"
@@ -60,12 +78,74 @@ def get_facebook_sso() -> FacebookSSO:
     )
 
 
-def get_db() -> Generator:
-    try:
-        db = SessionLocal()
+async def get_db(request: Request) -> AsyncGenerator:
+    """
+    Unit of work of the request: the CRUD methods only flush their changes, they
+    are committed at once when the route returned.
+
+    Must be used with `scope="function"` for the commit to happen before the
+    response is sent.
+    """
+    async with AsyncSessionLocal() as db:
+        db.info[UNIT_OF_WORK] = True
+        await db.route_reads(
+            replica_engines,
+            request.headers.get(CONSISTENCY_TOKEN_HEADER),
+            request.scope.setdefault("state", {}),
+        )
         yield db
-    finally:
-        db.close()
+        await db.commit()
+
+
+def is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in settings.TRUSTED_PROXIES)
+
+
+def get_client_ip(request: Request) -> str:
+    """
+    IP of the client, read from the X-Forwarded-For header when the request comes
+    from one of the TRUSTED_PROXIES: the right-most address that isn't a trusted
+    proxy, as the ones on its left can be forged by the client.
+    """
+    ip = request.client.host if request.client else "unknown"
+    if not is_trusted_proxy(ip):
+        return ip
+    forwarded_for = ",".join(request.headers.getlist("X-Forwarded-For"))
+    for forwarded_ip in reversed(forwarded_for.split(",")):
+        forwarded_ip = forwarded_ip.strip()
+        if not forwarded_ip:
+            continue
+        ip = forwarded_ip
+        if not is_trusted_proxy(ip):
+            break
+    return ip
+
+
+async def check_login_throttle(request: Request, email: Optional[str] = None) -> None:
+    """
+    Reject the request before any password hashing when the client IP or the
+    targeted email exhausted their attempts.
+    """
+    if not settings.LOGIN_THROTTLE_ENABLED:
+        return
+    # The buckets are updated under a blocking file lock
+    retry_after = await anyio.to_thread.run_sync(
+        login_throttle.check, get_client_ip(request), email
+    )
+    if retry_after:
+        raise HTTPTooManyRequests(retry_after)
+
+
+async def record_login_failure(email: str) -> None:
+    """
+    Charge the bucket of the email with a failed attempt.
+    """
+    if settings.LOGIN_THROTTLE_ENABLED:
+        await anyio.to_thread.run_sync(login_throttle.record_failure, email)
 
 
 def verify_token(
@@ -96,13 +176,14 @@ def verify_token(
     return token_data
 
 
-def get_user_after_sso_confirmation(
-    db: Session = Depends(get_db), sso_confirmation_token: str = Body(...)
+async def get_user_after_sso_confirmation(
+    db: AsyncSession = Depends(get_db, scope="function"),
+    sso_confirmation_token: str = Body(...),
 ) -> models.User:
     token_data = verify_token(
         sso_confirmation_token, schemas.TokenContext.SSO_CONFIRMATION_TOKEN
     )
-    user = crud.user.get_by_sso_confirmation_code(
+    user = await crud.user.get_by_sso_confirmation_code_async(
         db, token_data.user_id, token_data.sso_confirmation_code
     )
     if user is None:
@@ -112,21 +193,39 @@ def get_user_after_sso_confirmation(
     return user
 
 
-def get_user_from_refresh_token(
-    db: Session = Depends(get_db), refresh_token: str = Body(...)
+def is_revoked_for_user(
+    token_data: schemas.TokenPayload,
+    user: Union[models.User, schemas.Principal],
+) -> bool:
+    return (
+        user.tokens_valid_after is not None and token_data.iat < user.tokens_valid_after
+    )
+
+
+async def get_user_from_refresh_token(
+    db: AsyncSession = Depends(get_db, scope="function"), refresh_token: str = Body(...)
 ) -> models.User:
     token_data = verify_token(refresh_token, schemas.TokenContext.REFRESH_TOKEN)
-    user = crud.user.get(db, id=token_data.user_id)
+    if await crud.revoked_token.is_revoked_async(db, token_id=token_data.random_value):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Token revoked"
+        )
+    user = await crud.user.get_async(db, id=token_data.user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found",
         )
+    if is_revoked_for_user(token_data, user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Token revoked"
+        )
     return user
 
 
-def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(reusable_oauth2)
+async def get_current_user(
+    db: AsyncSession = Depends(get_db, scope="function"),
+    token: str = Depends(reusable_oauth2),
 ) -> models.User:
     try:
         token_data = verify_token(token, schemas.TokenContext.ACCESS_TOKEN)
@@ -135,20 +234,114 @@ def get_current_user(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Invalid token, could not validate credentials",
         )
-    user = crud.user.get(db, id=token_data.user_id)
+    user = await crud.user.get_async(db, id=token_data.user_id)
     if user is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
         )
+    if is_revoked_for_user(token_data, user):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Token revoked"
+        )
     return user
 
 
+async def get_current_principal(
+    db: AsyncSession = Depends(get_db, scope="function"),
+    token: str = Depends(reusable_oauth2),
+) -> schemas.Principal:
+    """
+    Cached snapshot of the current user, use `get_current_user` when the ORM
+    instance is needed to write to the user.
+    """
+    try:
+        token_data = verify_token(token, schemas.TokenContext.ACCESS_TOKEN)
+    except (jwt.PyJWTError, ValidationError):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid token, could not validate credentials",
+        )
+    principal = await crud.user.get_principal_async(db, id=token_data.user_id)
+    if principal is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="User not found"
+        )
+    if is_revoked_for_user(token_data, principal):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Token revoked"
+        )
+    return principal
+
+
 def require_role(*roles: models.Role) -> Callable:
     def check_role(
-        current_user: models.User = Depends(get_current_user),
-    ) -> models.User:
+        current_user: schemas.Principal = Depends(get_current_principal),
+    ) -> schemas.Principal:
         if not current_user.role in roles:
             raise HTTPNotEnoughPermissions(current_user.language)
         return current_user
 
     return check_role
+
+
+def get_pagination(
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1),
+    cursor: Optional[str] = None,
+) -> schemas.Pagination:
+    """
+    Pages of at most `MAX_PAGE_SIZE` rows, the next page is requested with the
+    cursor sent in the `X-Next-Cursor` header instead of an offset.
+    """
+    return check_cursor(decode_cursor, skip=skip, limit=limit, cursor=cursor)
+
+
+def get_search_pagination(
+    limit: int = Query(100, ge=1), cursor: Optional[str] = None
+) -> schemas.Pagination:
+    """
+    Pages of the search results ordered by relevance, without offset.
+    """
+    return check_cursor(decode_ranked_cursor, limit=limit, cursor=cursor)
+
+
+def check_cursor(
+    decode: Callable[[str], Any],
+    *,
+    skip: int = 0,
+    limit: int,
+    cursor: Optional[str],
+) -> schemas.Pagination:
+    if cursor is not None:
+        try:
+            decode(cursor)
+        except ValueError:
+            raise HTTPInvalidCursor()
+    return schemas.Pagination(
+        skip=skip, limit=min(limit, settings.MAX_PAGE_SIZE), cursor=cursor
+    )
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]) -> None:
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+def set_total_count(response: Response, count: Count) -> None:
+    total, exact = count
+    response.headers[TOTAL_COUNT_HEADER] = str(total)
+    response.headers[TOTAL_COUNT_ESTIMATED_HEADER] = str(not exact).lower()
+
+
+def not_modified(request: Request, response: Response, etag: str) -> Optional[Response]:
+    """
+    Set the ETag of the response. Returns a 304 Not Modified response when the
+    client already holds this version, the body is then neither loaded nor
+    serialized.
+    """
+    # Cached by the client but revalidated by every request
+    headers = {ETAG_HEADER: etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get(IF_NONE_MATCH_HEADER), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
@@ -1,3 +1,6 @@
+import math
+from typing import Dict, Optional
+
 from fastapi import HTTPException, status
 
 from app.api.translations import TRANSLATIONS
@@ -6,12 +9,16 @@ from app.models import DEFAULT_LANGUAGE, Language
 
 class HTTPException(HTTPException):
     def __init__(
-        self, status_code: int, detail: str, locale: Language = DEFAULT_LANGUAGE
+        self,
+        status_code: int,
+        detail: str,
+        locale: Language = DEFAULT_LANGUAGE,
+        headers: Optional[Dict[str, str]] = None,
     ):
         translation_table: dict = TRANSLATIONS.get(locale, {})
         detail = translation_table.get(detail, detail)
 
-        super().__init__(status_code=status_code, detail=detail)
+        super().__init__(status_code=status_code, detail=detail, headers=headers)
 
 
 class HTTPNotEnoughPermissions(HTTPException):
@@ -23,6 +30,25 @@ class HTTPNotEnoughPermissions(HTTPException):
         )
 
 
+class HTTPTooManyRequests(HTTPException):
+    def __init__(self, retry_after: float, locale: Language = DEFAULT_LANGUAGE):
+        super().__init__(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many attempts, please retry later",
+            locale=locale,
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+
+class HTTPInvalidCursor(HTTPException):
+    def __init__(self, locale: Language = DEFAULT_LANGUAGE):
+        super().__init__(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid pagination cursor",
+            locale=locale,
+        )
+
+
 # TODO: Can be interesting to make this generic like cruds
 # Items
 class HTTPItemNotFound(HTTPException):
@@ -42,3 +68,22 @@ class HTTPUserNotFound(HTTPException):
             detail="User not found",
             locale=locale,
         )
+
+
+# User imports
+class HTTPImportNotFound(HTTPException):
+    def __init__(self, locale: Language = DEFAULT_LANGUAGE):
+        super().__init__(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Import not found",
+            locale=locale,
+        )
+
+
+class HTTPImportTooLarge(HTTPException):
+    def __init__(self, locale: Language = DEFAULT_LANGUAGE):
+        super().__init__(
+            status_code=status.HTTP_413_CONTENT_TOO_LARGE,
+            detail="The imported file is too large",
+            locale=locale,
+        )
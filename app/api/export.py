@@ -0,0 +1,115 @@
+import csv
+import io
+import json
+from datetime import date
+from enum import Enum
+from typing import Any, AsyncIterator, Sequence
+
+import anyio
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row
+from starlette.types import Receive, Scope, Send
+
+from app.core.config import settings
+from app.crud.base import CRUDBase
+from app.db.routing import choose_replica
+from app.db.session import AsyncSessionLocal, async_engine, replica_engines
+
+
+class ExportFormat(str, Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def export_value(value: Any) -> Any:
+    if isinstance(value, date):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    return str(value)
+
+
+def encode_ndjson(names: Sequence[str], rows: Sequence[Row]) -> bytes:
+    lines = (
+        json.dumps(dict(zip(names, map(export_value, row)))) + "\n" for row in rows
+    )
+    return "".join(lines).encode()
+
+
+def encode_csv(rows: Sequence[Sequence[Any]]) -> bytes:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([map(export_value, row) for row in rows])
+    return buffer.getvalue().encode()
+
+
+async def export_rows(
+    crud: CRUDBase, columns: Sequence[Any], format: ExportFormat, with_archived: bool
+) -> AsyncIterator[bytes]:
+    names = [column.key for column in columns]
+    # The session of the request is closed before the response is streamed
+    replica = await choose_replica(replica_engines, None)
+    db = AsyncSessionLocal(bind=replica or async_engine)
+    batches = crud.stream_async(
+        db, columns, with_archived=with_archived, batch_size=settings.EXPORT_BATCH_SIZE
+    )
+    try:
+        if format == ExportFormat.CSV:
+            yield encode_csv([names])
+        while True:
+            # A fetch cancelled halfway leaves the connection unusable, the
+            # cancellation of a disconnect is delivered between two batches
+            with anyio.CancelScope(shield=True):
+                rows = await anext(batches, None)
+            if rows is None:
+                break
+            await anyio.lowlevel.checkpoint()
+            if format == ExportFormat.CSV:
+                yield encode_csv(rows)
+            else:
+                yield encode_ndjson(names, rows)
+    finally:
+        with anyio.CancelScope(shield=True):
+            await batches.aclose()
+            await db.close()
+
+
+class ExportResponse(StreamingResponse):
+    """
+    Closes its body iterator as soon as the response ends, also when the client
+    disconnected, which Starlette leaves to the garbage collector.
+    """
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()  # type: ignore
+
+
+def export_response(
+    crud: CRUDBase,
+    columns: Sequence[Any],
+    *,
+    format: ExportFormat,
+    name: str,
+    with_archived: bool = False,
+) -> StreamingResponse:
+    """
+    Stream the rows of `columns` encoded batch by batch, only one batch is held
+    in memory. The server-side cursor and its connection are released as soon
+    as the client disconnects.
+    """
+    return ExportResponse(
+        export_rows(crud, columns, format, with_archived),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{name}.{format.value}"'
+        },
+    )
@@ -0,0 +1,207 @@
+import csv
+import io
+import json
+import logging
+import tempfile
+from datetime import UTC, datetime
+from itertools import islice
+from typing import IO, Any, Dict, Iterator, List, Set, Tuple, Union
+from uuid import UUID
+
+import anyio
+from fastapi import Request
+from pydantic import ValidationError
+
+from app import crud, schemas
+from app.api.export import ExportFormat
+from app.core.config import settings
+from app.core.security import PasswordHashingBusyError
+from app.db.session import AsyncSessionLocal
+from app.email_service.auth import send_new_account_emails
+from app.models import ImportStatus, Provider, Role
+
+logger = logging.getLogger(__name__)
+
+# Uploaded files are kept in memory up to this size, then written to disk
+SPOOL_MAX_SIZE = 1024 * 1024
+# Wait before retrying a batch when the processes hashing the passwords are busy
+# with the batches of another import, the users of the batch fail after the
+# last attempt
+HASHING_RETRY_DELAY = 1.0
+HASHING_MAX_ATTEMPTS = 60
+
+# A record of the file and its line, or the reason it couldn't be read
+Record = Tuple[int, Union[Dict[str, Any], str]]
+
+
+class ImportTooLargeError(Exception):
+    pass
+
+
+async def spool_body(request: Request) -> IO[bytes]:
+    """
+    Copy the streamed body of the request into a temporary file, rejected as
+    soon as it exceeds `MAX_IMPORT_BYTES`.
+    """
+    if int(request.headers.get("content-length", 0)) > settings.MAX_IMPORT_BYTES:
+        raise ImportTooLargeError()
+    file = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+    size = 0
+    try:
+        async for chunk in request.stream():
+            size += len(chunk)
+            if size > settings.MAX_IMPORT_BYTES:
+                raise ImportTooLargeError()
+            # Large chunks spill to the disk
+            await anyio.to_thread.run_sync(file.write, chunk)
+    except BaseException:
+        file.close()
+        raise
+    file.seek(0)
+    return file
+
+
+def read_records(file: IO[bytes], format: ExportFormat) -> Iterator[Record]:
+    text = io.TextIOWrapper(file, encoding="utf-8-sig", newline="")
+    if format == ExportFormat.CSV:
+        reader = csv.DictReader(text)
+        for record in reader:
+            # Empty fields take the defaults of the schema
+            values = {k: v for k, v in record.items() if k is not None and v != ""}
+            yield reader.line_num, values
+        return
+    for line_number, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, "Invalid JSON"
+
+
+def validation_detail(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, e['loc'])) or 'row'}: {e['msg']}"
+        for e in error.errors(include_url=False)
+    )
+
+
+def validate_record(values: Union[Dict[str, Any], str]) -> schemas.UserCreate:
+    if isinstance(values, str):
+        raise ValueError(values)
+    try:
+        user_in = schemas.UserCreate.model_validate(values)
+    except ValidationError as e:
+        raise ValueError(validation_detail(e)) from e
+    if user_in.provider == Provider.EMAIL and not user_in.password:
+        raise ValueError("Missing password for an email user")
+    if user_in.provider != Provider.EMAIL and not user_in.sso_provider_id:
+        raise ValueError("Missing sso_provider_id for an SSO user")
+    return user_in
+
+
+def parse_batch(
+    records: Iterator[Record], emails: Set[str]
+) -> Tuple[int, List[Tuple[int, schemas.UserCreate]], List[schemas.ImportFailure]]:
+    """
+    Read and validate the next `IMPORT_BATCH_SIZE` records of the file. `emails`
+    holds the emails read so far, a repeated email is a failure.
+
+    Returns the number of records read, the valid users with their line and the
+    failures.
+    """
+    batch = list(islice(records, settings.IMPORT_BATCH_SIZE))
+    users = []
+    failures = []
+    for line, values in batch:
+        try:
+            user_in = validate_record(values)
+            if user_in.email in emails:
+                raise ValueError("Duplicate email in the file")
+        except ValueError as e:
+            failures.append(schemas.ImportFailure(line=line, detail=str(e)))
+            continue
+        emails.add(user_in.email)
+        users.append((line, user_in))
+    return len(batch), users, failures
+
+
+async def import_batch(
+    db: Any, users: List[Tuple[int, schemas.UserCreate]], role: Role
+) -> List[schemas.ImportFailure]:
+    objs_in = [user_in for _, user_in in users]
+    for attempt in range(1, HASHING_MAX_ATTEMPTS + 1):
+        try:
+            created = await crud.user.import_multi_async(db, objs_in=objs_in, role=role)
+            break
+        except PasswordHashingBusyError:
+            await db.rollback()
+            if attempt < HASHING_MAX_ATTEMPTS:
+                await anyio.sleep(HASHING_RETRY_DELAY)
+    else:
+        detail = (
+            f"The passwords couldn't be hashed, the server was busy after "
+            f"{HASHING_MAX_ATTEMPTS} attempts"
+        )
+        return [schemas.ImportFailure(line=line, detail=detail) for line, _ in users]
+    created_emails = {row.email for row in created}
+    return [
+        schemas.ImportFailure(
+            line=line,
+            detail="The user with this username already exists in the system.",
+        )
+        for line, user_in in users
+        if user_in.email not in created_emails
+    ]
+
+
+async def run_user_import(
+    import_id: UUID, file: IO[bytes], format: ExportFormat, role: Role
+) -> None:
+    """
+    Import the users of `file` batch by batch, the progress of the import is
+    saved after each batch. The new account emails are sent once all the users
+    are imported.
+    """
+    progress = schemas.UserImportUpdate(
+        status=ImportStatus.RUNNING, rows_read=0, rows_imported=0, rows_failed=0
+    )
+    imported: List[str] = []
+    async with AsyncSessionLocal() as db:
+        try:
+            await crud.user_import.update_by_id_async(
+                db, id=import_id, obj_in=progress.model_dump()
+            )
+            records = read_records(file, format)
+            emails: Set[str] = set()
+            while True:
+                read, users, failures = await anyio.to_thread.run_sync(
+                    parse_batch, records, emails
+                )
+                if not read:
+                    break
+                if users:
+                    failures += await import_batch(db, users, role)
+                failed = {failure.line for failure in failures}
+                imported += [u.email for line, u in users if line not in failed]
+                progress.rows_read += read
+                progress.rows_imported = len(imported)
+                progress.rows_failed += len(failures)
+                room = settings.MAX_IMPORT_FAILURES - len(progress.failures)
+                progress.failures += sorted(failures, key=lambda f: f.line)[:room]
+                await crud.user_import.update_by_id_async(
+                    db, id=import_id, obj_in=progress.model_dump()
+                )
+            progress.status = ImportStatus.DONE
+        except Exception as e:
+            logger.exception(f"User import {import_id} failed")
+            await db.rollback()
+            progress.status = ImportStatus.FAILED
+            progress.error = str(e) or type(e).__name__
+        finally:
+            file.close()
+        progress.finished_at = datetime.now(UTC)
+        await crud.user_import.update_by_id_async(
+            db, id=import_id, obj_in=progress.model_dump()
+        )
+    await anyio.to_thread.run_sync(send_new_account_emails, imported)
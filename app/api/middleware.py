@@ -0,0 +1,29 @@
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.db.routing import CONSISTENCY_TOKEN_HEADER
+
+
+class ConsistencyTokenMiddleware:
+    """
+    Sends the WAL position of the writes done by the request in the
+    `X-Consistency-Token` header, for the client to send it back with its next
+    requests.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        async def send_with_token(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                token = scope.get("state", {}).get("consistency_token")
+                if token:
+                    MutableHeaders(scope=message)[CONSISTENCY_TOKEN_HEADER] = token
+            await send(message)
+
+        await self.app(scope, receive, send_with_token)
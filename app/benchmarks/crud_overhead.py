@@ -0,0 +1,179 @@
+"""
+CRUD per-call overhead microbenchmark.
+
+Measures the time of each CRUD read on the synchronous stack, implemented with
+the legacy `Query` API and with the current `select()`, lambda statements and
+`Session.get`, and the time the same SQL takes when sent straight through the
+DBAPI cursor. The difference with the raw cursor is the Python overhead added by
+SQLAlchemy to each call.
+
+    python -m app.benchmarks.crud_overhead --iterations 2000
+"""
+
+import argparse
+import json
+import secrets
+import timeit
+from typing import Any, Callable, Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import false
+
+from app import crud, models, schemas
+from app.benchmarks.utils import create_benchmark_user, random_email
+from app.db.session import SessionLocal, engine
+
+User = models.User
+Item = models.Item
+
+
+def legacy_get(db: Session, id: Any) -> Any:
+    return db.query(User).filter(User.id == id).filter(User.archived == false()).first()
+
+
+def legacy_get_by_email(db: Session, email: str) -> Any:
+    return (
+        db.query(User).filter(User.email == email).filter(User.archived == false())
+    ).first()
+
+
+def legacy_get_by_sso_provider_id(db: Session, sso_provider_id: str) -> Any:
+    return (
+        db.query(User)
+        .filter(User.sso_provider_id == sso_provider_id)
+        .filter(User.provider == models.Provider.GOOGLE)
+        .filter(User.archived == false())
+    ).first()
+
+
+def legacy_get_multi(db: Session) -> Any:
+    return db.query(User).filter(User.archived == false()).offset(0).limit(100).all()
+
+
+def legacy_get_multi_by_user(db: Session, user: Any) -> Any:
+    return db.query(Item).filter(Item.user_id == user.id).offset(0).limit(100).all()
+
+
+def captured_statements(db: Session, call: Callable[[], Any]) -> List[Tuple]:
+    statements: List[Tuple] = []
+
+    def capture(conn: Any, cursor: Any, statement: str, parameters: Any, *_) -> None:
+        statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        call()
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    return statements
+
+
+def per_call_us(call: Callable[[], Any], iterations: int) -> float:
+    call()
+    return round(timeit.timeit(call, number=iterations) / iterations * 1_000_000, 2)
+
+
+def run(
+    db: Session,
+    legacy: Callable[[], Any],
+    current: Callable[[], Any],
+    iterations: int,
+) -> Dict[str, float]:
+    cursor = db.connection().connection.cursor()
+    statements = captured_statements(db, current)
+
+    def raw() -> None:
+        for statement, parameters in statements:
+            cursor.execute(statement, parameters)
+            cursor.fetchall()
+
+    results = {
+        "legacy_us": per_call_us(legacy, iterations),
+        "current_us": per_call_us(current, iterations),
+        "raw_cursor_us": per_call_us(raw, iterations),
+    }
+    results["legacy_overhead_us"] = round(
+        results["legacy_us"] - results["raw_cursor_us"], 2
+    )
+    results["current_overhead_us"] = round(
+        results["current_us"] - results["raw_cursor_us"], 2
+    )
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--iterations", type=int, default=2000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    sso_user = crud.user.create(
+        db,
+        obj_in=schemas.UserCreate(
+            email=random_email(),
+            provider=models.Provider.GOOGLE,
+            sso_provider_id=secrets.token_hex(8),
+        ),
+    )
+    for _ in range(20):
+        crud.item.create_with_user(
+            db, obj_in=schemas.ItemCreate(name="benchmark"), user=user
+        )
+    # Plain values, the objects are detached by the calls emptying the session
+    principal = schemas.Principal.model_validate(user)
+    email, sso_provider_id = user.email, sso_user.sso_provider_id
+    user_ids = [user.id, sso_user.id]
+
+    def cold(call: Callable[[], Any]) -> Callable[[], Any]:
+        # Empty the identity map so every call has to load the row
+        def wrapped() -> Any:
+            db.expunge_all()
+            return call()
+
+        return wrapped
+
+    cases = {
+        "get": (
+            lambda: legacy_get(db, principal.id),
+            lambda: crud.user.get(db, id=principal.id),
+        ),
+        "get_not_in_identity_map": (
+            cold(lambda: legacy_get(db, principal.id)),
+            cold(lambda: crud.user.get(db, id=principal.id)),
+        ),
+        "get_by_email": (
+            lambda: legacy_get_by_email(db, email),
+            lambda: crud.user.get_by_email(db, email=email),
+        ),
+        "get_by_sso_provider_id": (
+            lambda: legacy_get_by_sso_provider_id(db, sso_provider_id),
+            lambda: crud.user.get_by_sso_provider_id(
+                db,
+                sso_provider_id=sso_provider_id,
+                provider=models.Provider.GOOGLE,
+            ),
+        ),
+        "get_multi": (
+            lambda: legacy_get_multi(db),
+            lambda: crud.user.get_multi(db),
+        ),
+        "get_multi_by_user": (
+            lambda: legacy_get_multi_by_user(db, principal),
+            lambda: crud.item.get_multi_by_user(db, user=principal),
+        ),
+    }
+    results = {
+        name: run(db, legacy, current, args.iterations)
+        for name, (legacy, current) in cases.items()
+    }
+
+    db.rollback()
+    for id in user_ids:
+        crud.user.remove(db, crud.user.get(db, id=id))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
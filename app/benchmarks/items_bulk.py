@@ -0,0 +1,94 @@
+"""
+Bulk items creation benchmark.
+
+Creates the same number of items through `POST /items/` one item per request,
+then through `POST /items/bulk` with batches of 1, 100 and 10,000 items, and
+reports the items created per second.
+
+    python -m app.benchmarks.items_bulk --items 10000 --concurrency 16
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+import httpx
+from sqlalchemy import delete
+
+from app import crud, models
+from app.benchmarks.utils import auth_headers, create_benchmark_user, summarize
+from app.core.config import settings
+from app.db.session import SessionLocal, async_engine
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+ITEMS_URL = f"{settings.API_V1_STR}/items/"
+BULK_URL = f"{settings.API_V1_STR}/items/bulk"
+
+
+async def run_scenario(
+    headers: Dict[str, str], items: int, batch_size: int, concurrency: int
+) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers, timeout=None
+    ) as c:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async def send(size: int) -> None:
+            async with semaphore:
+                start = time.perf_counter()
+                if batch_size:
+                    body = {"items": [{"name": "benchmark"}] * size}
+                    r = await c.post(BULK_URL, json=body)
+                else:
+                    r = await c.post(ITEMS_URL, json={"name": "benchmark"})
+                latencies.append(time.perf_counter() - start)
+                r.raise_for_status()
+
+        sizes = [batch_size or 1] * (items // (batch_size or 1))
+        start = time.perf_counter()
+        await asyncio.gather(*(send(size) for size in sizes))
+        elapsed = time.perf_counter() - start
+    await async_engine.dispose()
+
+    return {
+        "items_per_sec": round(sum(sizes) / elapsed, 2),
+        "request_latency": summarize(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    headers = auth_headers(user)
+
+    results = {}
+    # A batch size of 0 stands for the item by item endpoint
+    for batch_size in (0, 1, 100, 10_000):
+        name = f"bulk_{batch_size}" if batch_size else "single"
+        logger.info(f"Running {name} scenario")
+        results[name] = asyncio.run(
+            run_scenario(headers, args.items, batch_size, args.concurrency)
+        )
+        db.execute(delete(models.Item).where(models.Item.user_id == user.id))
+        db.commit()
+
+    crud.user.remove(db, user)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""
+Items CRUD throughput benchmark.
+
+Runs concurrent create, read, update, list and delete cycles on `/items` and
+reports the operations/sec and the latency of each call, first against
+synchronous routes backed by the psycopg2 engine (run in the Starlette
+threadpool) and then against the async routes backed by the asyncpg engine.
+
+    python -m app.benchmarks.items_crud --cycles 500 --concurrency 128
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List
+from uuid import UUID
+
+import httpx
+from fastapi import APIRouter, Depends
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session
+
+from app import crud, schemas
+from app.api import deps
+from app.benchmarks.utils import (
+    auth_headers,
+    create_benchmark_user,
+    get_sync_db,
+    summarize,
+)
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+ITEMS_URL = f"{settings.API_V1_STR}/items"
+SYNC_ITEMS_URL = f"{settings.API_V1_STR}/benchmark/sync-items"
+
+# Reproduces the synchronous routes of the items on the synchronous stack
+sync_router = APIRouter()
+
+
+@sync_router.get("/", response_model=List[schemas.Item])
+def read_items(
+    db: Session = Depends(get_sync_db),
+    principal: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    return crud.item.get_multi_by_user(db, user=principal)
+
+
+@sync_router.post("/", response_model=schemas.Item)
+def create_item(
+    item_in: schemas.ItemCreate,
+    db: Session = Depends(get_sync_db),
+    principal: schemas.Principal = Depends(deps.get_current_principal),
+) -> Any:
+    return crud.item.create_with_user(db, obj_in=item_in, user=principal)
+
+
+@sync_router.get("/{id}", response_model=schemas.Item)
+def read_item(id: UUID, db: Session = Depends(get_sync_db)) -> Any:
+    return crud.item.get(db, id=id)
+
+
+@sync_router.put("/{id}", response_model=schemas.Item)
+def update_item(
+    id: UUID, item_in: schemas.ItemUpdate, db: Session = Depends(get_sync_db)
+) -> Any:
+    item = crud.item.get(db, id=id)
+    return crud.item.update(db, db_obj=item, obj_in=item_in)
+
+
+@sync_router.delete("/{id}", response_model=schemas.Item)
+def delete_item(id: UUID, db: Session = Depends(get_sync_db)) -> Any:
+    item = crud.item.get(db, id=id)
+    return crud.item.remove(db, item)
+
+
+app.include_router(sync_router, prefix=SYNC_ITEMS_URL, include_in_schema=False)
+
+
+async def run_scenario(
+    url: str,
+    headers: Dict[str, str],
+    async_engine: AsyncEngine,
+    cycles: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers
+    ) as c:
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies: List[float] = []
+
+        async def call(method: str, path: str, **kwargs: Any) -> httpx.Response:
+            start = time.perf_counter()
+            r = await c.request(method, f"{url}{path}", **kwargs)
+            latencies.append(time.perf_counter() - start)
+            r.raise_for_status()
+            return r
+
+        async def cycle() -> None:
+            async with semaphore:
+                item = (await call("POST", "/", json={"name": "benchmark"})).json()
+                await call("GET", f"/{item['id']}")
+                await call("PUT", f"/{item['id']}", json={"description": "updated"})
+                await call("GET", "/")
+                await call("DELETE", f"/{item['id']}")
+
+        start = time.perf_counter()
+        await asyncio.gather(*(cycle() for _ in range(cycles)))
+        elapsed = time.perf_counter() - start
+    # Pooled asyncpg connections can't be reused by the next event loop
+    await async_engine.dispose()
+
+    return {
+        "operations_per_sec": round(len(latencies) / elapsed, 2),
+        "latency": summarize(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cycles", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=128)
+    # The synchronous sessions are closed by the threadpool running the routes, a
+    # pool smaller than its 40 threads deadlocks under high concurrency
+    parser.add_argument("--pool-size", type=int, default=40)
+    args = parser.parse_args()
+
+    pool = {"pool_size": args.pool_size, "max_overflow": 0}
+    SessionLocal.configure(bind=create_engine(settings.SQLALCHEMY_DATABASE_URI, **pool))
+    async_engine = create_async_engine(settings.SQLALCHEMY_ASYNC_DATABASE_URI, **pool)
+    AsyncSessionLocal.configure(bind=async_engine)
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    headers = auth_headers(user)
+
+    results = {}
+    for name, url in (("sync", SYNC_ITEMS_URL), ("async", ITEMS_URL)):
+        logger.info(f"Running {name} scenario against {url}")
+        results[name] = asyncio.run(
+            run_scenario(url, headers, async_engine, args.cycles, args.concurrency)
+        )
+    crud.user.remove(db, user)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
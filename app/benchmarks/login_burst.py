@@ -0,0 +1,128 @@
+"""
+Login burst benchmark.
+
+Fires concurrent logins while a concurrent `GET /items/` workload is running and
+reports the logins/sec and the latency of the `/items/` requests, first with the
+legacy synchronous login (scrypt computed in the Starlette threadpool) and then
+with the async login backed by the password hashing process pool.
+
+    python -m app.benchmarks.login_burst --logins 200 --concurrency 32
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+import httpx
+from fastapi import Depends
+from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.api.exceptions import HTTPException
+from app.benchmarks.utils import (
+    auth_headers,
+    create_benchmark_user,
+    get_sync_db,
+    summarize,
+    timed,
+)
+from app.core.config import settings
+from app.core.security import password_hasher
+from app.db.session import SessionLocal, async_engine
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+LOGIN_URL = f"{settings.API_V1_STR}/auth/login/access-token"
+INLINE_LOGIN_URL = f"{settings.API_V1_STR}/benchmark/inline-login"
+ITEMS_URL = f"{settings.API_V1_STR}/items/"
+
+
+@app.post(INLINE_LOGIN_URL, include_in_schema=False)
+def inline_login(
+    db: Session = Depends(get_sync_db),
+    form_data: OAuth2PasswordRequestForm = Depends(),
+) -> Any:
+    # Reproduces the synchronous login route hashing inline in the threadpool
+    user = crud.user.authenticate(
+        db, email=form_data.username, password=form_data.password
+    )
+    if not user:
+        raise HTTPException(status_code=401, detail="Incorrect email or password")
+    return {"id": str(user.id)}
+
+
+async def run_scenario(
+    login_url: str,
+    email: str,
+    password: str,
+    headers: Dict[str, str],
+    logins: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as c:
+        semaphore = asyncio.Semaphore(concurrency)
+        done = asyncio.Event()
+        items_latencies: List[float] = []
+
+        async def login() -> None:
+            async with semaphore:
+                r = await c.post(
+                    login_url, data={"username": email, "password": password}
+                )
+                r.raise_for_status()
+
+        async def poll_items() -> None:
+            while not done.is_set():
+                items_latencies.append(
+                    await timed(lambda: c.get(ITEMS_URL, headers=headers))
+                )
+
+        pollers = [asyncio.create_task(poll_items()) for _ in range(4)]
+        start = time.perf_counter()
+        await asyncio.gather(*(login() for _ in range(logins)))
+        elapsed = time.perf_counter() - start
+        done.set()
+        await asyncio.gather(*pollers)
+    # Pooled asyncpg connections can't be reused by the next event loop
+    await async_engine.dispose()
+
+    return {
+        "logins_per_sec": round(logins / elapsed, 2),
+        "items": summarize(items_latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    password = "benchmark-password"
+    db = SessionLocal()
+    user = create_benchmark_user(db, password=password)
+    headers = auth_headers(user)
+
+    results = {}
+    for name, url in (("before", INLINE_LOGIN_URL), ("after", LOGIN_URL)):
+        logger.info(f"Running {name} scenario against {url}")
+        results[name] = asyncio.run(
+            run_scenario(
+                url, user.email, password, headers, args.logins, args.concurrency
+            )
+        )
+    password_hasher.shutdown()
+    crud.user.remove(db, user)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
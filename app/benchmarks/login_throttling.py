@@ -0,0 +1,112 @@
+"""
+Credential stuffing load test.
+
+Replays failed logins against an existing account from a handful of client IPs
+and reports the CPU time spent by the worker and its hashing processes, with the
+login throttling disabled and enabled.
+
+    python -m app.benchmarks.login_throttling --attempts 500 --ips 5
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import resource
+import secrets
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict
+
+import httpx
+
+from app import crud
+from app.api import deps
+from app.benchmarks.utils import create_benchmark_user
+from app.core.config import settings
+from app.core.security import password_hasher
+from app.core.throttling import LoginThrottle
+from app.db.session import SessionLocal, async_engine
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+LOGIN_URL = f"{settings.API_V1_STR}/auth/login/access-token"
+
+
+def cpu_seconds() -> float:
+    usages = (
+        resource.getrusage(resource.RUSAGE_SELF),
+        resource.getrusage(resource.RUSAGE_CHILDREN),
+    )
+    return sum(usage.ru_utime + usage.ru_stime for usage in usages)
+
+
+async def stuff_credentials(
+    email: str, attempts: int, ips: int, concurrency: int
+) -> Counter:
+    clients = [
+        httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app, client=(f"10.0.0.{i}", 1234)),
+            base_url="http://bench",
+        )
+        for i in range(ips)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+    statuses: Counter = Counter()
+
+    async def attempt(index: int) -> None:
+        async with semaphore:
+            r = await clients[index % ips].post(
+                LOGIN_URL, data={"username": email, "password": secrets.token_hex(8)}
+            )
+            statuses[r.status_code] += 1
+
+    await asyncio.gather(*(attempt(i) for i in range(attempts)))
+    for client in clients:
+        await client.aclose()
+    # Pooled asyncpg connections can't be reused by the next event loop
+    await async_engine.dispose()
+    return statuses
+
+
+def run(email: str, attempts: int, ips: int, concurrency: int) -> Dict[str, Any]:
+    cpu_start, wall_start = cpu_seconds(), time.perf_counter()
+    statuses = asyncio.run(stuff_credentials(email, attempts, ips, concurrency))
+    # Hashing processes are only accounted for once they are reaped
+    password_hasher.shutdown()
+    cpu = cpu_seconds() - cpu_start
+    return {
+        "statuses": dict(statuses),
+        "cpu_seconds": round(cpu, 3),
+        "cpu_ms_per_attempt": round(cpu / attempts * 1000, 3),
+        "wall_seconds": round(time.perf_counter() - wall_start, 3),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--attempts", type=int, default=500)
+    parser.add_argument("--ips", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        deps.login_throttle = LoginThrottle(directory, slots=1024)
+        for name, enabled in (("throttle_off", False), ("throttle_on", True)):
+            logger.info(f"Running {name} scenario")
+            settings.LOGIN_THROTTLE_ENABLED = enabled
+            results[name] = run(user.email, args.attempts, args.ips, args.concurrency)
+        results["metrics"] = deps.login_throttle.stats()
+    crud.user.remove(db, user)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Ownership checked writes benchmark.
+
+Sends `PUT /items/{id}` and `DELETE /items/{id}` requests on items of the
+authenticated user, and reports their latency and the round trips (COMMIT
+included) sent per request.
+
+    python -m app.benchmarks.ownership --requests 1000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+import httpx
+from sqlalchemy import event
+
+from app import crud, schemas
+from app.benchmarks.utils import auth_headers, create_benchmark_user, summarize
+from app.core.config import settings
+from app.db.session import SessionLocal, async_engine
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+class RoundTripCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args: Any) -> None:
+        self.count += 1
+
+
+async def run_scenario(
+    headers: Dict[str, str], method: str, urls: List[str]
+) -> Dict[str, Any]:
+    counter = RoundTripCounter()
+    sync_engine = async_engine.sync_engine
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers
+    ) as c:
+        # Warm up the caches of the tokens, the principals and the statements
+        (await c.get(f"{settings.API_V1_STR}/users/me")).raise_for_status()
+        latencies: List[float] = []
+        event.listen(sync_engine, "before_cursor_execute", counter)
+        event.listen(sync_engine, "commit", counter)
+        try:
+            for i, url in enumerate(urls):
+                start = time.perf_counter()
+                r = await c.request(method, url, json={"name": f"benchmark-{i}"})
+                latencies.append(time.perf_counter() - start)
+                r.raise_for_status()
+        finally:
+            event.remove(sync_engine, "before_cursor_execute", counter)
+            event.remove(sync_engine, "commit", counter)
+    await async_engine.dispose()
+    return {
+        "round_trips_per_request": round(counter.count / len(urls), 2),
+        "latency": summarize(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    items = crud.item.create_multi_with_user(
+        db,
+        objs_in=[schemas.ItemCreate(name="benchmark") for _ in range(args.requests)],
+        user=user,
+    )
+    headers = auth_headers(user)
+    urls = [f"{settings.API_V1_STR}/items/{item.id}" for item in items]
+
+    results = {}
+    # Every item is updated once and then deleted
+    for name, method in (("update", "PUT"), ("delete", "DELETE")):
+        logger.info(f"Running {name} scenario")
+        results[name] = asyncio.run(run_scenario(headers, method, urls))
+
+    db.rollback()
+    crud.user.remove(db, crud.user.get(db, id=user.id))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Pagination benchmark.
+
+Seeds the items of a user and measures the latency of reading the first page and
+a deep page of them, with OFFSET pagination and with keyset pagination on
+`(created_at, id)`.
+
+    python -m app.benchmarks.pagination --page-size 20 --deep-page 10000
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import text
+
+from app import crud, schemas
+from app.benchmarks.utils import create_benchmark_user, summarize
+from app.core.config import settings
+from app.db.session import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def seed_items(db: Any, user_id: Any, count: int) -> None:
+    # Distinct creation dates, as rows created by separate transactions
+    db.execute(
+        text(
+            "INSERT INTO item (id, name, user_id, created_at) "
+            "SELECT gen_random_uuid(), 'benchmark', :user_id, "
+            "now() + n * interval '1 millisecond' "
+            "FROM generate_series(1, :count) AS n"
+        ),
+        {"user_id": user_id, "count": count},
+    )
+    db.commit()
+    db.execute(text("ANALYZE item"))
+
+
+def run(call: Callable[[], List], repeat: int) -> Dict[str, float]:
+    call()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--deep-page", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+    settings.MAX_PAGE_SIZE = args.page_size
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    principal = schemas.Principal.model_validate(user)
+    count = args.page_size * args.deep_page
+    logger.info(f"Seeding {count} items")
+    seed_items(db, principal.id, count)
+
+    deep_skip = args.page_size * (args.deep_page - 1)
+    # Cursor of the last row of the page preceding the deep page
+    _, deep_cursor = crud.item.get_page_by_user(
+        db, user=principal, skip=deep_skip - args.page_size, limit=args.page_size
+    )
+
+    def page(**kwargs: Any) -> Callable[[], List]:
+        def call() -> List:
+            db.expunge_all()
+            rows, _ = crud.item.get_page_by_user(
+                db, user=principal, limit=args.page_size, **kwargs
+            )
+            return rows
+
+        return call
+
+    offset_page, keyset_page = page(skip=deep_skip), page(cursor=deep_cursor)
+    assert [i.id for i in offset_page()] == [i.id for i in keyset_page()]
+    results = {
+        "page_1": run(page(), args.repeat),
+        f"offset_page_{args.deep_page}": run(offset_page, args.repeat),
+        f"keyset_page_{args.deep_page}": run(keyset_page, args.repeat),
+    }
+
+    db.rollback()
+    db.execute(text("DELETE FROM item WHERE user_id = :id"), {"id": principal.id})
+    db.commit()
+    crud.user.remove(db, crud.user.get(db, id=principal.id))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Conditional GET benchmark.
+
+Replays a client polling a page of its items and one of them, which changes
+every `--update-every` polls, once sending the last received `ETag` in the
+`If-None-Match` header and once without it. Reports the latency and the bytes
+of the response bodies per request.
+
+    python -m app.benchmarks.polling --polls 1000 --items 100 --update-every 20
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Dict, List
+
+import httpx
+
+from app import crud, schemas
+from app.benchmarks.utils import auth_headers, create_benchmark_user, summarize
+from app.core.config import settings
+from app.core.etag import ETAG_HEADER, IF_NONE_MATCH_HEADER
+from app.db.session import SessionLocal, async_engine
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+async def run_scenario(
+    headers: Dict[str, str],
+    urls: List[str],
+    item_url: str,
+    polls: int,
+    update_every: int,
+    conditional: bool,
+) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    etags: Dict[str, str] = {}
+    latencies: List[float] = []
+    body_bytes = not_modified = 0
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers
+    ) as c:
+        for i in range(polls):
+            if i % update_every == 0:
+                r = await c.put(item_url, json={"name": f"benchmark-{i}"})
+                r.raise_for_status()
+            for url in urls:
+                request_headers = {}
+                if conditional and url in etags:
+                    request_headers[IF_NONE_MATCH_HEADER] = etags[url]
+                start = time.perf_counter()
+                r = await c.get(url, headers=request_headers)
+                latencies.append(time.perf_counter() - start)
+                if r.status_code == 304:
+                    not_modified += 1
+                else:
+                    r.raise_for_status()
+                etags[url] = r.headers[ETAG_HEADER]
+                body_bytes += len(r.content)
+    await async_engine.dispose()
+    return {
+        "not_modified_ratio": round(not_modified / len(latencies), 3),
+        "body_bytes_per_request": round(body_bytes / len(latencies), 1),
+        "latency": summarize(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--polls", type=int, default=1000)
+    parser.add_argument("--items", type=int, default=100)
+    parser.add_argument("--update-every", type=int, default=20)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    items = crud.item.create_multi_with_user(
+        db,
+        objs_in=[
+            schemas.ItemCreate(name="benchmark", description="benchmark " * 10)
+            for _ in range(args.items)
+        ],
+        user=user,
+    )
+    headers = auth_headers(user)
+    item_url = f"{settings.API_V1_STR}/items/{items[0].id}"
+    urls = [f"{settings.API_V1_STR}/items/?limit={args.items}", item_url]
+
+    results = {}
+    for name, conditional in (("unconditional", False), ("conditional", True)):
+        logger.info(f"Running {name} scenario")
+        results[name] = asyncio.run(
+            run_scenario(
+                headers, urls, item_url, args.polls, args.update_every, conditional
+            )
+        )
+
+    db.rollback()
+    crud.user.remove(db, crud.user.get(db, id=user.id))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
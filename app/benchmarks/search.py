@@ -0,0 +1,170 @@
+"""
+Full-text search benchmark.
+
+Seeds `--items` items spread over `--users` users, with names and descriptions
+drawn from a vocabulary with a skewed word frequency, and measures the latency
+of the first and the next page of searches for a rare, a medium and a common
+word, over all the items (admin users) and over the items of a user.
+
+    python -m app.benchmarks.search --items 10000000 --users 10000
+
+The seeded rows are kept by `--keep` and reused by the next runs.
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import text
+
+from app import crud, models
+from app.benchmarks.utils import summarize
+from app.db.session import SessionLocal, engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMAIL_PATTERN = "search-benchmark-%@example.com"
+VOCABULARY_SIZE = 20_000
+# Index of the searched words in the vocabulary, the first words are the most
+# frequent ones
+WORDS = {"rare": 15_000, "medium": 500, "common": 5}
+
+
+def word(index: int) -> str:
+    # Same words as the vocabulary built by the seeding query
+    return f"w{index}x"
+
+
+def seed(db: Any, items: int, users: int, batch_size: int) -> None:
+    db.execute(
+        text(
+            "INSERT INTO person (id, email, role, language, provider, created_at) "
+            "SELECT gen_random_uuid(), 'search-benchmark-' || n || '@example.com', "
+            "'customer', 'en', 'email', now() FROM generate_series(1, :users) AS n"
+        ),
+        {"users": users},
+    )
+    db.commit()
+    for start in range(0, items, batch_size):
+        # The power of random() skews the frequency towards the first words,
+        # the subqueries reference n to be evaluated for every row
+        db.execute(
+            text(
+                "WITH owners AS (SELECT array_agg(id) AS ids FROM person "
+                "WHERE email LIKE :pattern) "
+                "INSERT INTO item (id, name, description, user_id, created_at) "
+                "SELECT gen_random_uuid(), "
+                "(SELECT string_agg('w' || floor(power(random(), 3) * :size)::int "
+                "|| 'x', ' ') FROM generate_series(1, 3) WHERE n > 0), "
+                "(SELECT string_agg('w' || floor(power(random(), 3) * :size)::int "
+                "|| 'x', ' ') FROM generate_series(1, 12) WHERE n > 0), "
+                "ids[1 + n % cardinality(ids)], "
+                "now() - n * interval '1 millisecond' "
+                "FROM owners, generate_series(:start, :stop) AS n"
+            ),
+            {
+                "pattern": EMAIL_PATTERN,
+                "size": VOCABULARY_SIZE,
+                "start": start + 1,
+                "stop": min(start + batch_size, items),
+            },
+        )
+        db.commit()
+        logger.info(f"Seeded {min(start + batch_size, items)} items")
+    db.execution_options(isolation_level="AUTOCOMMIT").execute(
+        text("VACUUM ANALYZE item")
+    )
+
+
+def run(call: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    call()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--items", type=int, default=10_000_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--batch-size", type=int, default=500_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    seeded = db.scalar(
+        text(
+            "SELECT count(*) FROM item JOIN person ON person.id = item.user_id "
+            "WHERE person.email LIKE :pattern"
+        ),
+        {"pattern": EMAIL_PATTERN},
+    )
+    if not seeded:
+        logger.info(f"Seeding {args.items} items")
+        with engine.connect() as connection:
+            seed(connection, args.items, args.users, args.batch_size)
+    user = crud.user.get_by_email(db, email="search-benchmark-1@example.com")
+
+    results: Dict[str, Any] = {}
+    for frequency, index in WORDS.items():
+        query = word(index)
+        for scope, owner in (("all", None), ("user", user)):
+            matches = db.scalar(
+                text(
+                    "SELECT count(*) FROM item WHERE archived_at IS NULL "
+                    "AND search_vector @@ websearch_to_tsquery('english', :query) "
+                    "AND (CAST(:user_id AS uuid) IS NULL OR user_id = :user_id)"
+                ),
+                {"query": query, "user_id": owner and owner.id},
+            )
+
+            def search(cursor: Any = None) -> List:
+                db.expunge_all()
+                return crud.item.search(
+                    db,
+                    text=query,
+                    language=models.Language.EN,
+                    user=owner,
+                    cursor=cursor,
+                    limit=args.page_size,
+                )
+
+            _, cursor = search()
+            results[f"{frequency}_{scope}"] = {
+                "matches": matches,
+                "first_page": run(search, args.repeat),
+                "next_page": (
+                    run(lambda: search(cursor), args.repeat) if cursor else None
+                ),
+            }
+            logger.info(f"{frequency}_{scope}: {results[f'{frequency}_{scope}']}")
+
+    db.close()
+    if not args.keep:
+        logger.info("Deleting the seeded rows")
+        with SessionLocal() as db:
+            db.execute(
+                text(
+                    "DELETE FROM item USING person WHERE person.id = item.user_id "
+                    "AND person.email LIKE :pattern"
+                ),
+                {"pattern": EMAIL_PATTERN},
+            )
+            db.execute(
+                text("DELETE FROM person WHERE email LIKE :pattern"),
+                {"pattern": EMAIL_PATTERN},
+            )
+            db.commit()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
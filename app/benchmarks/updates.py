@@ -0,0 +1,101 @@
+"""
+Update endpoints benchmark.
+
+Sends `PUT /items/{id}` and `PUT /users/me` requests changing a field, and the
+same requests with the current values, and reports their latency and the SQL
+statements (COMMIT included) sent per request.
+
+    python -m app.benchmarks.updates --requests 1000
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+import httpx
+from sqlalchemy import event
+
+from app import crud, schemas
+from app.benchmarks.utils import auth_headers, create_benchmark_user, summarize
+from app.core.config import settings
+from app.db.session import SessionLocal, async_engine
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+
+class StatementCounter:
+    def __init__(self) -> None:
+        self.count = 0
+
+    def __call__(self, *args: Any) -> None:
+        self.count += 1
+
+
+async def run_scenario(
+    headers: Dict[str, str], url: str, body: Callable[[int], Dict], requests: int
+) -> Dict[str, Any]:
+    counter = StatementCounter()
+    sync_engine = async_engine.sync_engine
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers
+    ) as c:
+        # Warm up the caches of the tokens, the principals and the statements
+        (await c.put(url, json=body(-1))).raise_for_status()
+        latencies: List[float] = []
+        event.listen(sync_engine, "before_cursor_execute", counter)
+        event.listen(sync_engine, "commit", counter)
+        try:
+            for i in range(requests):
+                start = time.perf_counter()
+                r = await c.put(url, json=body(i))
+                latencies.append(time.perf_counter() - start)
+                r.raise_for_status()
+        finally:
+            event.remove(sync_engine, "before_cursor_execute", counter)
+            event.remove(sync_engine, "commit", counter)
+    await async_engine.dispose()
+    return {
+        "statements_per_request": round(counter.count / requests, 2),
+        "latency": summarize(latencies),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--requests", type=int, default=1000)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    user = create_benchmark_user(db)
+    item = crud.item.create_with_user(
+        db, obj_in=schemas.ItemCreate(name="benchmark"), user=user
+    )
+    headers = auth_headers(user)
+    item_url = f"{settings.API_V1_STR}/items/{item.id}"
+    me_url = f"{settings.API_V1_STR}/users/me"
+
+    scenarios = {
+        "item_changed": (item_url, lambda i: {"name": f"benchmark-{i}"}),
+        "item_unchanged": (item_url, lambda i: {"name": "benchmark"}),
+        "me_changed": (me_url, lambda i: {"first_name": f"benchmark-{i}"}),
+        "me_unchanged": (me_url, lambda i: {"first_name": "benchmark"}),
+    }
+    results = {}
+    for name, (url, body) in scenarios.items():
+        logger.info(f"Running {name} scenario")
+        results[name] = asyncio.run(run_scenario(headers, url, body, args.requests))
+
+    db.rollback()
+    crud.user.remove(db, crud.user.get(db, id=user.id))
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
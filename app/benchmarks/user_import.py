@@ -0,0 +1,168 @@
+"""
+Bulk user import benchmark.
+
+Imports an NDJSON file of `--rows` SSO users through `POST /users/import`, a
+file of `--password-rows` email users whose passwords are hashed by the import
+processes, and creates `--single-rows` users one request at a time through
+`POST /users/` for comparison. Reports the users imported per second.
+
+    python -m app.benchmarks.user_import --rows 100000
+
+The email users are bound by scrypt: their rate is the number of import
+hashing processes (`IMPORT_HASHING_WORKERS`) divided by the duration of a hash.
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import secrets
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+import httpx
+from sqlalchemy import text
+
+from app import crud, models
+from app.benchmarks.utils import auth_headers, create_benchmark_user
+from app.core.config import settings
+from app.core.security import import_password_hasher
+from app.db.session import SessionLocal, async_engine
+from app.main import app
+
+logging.basicConfig(level=logging.INFO)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+logger = logging.getLogger(__name__)
+
+USERS_URL = f"{settings.API_V1_STR}/users/"
+IMPORT_URL = f"{settings.API_V1_STR}/users/import"
+EMAIL_PATTERN = "import-benchmark-%@example.com"
+
+
+def user_rows(rows: int, password: bool) -> List[Dict[str, Any]]:
+    prefix = f"import-benchmark-{secrets.token_hex(4)}"
+    if password:
+        return [
+            {"email": f"{prefix}-{n}@example.com", "password": secrets.token_hex(8)}
+            for n in range(rows)
+        ]
+    return [
+        {
+            "email": f"{prefix}-{n}@example.com",
+            "first_name": "Import",
+            "last_name": f"Benchmark {n}",
+            "provider": models.Provider.GOOGLE.value,
+            "sso_provider_id": f"{prefix}-{n}",
+        }
+        for n in range(rows)
+    ]
+
+
+async def run_import(headers: Dict[str, str], users: List[Dict]) -> Dict[str, Any]:
+    body = "".join(json.dumps(user) + "\n" for user in users).encode()
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers, timeout=None
+    ) as c:
+        # The background import runs before the request returns
+        start = time.perf_counter()
+        r = await c.post(IMPORT_URL, content=body)
+        elapsed = time.perf_counter() - start
+        r.raise_for_status()
+        r = await c.get(f"{IMPORT_URL}/{r.json()['id']}")
+        progress = r.json()
+    await async_engine.dispose()
+    # From the creation of the import to the last batch, without the upload and
+    # the new account emails
+    loaded = datetime.fromisoformat(progress["finished_at"]) - datetime.fromisoformat(
+        progress["created_at"]
+    )
+    import_password_hasher.shutdown()
+
+    return {
+        "id": progress["id"],
+        "file_mb": round(len(body) / 1024 / 1024, 2),
+        "status": progress["status"],
+        "rows_imported": progress["rows_imported"],
+        "rows_failed": progress["rows_failed"],
+        "rows_per_sec": round(progress["rows_imported"] / elapsed, 2),
+        "load_rows_per_sec": round(
+            progress["rows_imported"] / loaded.total_seconds(), 2
+        ),
+    }
+
+
+async def run_single(
+    headers: Dict[str, str], users: List[Dict], concurrency: int
+) -> Dict[str, Any]:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", headers=headers, timeout=None
+    ) as c:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def send(user: Dict) -> None:
+            async with semaphore:
+                r = await c.post(USERS_URL, json=user)
+                r.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(send(user) for user in users))
+        elapsed = time.perf_counter() - start
+    await async_engine.dispose()
+
+    return {"rows_per_sec": round(len(users) / elapsed, 2)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--password-rows", type=int, default=200)
+    parser.add_argument("--single-rows", type=int, default=2_000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    admin = create_benchmark_user(db)
+    crud.user.update(db, db_obj=admin, obj_in={"role": models.Role.ADMIN})
+    headers = auth_headers(admin)
+
+    logger.info(
+        f"Importing {args.rows} SSO users and {args.password_rows} email users, "
+        f"creating {args.single_rows} SSO users one by one"
+    )
+    # Without an SMTP server every new account email logs a warning
+    logging.disable(logging.WARNING)
+    results = {}
+    results["import_sso"] = asyncio.run(
+        run_import(headers, user_rows(args.rows, password=False))
+    )
+    results["import_email"] = asyncio.run(
+        run_import(headers, user_rows(args.password_rows, password=True))
+    )
+    results["single_sso"] = asyncio.run(
+        run_single(
+            headers, user_rows(args.single_rows, password=False), args.concurrency
+        )
+    )
+    logging.disable(logging.NOTSET)
+
+    db.execute(
+        text("DELETE FROM person WHERE email LIKE :pattern"),
+        {"pattern": EMAIL_PATTERN},
+    )
+    db.execute(
+        text("DELETE FROM user_import WHERE id IN (:sso, :email)"),
+        {
+            "sso": results["import_sso"].pop("id"),
+            "email": results["import_email"].pop("id"),
+        },
+    )
+    db.commit()
+    crud.user.remove(db, admin)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
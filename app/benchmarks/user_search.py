@@ -0,0 +1,144 @@
+"""
+Admin user search benchmark.
+
+Seeds `--users` users with first and last names drawn from a vocabulary of
+generated names, and measures the latency of prefix and fuzzy searches of a
+name and of an email, alone and combined with the role and archived filters.
+
+    python -m app.benchmarks.user_search --users 2000000
+
+The seeded rows are kept by `--keep` and reused by the next runs.
+"""
+
+import argparse
+import itertools
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import text
+
+from app import crud, models
+from app.benchmarks.utils import summarize
+from app.db.session import SessionLocal, engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMAIL_DOMAIN = "user-search-benchmark.example.com"
+SYLLABLES = (
+    "ka lo mi ra ne to su vi da re ma li no sa te ri po ze gu be fa ho ji ku le mo "
+    "ni pa qu si ta vo wa xe yo zu"
+).split()
+# Names of three syllables, every name is given to about users / len(NAMES)
+# users
+NAMES = ["".join(name) for name in itertools.product(SYLLABLES, repeat=3)]
+# Searched texts, matching the names of the seeded users
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    "prefix_name": {"text": "kalomi"},
+    "prefix_short_name": {"text": "kalo"},
+    "prefix_email": {"text": "kalomi.rane"},
+    "prefix_name_moderators": {"text": "kalo", "role": models.Role.MODERATOR},
+    "prefix_name_with_archived": {"text": "kalomi", "with_archived": True},
+    "fuzzy_name": {"text": "kalomy", "fuzzy": True},
+    "fuzzy_email": {"text": "kalomi.ranne", "fuzzy": True},
+    "fuzzy_name_moderators": {
+        "text": "kalomy",
+        "fuzzy": True,
+        "role": models.Role.MODERATOR,
+    },
+}
+
+
+def seed(db: Any, users: int, batch_size: int) -> None:
+    for start in range(0, users, batch_size):
+        # 1% of moderators, 5% of archived users
+        db.execute(
+            text(
+                "INSERT INTO person (id, email, first_name, last_name, role, "
+                "language, provider, archived_at, created_at) "
+                "SELECT gen_random_uuid(), first_name || '.' || last_name || '.' "
+                "|| n || '@' || :domain, first_name, last_name, "
+                "CASE WHEN n % 100 = 0 THEN 'moderator' ELSE 'customer' END, "
+                "'en', 'email', CASE WHEN n % 20 = 0 THEN now() END, "
+                "now() - n * interval '1 millisecond' "
+                "FROM (SELECT n, "
+                "(:names)[1 + floor(random() * cardinality(:names))::int] "
+                "AS first_name, "
+                "(:names)[1 + floor(random() * cardinality(:names))::int] "
+                "AS last_name "
+                "FROM generate_series(:start, :stop) AS n) AS names"
+            ),
+            {
+                "names": NAMES,
+                "domain": EMAIL_DOMAIN,
+                "start": start + 1,
+                "stop": min(start + batch_size, users),
+            },
+        )
+        db.commit()
+        logger.info(f"Seeded {min(start + batch_size, users)} users")
+    db.execution_options(isolation_level="AUTOCOMMIT").execute(
+        text("VACUUM ANALYZE person")
+    )
+
+
+def run(call: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    call()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=2_000_000)
+    parser.add_argument("--batch-size", type=int, default=500_000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    seeded = db.scalar(
+        text("SELECT count(*) FROM person WHERE email LIKE :pattern"),
+        {"pattern": f"%@{EMAIL_DOMAIN}"},
+    )
+    if not seeded:
+        logger.info(f"Seeding {args.users} users")
+        with engine.connect() as connection:
+            seed(connection, args.users, args.batch_size)
+
+    results: Dict[str, Any] = {}
+    for name, params in SCENARIOS.items():
+
+        def search(cursor: Any = None) -> List:
+            db.expunge_all()
+            return crud.user.search(db, **params, cursor=cursor, limit=args.page_size)
+
+        users, cursor = search()
+        results[name] = {
+            "page_users": len(users),
+            "first_page": run(search, args.repeat),
+            "next_page": run(lambda: search(cursor), args.repeat) if cursor else None,
+        }
+        logger.info(f"{name}: {results[name]}")
+
+    db.close()
+    if not args.keep:
+        logger.info("Deleting the seeded rows")
+        with SessionLocal() as db:
+            db.execute(
+                text("DELETE FROM person WHERE email LIKE :pattern"),
+                {"pattern": f"%@{EMAIL_DOMAIN}"},
+            )
+            db.commit()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,228 @@
+"""
+User stats benchmark.
+
+Seeds `--users` users owning `--items-per-user` items each, and measures:
+
+* the number of items of a page of users, counted from the items on the fly
+  or read from the stats, and the page of users with their stats joined,
+* the item writes (one item, a batch of items, a rename of the batch) with the
+  triggers maintaining the stats enabled and disabled,
+* the reconciliation of the stats of every seeded user, which repairs the
+  counters left behind by the writes made with the triggers disabled.
+
+    python -m app.benchmarks.user_stats --users 10000 --items-per-user 100
+
+The seeded rows are kept by `--keep` and reused by the next runs.
+"""
+
+import argparse
+import json
+import logging
+import time
+from itertools import count
+from typing import Any, Callable, Dict, List
+from uuid import UUID
+
+from sqlalchemy import func, select, text
+
+from app import crud, models, schemas
+from app.benchmarks.utils import summarize
+from app.core.pagination import encode_cursor
+from app.db.session import SessionLocal, engine
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EMAIL_PATTERN = "stats-benchmark-%@example.com"
+
+
+def seed(db: Any, users: int, items_per_user: int, batch_size: int) -> None:
+    db.execute(
+        text(
+            "INSERT INTO person (id, email, role, language, provider, created_at) "
+            "SELECT gen_random_uuid(), 'stats-benchmark-' || n || '@example.com', "
+            "'customer', 'en', 'email', now() - n * interval '1 millisecond' "
+            "FROM generate_series(1, :users) AS n"
+        ),
+        {"users": users},
+    )
+    db.commit()
+    owners = list(
+        db.scalars(
+            text("SELECT id FROM person WHERE email LIKE :pattern ORDER BY id"),
+            {"pattern": EMAIL_PATTERN},
+        )
+    )
+    step = max(batch_size // items_per_user, 1)
+    for start in range(0, len(owners), step):
+        end = start + step
+        # 10% of archived items, counted by the triggers statement by statement
+        db.execute(
+            text(
+                "INSERT INTO item (id, name, user_id, archived_at, created_at) "
+                "SELECT gen_random_uuid(), 'stats', owner, "
+                "CASE WHEN n % 10 = 0 THEN now() END, now() "
+                "FROM unnest(CAST(:owners AS uuid[])) AS owner, "
+                "generate_series(1, :items) AS n"
+            ),
+            {
+                "owners": [str(o) for o in owners[start:end]],
+                "items": items_per_user,
+            },
+        )
+        db.commit()
+        logger.info(f"Seeded the items of {min(end, len(owners))} users")
+    db.execution_options(isolation_level="AUTOCOMMIT").execute(
+        text("VACUUM ANALYZE item, user_stats")
+    )
+
+
+def run(call: Callable[[], Any], repeat: int) -> Dict[str, float]:
+    call()
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return summarize(latencies)
+
+
+def set_triggers(db: Any, enabled: bool) -> None:
+    action = "ENABLE" if enabled else "DISABLE"
+    for trigger in ("item_count_inserts", "item_count_updates", "item_count_deletes"):
+        db.execute(text(f"ALTER TABLE item {action} TRIGGER {trigger}"))
+    db.commit()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--items-per-user", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=500_000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--bulk-size", type=int, default=1_000)
+    parser.add_argument("--reconcile-batch-size", type=int, default=1_000)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    seeded = db.scalar(
+        text("SELECT count(*) FROM person WHERE email LIKE :pattern"),
+        {"pattern": EMAIL_PATTERN},
+    )
+    if not seeded:
+        logger.info(f"Seeding {args.users * args.items_per_user} items")
+        with engine.connect() as connection:
+            seed(connection, args.users, args.items_per_user, args.batch_size)
+    owner = crud.user.get_by_email(db, email="stats-benchmark-1@example.com")
+    assert owner is not None
+
+    results: Dict[str, Any] = {}
+
+    # A page of seeded users, from the oldest one
+    oldest = db.scalar(
+        select(models.User.created_at)
+        .where(models.User.email.like(EMAIL_PATTERN))
+        .order_by(models.User.created_at)
+        .limit(1)
+    )
+    cursor = encode_cursor(oldest, UUID(int=0))
+    users, _ = crud.user.get_page(db, cursor=cursor, limit=args.page_size)
+    ids = [user.id for user in users]
+
+    def count_items() -> None:
+        db.execute(
+            select(
+                models.Item.user_id,
+                func.count(),
+                func.count().filter(models.Item.archived_at.is_(None)),
+            )
+            .where(models.Item.user_id.in_(ids))
+            .group_by(models.Item.user_id)
+        ).all()
+
+    def read_stats() -> None:
+        db.execute(
+            select(models.UserStats).where(models.UserStats.user_id.in_(ids))
+        ).all()
+
+    def read_page() -> None:
+        db.expunge_all()
+        users, _ = crud.user.get_page(db, cursor=cursor, limit=args.page_size)
+        [schemas.User.model_validate(user) for user in users]
+
+    # The counters of a page of users counted from the items or read from the
+    # stats, and the page of users with the stats joined
+    results["page_count_items"] = run(count_items, args.repeat)
+    results["page_read_stats"] = run(read_stats, args.repeat)
+    results["page_with_stats"] = run(read_page, args.repeat)
+
+    items_in = [schemas.ItemCreate(name="stats") for _ in range(args.bulk_size)]
+    for enabled in (True, False):
+        set_triggers(db, enabled)
+        created: List[UUID] = []
+
+        def create_one() -> None:
+            item = crud.item.create_with_user(db, obj_in=items_in[0], user=owner)
+            created.append(item.id)
+
+        def create_bulk() -> None:
+            items = crud.item.create_multi_with_user(db, objs_in=items_in, user=owner)
+            created.extend(item.id for item in items)
+
+        renames = count()
+
+        def rename_bulk() -> None:
+            # A new name each time, the items already holding it are skipped
+            bulk_size, name = args.bulk_size, f"renamed {next(renames)}"
+            crud.item.update_multi(db, ids=created[-bulk_size:], obj_in={"name": name})
+
+        suffix = "triggers" if enabled else "no_triggers"
+        try:
+            results[f"create_one_{suffix}"] = run(create_one, args.repeat)
+            results[f"create_bulk_{suffix}"] = run(create_bulk, args.repeat // 5)
+            results[f"rename_bulk_{suffix}"] = run(rename_bulk, args.repeat // 5)
+        finally:
+            set_triggers(db, True)
+        logger.info(f"Writes with {suffix}: {results[f'create_bulk_{suffix}']}")
+
+    after = None
+    repaired = 0
+    start = time.perf_counter()
+    while True:
+        after, users = crud.user_stats.reconcile(
+            db, after=after, limit=args.reconcile_batch_size
+        )
+        if after is None:
+            break
+        repaired += len(users)
+    elapsed = time.perf_counter() - start
+    users_count = db.scalar(select(func.count()).select_from(models.User))
+    results["reconcile"] = {
+        "users": users_count,
+        "repaired": repaired,
+        "users_per_sec": round(users_count / elapsed, 2),
+    }
+
+    db.close()
+    if not args.keep:
+        logger.info("Deleting the seeded rows")
+        with SessionLocal() as db:
+            db.execute(
+                text(
+                    "DELETE FROM item USING person WHERE person.id = item.user_id "
+                    "AND person.email LIKE :pattern"
+                ),
+                {"pattern": EMAIL_PATTERN},
+            )
+            db.execute(
+                text("DELETE FROM person WHERE email LIKE :pattern"),
+                {"pattern": EMAIL_PATTERN},
+            )
+            db.commit()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import secrets
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, Generator, List
+
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.core import security
+from app.db.session import SessionLocal
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """
+    Latency summary in milliseconds of a list of durations in seconds.
+    """
+    return {
+        "count": len(samples),
+        "p50_ms": round(percentile(samples, 50) * 1000, 3),
+        "p99_ms": round(percentile(samples, 99) * 1000, 3),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+async def timed(call: Callable[[], Awaitable]) -> float:
+    start = time.perf_counter()
+    await call()
+    return time.perf_counter() - start
+
+
+def get_sync_db() -> Generator:
+    """
+    Synchronous session for the benchmark routes running in the threadpool.
+    """
+    with SessionLocal() as db:
+        yield db
+
+
+def random_email() -> str:
+    return f"benchmark-{secrets.token_hex(8)}@example.com"
+
+
+def create_benchmark_user(db: Session, password: str = "") -> models.User:
+    user_in = schemas.UserCreate(
+        email=random_email(), password=password or secrets.token_hex(16)
+    )
+    return crud.user.create(db, obj_in=user_in)
+
+
+def auth_headers(user: models.User) -> Dict[str, str]:
+    return {"Authorization": f"Bearer {security.create_access_token(user.id)}"}
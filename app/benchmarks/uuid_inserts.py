@@ -0,0 +1,87 @@
+"""
+Primary key insert benchmark.
+
+Copies `--rows` rows with random (version 4) and time-ordered (version 7)
+UUID primary keys generated by the application into two scratch tables, and
+reports the insert throughput, at the start and at the end of the run, and
+the size of the primary key indexes.
+
+    python -m app.benchmarks.uuid_inserts --rows 20000000
+"""
+
+import argparse
+import io
+import json
+import logging
+import time
+import uuid
+from typing import Any, Callable, Dict, List
+
+from app.db.session import engine
+from app.utils import uuid7
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+GENERATORS: Dict[str, Callable[[], uuid.UUID]] = {"v4": uuid.uuid4, "v7": uuid7}
+
+
+def rows_per_second(rows: int, durations: List[float]) -> int:
+    return round(rows * len(durations) / sum(durations))
+
+
+def run_scenario(name: str, rows: int, batch_size: int) -> Dict[str, Any]:
+    table = f"benchmark_uuid_{name}"
+    generate = GENERATORS[name]
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        cursor.execute(
+            f"CREATE TABLE {table} (id uuid PRIMARY KEY, "
+            "created_at timestamptz NOT NULL DEFAULT now(), name text)"
+        )
+        connection.commit()
+        durations: List[float] = []
+        for batch in range(0, rows, batch_size):
+            count = min(batch_size, rows - batch)
+            data = "".join(f"{generate()}\tbenchmark\n" for _ in range(count))
+            start = time.perf_counter()
+            cursor.copy_expert(f"COPY {table} (id, name) FROM STDIN", io.StringIO(data))
+            connection.commit()
+            durations.append(time.perf_counter() - start)
+            if len(durations) % 20 == 0:
+                logger.info(f"{name}: {batch + count} rows")
+        cursor.execute(
+            f"SELECT pg_relation_size('{table}_pkey'), pg_relation_size('{table}')"
+        )
+        index_size, table_size = cursor.fetchone()
+        cursor.execute(f"DROP TABLE {table}")
+        connection.commit()
+    finally:
+        connection.close()
+    tenth = max(1, len(durations) // 10)
+    return {
+        "rows_per_second": rows_per_second(batch_size, durations),
+        "first_10pct_rows_per_second": rows_per_second(batch_size, durations[:tenth]),
+        "last_10pct_rows_per_second": rows_per_second(batch_size, durations[-tenth:]),
+        "pkey_index_mb": round(index_size / 2**20, 1),
+        "table_mb": round(table_size / 2**20, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20_000_000)
+    parser.add_argument("--batch-size", type=int, default=100_000)
+    args = parser.parse_args()
+
+    results = {}
+    for name in GENERATORS:
+        logger.info(f"Running {name} scenario")
+        results[name] = run_scenario(name, args.rows, args.batch_size)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,74 @@
+import argparse
+import logging
+import multiprocessing
+import time
+from os import urandom
+
+from app.core.config import settings
+from app.core.security import SALT_LENGTH, ScryptParameters, scrypt
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MIN_LOG2_N = 10
+MAX_LOG2_N = 20
+
+
+def measure(parameters: ScryptParameters, rounds: int) -> float:
+    """
+    Average duration in seconds of one derivation on a single core.
+    """
+    password = urandom(16)
+    salt = urandom(SALT_LENGTH)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        scrypt(password, salt=salt, parameters=parameters)
+    return (time.perf_counter() - start) / rounds
+
+
+def calibrate(target_ms: float, r: int, p: int, rounds: int) -> ScryptParameters:
+    proposal = ScryptParameters(n=2**MIN_LOG2_N, r=r, p=p)
+    for log2_n in range(MIN_LOG2_N, MAX_LOG2_N + 1):
+        parameters = ScryptParameters(n=2**log2_n, r=r, p=p)
+        duration = measure(parameters, rounds)
+        logger.info(
+            f"N=2^{log2_n} r={r} p={p}: {duration * 1000:.1f} ms, "
+            f"{1 / duration:.1f} hashes/sec/core"
+        )
+        if duration * 1000 > target_ms:
+            break
+        proposal = parameters
+    return proposal
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Propose scrypt parameters matching a latency budget on this host"
+    )
+    parser.add_argument(
+        "--target-ms",
+        type=float,
+        default=100,
+        help="Latency budget of one password hash",
+    )
+    parser.add_argument("-r", type=int, default=settings.PASSWORD_HASH_SCRYPT_R)
+    parser.add_argument("-p", type=int, default=settings.PASSWORD_HASH_SCRYPT_P)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    logger.info("Calibrating password hashing")
+    parameters = calibrate(args.target_ms, args.r, args.p, args.rounds)
+    duration = measure(parameters, args.rounds)
+    cores = multiprocessing.cpu_count()
+    logger.info(
+        f"Proposed parameters hash in {duration * 1000:.1f} ms, "
+        f"{1 / duration:.1f} hashes/sec/core, {cores / duration:.1f} hashes/sec "
+        f"on the {cores} cores of this host"
+    )
+    print(f"PASSWORD_HASH_SCRYPT_N={parameters.n}")
+    print(f"PASSWORD_HASH_SCRYPT_R={parameters.r}")
+    print(f"PASSWORD_HASH_SCRYPT_P={parameters.p}")
+
+
+if __name__ == "__main__":
+    main()
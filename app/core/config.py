@@ -5,6 +5,7 @@ from typing import List, Optional, Union
 from pydantic import (
     AnyHttpUrl,
     EmailStr,
+    IPvAnyNetwork,
     ValidationInfo,
     field_validator,
     model_validator,
@@ -23,17 +24,78 @@ class Settings(BaseSettings):
 
     API_V1_STR: str = "/api/v1"
     SECRET_KEY: str = secrets.token_urlsafe(32)
+    # Largest page returned by the list endpoints, whatever the requested limit
+    MAX_PAGE_SIZE: int = 100
+    # Largest batch accepted by the bulk endpoints
+    MAX_BULK_SIZE: int = 10_000
+    # Longest text accepted by the search endpoints
+    MAX_SEARCH_LENGTH: int = 200
+    # Totals of the admin listings: counted exactly when the planner estimates at
+    # most COUNT_EXACT_THRESHOLD rows, estimated otherwise, and cached for
+    # COUNT_CACHE_TTL_SECONDS or until a write to the table by this worker
+    COUNT_EXACT_THRESHOLD: int = 10_000
+    COUNT_CACHE_TTL_SECONDS: int = 10
+    COUNT_CACHE_SIZE: int = 1_000
+    # Rows fetched from the server-side cursor and encoded at once by the exports
+    EXPORT_BATCH_SIZE: int = 1_000
+    # User imports: largest uploaded file, rows validated, hashed and copied at
+    # once, and failed rows kept in the report of the import
+    MAX_IMPORT_BYTES: int = 100 * 1024 * 1024
+    IMPORT_BATCH_SIZE: int = 1_000
+    MAX_IMPORT_FAILURES: int = 1_000
+    # Users whose counters of items are recounted in a transaction by the
+    # reconciliation of the user stats
+    USER_STATS_RECONCILE_BATCH_SIZE: int = 1_000
     # By default: 60 seconds * 60 minutes * 24 hours * 1 days = 1 days
     ACCESS_TOKEN_EXPIRES_SECONDS: int = 60 * 60 * 24 * 1
     # By default: 60 seconds * 60 minutes * 24 hours * 365 days = 1 year
     REFRESH_TOKEN_EXPIRES_SECONDS: int = 60 * 60 * 24 * 8
     # By default: 30 seconds
     SSO_CONFIRMATION_TOKEN_EXPIRES_SECONDS: int = 30
+    # Cache of the validated tokens, entries are evicted when their token expires
+    TOKEN_CACHE_ENABLED: bool = True
+    TOKEN_CACHE_SIZE: int = 10_000
+    # Cache of the authenticated users, entries are invalidated on writes through
+    # the CRUD layer of the current worker and expire after the TTL everywhere else
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 5
+    PRINCIPAL_CACHE_SIZE: int = 10_000
+    # Cost of the scrypt password hashes, run `python app/calibrate_password_hash.py`
+    # to tune them for the host. Existing hashes are upgraded on login
+    PASSWORD_HASH_SCRYPT_N: int = 16_384
+    PASSWORD_HASH_SCRYPT_R: int = 8
+    PASSWORD_HASH_SCRYPT_P: int = 4
+    # Token buckets limiting the attempts on the endpoints hashing a password,
+    # shared by all the workers of the host through a file in LOGIN_THROTTLE_DIR
+    LOGIN_THROTTLE_ENABLED: bool = True
+    LOGIN_THROTTLE_DIR: str = "/dev/shm"
+    LOGIN_THROTTLE_SLOTS: int = 65_536
+    LOGIN_THROTTLE_IP_BURST: int = 30
+    LOGIN_THROTTLE_IP_PER_MINUTE: int = 30
+    LOGIN_THROTTLE_EMAIL_BURST: int = 10
+    LOGIN_THROTTLE_EMAIL_PER_MINUTE: int = 5
+    # Per-worker Bloom filter of the revoked refresh tokens, rebuilt from the
+    # database every REVOCATION_FILTER_RESYNC_SECONDS
+    REVOCATION_FILTER_ENABLED: bool = True
+    REVOCATION_FILTER_CAPACITY: int = 100_000
+    REVOCATION_FILTER_ERROR_RATE: float = 0.001
+    REVOCATION_FILTER_RESYNC_SECONDS: int = 30
+    # Number of processes dedicated to password hashing in each worker, 0 hashes
+    # in the threadpool of the worker instead
+    PASSWORD_HASHING_WORKERS: int = 2
+    # Number of hashes allowed to wait for a free hashing process before the
+    # server answers with a 503
+    PASSWORD_HASHING_QUEUE_SIZE: int = 64
+    # Processes hashing the passwords of the user imports in each worker, apart
+    # from the ones of the logins. 0 hashes in the threadpool of the worker
+    IMPORT_HASHING_WORKERS: int = 2
     SERVER_NAME: str
     SERVER_HOST: AnyHttpUrl
     # BACKEND_CORS_ORIGINS is a JSON-formatted list of origins
     # e.g: '["http://localhost", "http://localhost:4200", ...]'
     BACKEND_CORS_ORIGINS: List[AnyHttpUrl] = []
+    # Networks of the reverse proxies (traefik) whose X-Forwarded-For header is
+    # trusted to get the IP of the clients, e.g: '["172.16.0.0/12"]'
+    TRUSTED_PROXIES: List[IPvAnyNetwork] = []
     TAG: EnvTag = EnvTag.DEV
 
     PROJECT_NAME: str
@@ -41,7 +103,31 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = "postgres"
     POSTGRES_PASSWORD: str = ""
     POSTGRES_DB: str = "app"
+    # Comma separated hosts of the streaming replicas serving the CRUD reads
+    POSTGRES_REPLICA_SERVERS: str = ""
     SQLALCHEMY_DATABASE_URI: str = ""
+    SQLALCHEMY_ASYNC_DATABASE_URI: str = ""
+    SQLALCHEMY_ASYNC_REPLICA_URIS: List[str] = []
+    # Connections available to the whole deployment, e.g. max_connections of
+    # Postgres minus its reserved connections, or max_client_conn of PgBouncer.
+    # Each of the WEB_CONCURRENCY workers gets an equal share of them
+    DB_MAX_CONNECTIONS: int = 90
+    # Number of gunicorn workers, exported by gunicorn_conf.py
+    WEB_CONCURRENCY: int = 1
+    # Connections of the synchronous engine taken from the share of the worker
+    DB_SYNC_POOL_SIZE: int = 2
+    # Connections of the asynchronous engine kept open, and opened on demand on
+    # top of them. Half of the remaining share of the worker each when not set
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_TIMEOUT_SECONDS: float = 30
+    DB_POOL_RECYCLE_SECONDS: int = 1800
+    # Check the connection with a round trip on every checkout. Otherwise a broken
+    # connection is discarded when a statement fails on it
+    DB_POOL_PRE_PING: bool = False
+    # Connect through PgBouncer in transaction pooling mode, which doesn't support
+    # the prepared statements cached by asyncpg
+    DB_PGBOUNCER_TRANSACTION_MODE: bool = False
     SMTP_TLS: bool = False
     SMTP_SSL: bool = True
     SMTP_PORT: Optional[int] = None
@@ -74,7 +160,7 @@ class Settings(BaseSettings):
 
     FILE_PATH: str = "/app/app/files/"
 
-    @field_validator("BACKEND_CORS_ORIGINS", mode="before")
+    @field_validator("BACKEND_CORS_ORIGINS", "TRUSTED_PROXIES", mode="before")
     @classmethod
     def assemble_cors_origins(
         cls, v: Union[str, List[str]], info: ValidationInfo
@@ -85,6 +171,33 @@ class Settings(BaseSettings):
             return v
         raise ValueError(v)
 
+    @field_validator("PASSWORD_HASH_SCRYPT_N")
+    @classmethod
+    def check_scrypt_cost(cls, v: int) -> int:
+        if v < 2 or v & (v - 1):
+            raise ValueError("PASSWORD_HASH_SCRYPT_N must be a power of 2")
+        return v
+
+    @model_validator(mode="after")
+    def set_db_pool(self) -> "Settings":
+        worker_connections = self.DB_MAX_CONNECTIONS // self.WEB_CONCURRENCY
+        budget = worker_connections - self.DB_SYNC_POOL_SIZE
+        if budget < 1:
+            raise ValueError(
+                f"DB_MAX_CONNECTIONS={self.DB_MAX_CONNECTIONS} is too low for "
+                f"{self.WEB_CONCURRENCY} workers"
+            )
+        if self.DB_POOL_SIZE is None:
+            self.DB_POOL_SIZE = max(1, budget // 2)
+        if self.DB_MAX_OVERFLOW is None:
+            self.DB_MAX_OVERFLOW = max(0, budget - self.DB_POOL_SIZE)
+        if self.DB_POOL_SIZE + self.DB_MAX_OVERFLOW > budget:
+            raise ValueError(
+                f"DB_POOL_SIZE + DB_MAX_OVERFLOW exceed the {budget} connections "
+                "available to the asynchronous engine of each worker"
+            )
+        return self
+
     @model_validator(mode="after")
     def set_email_service(self) -> "Settings":
         if self.EMAILS_FROM_EMAIL is None:
@@ -119,6 +232,14 @@ class Settings(BaseSettings):
         server = self.POSTGRES_SERVER
         db = self.POSTGRES_DB
         self.SQLALCHEMY_DATABASE_URI = f"postgresql://{user}:{password}@{server}/{db}"
+        self.SQLALCHEMY_ASYNC_DATABASE_URI = (
+            f"postgresql+asyncpg://{user}:{password}@{server}/{db}"
+        )
+        self.SQLALCHEMY_ASYNC_REPLICA_URIS = [
+            f"postgresql+asyncpg://{user}:{password}@{replica.strip()}/{db}"
+            for replica in self.POSTGRES_REPLICA_SERVERS.split(",")
+            if replica.strip()
+        ]
         return self
 
 
@@ -0,0 +1,42 @@
+import hashlib
+from datetime import datetime, timezone
+from typing import Any, Iterable, Optional, Sequence
+
+ETAG_HEADER = "ETag"
+IF_NONE_MATCH_HEADER = "If-None-Match"
+
+
+def etag_part(value: Any) -> str:
+    # Both drivers return the dates in UTC, but with different tzinfo objects
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).isoformat()
+    return str(value)
+
+
+def compute_etag(versions: Iterable[Sequence[Any]]) -> str:
+    """
+    Strong ETag of a response built from rows, each one identified by its
+    version: its id and its creation and last update dates.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for version in versions:
+        digest.update("|".join(map(etag_part, version)).encode() + b"\n")
+    return f'"{digest.hexdigest()}"'
+
+
+def compute_page_etag(versions: Sequence[Sequence[Any]], has_next: bool) -> str:
+    # The next cursor header changes when rows are added after the last one
+    return compute_etag([*versions, (has_next,)])
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """
+    Weak comparison of `If-None-Match` with the current ETag, as required for
+    the conditional GET requests.
+    """
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return etag in (tag[2:] if tag.startswith("W/") else tag for tag in tags)
@@ -0,0 +1,61 @@
+import base64
+import json
+import uuid
+from datetime import datetime
+from typing import Any, List, Tuple
+
+# Header of the list responses carrying the cursor of the next page, absent on
+# the last page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# Headers of the admin list responses carrying the total number of rows, and
+# whether this total is an estimate from the planner statistics
+TOTAL_COUNT_HEADER = "X-Total-Count"
+TOTAL_COUNT_ESTIMATED_HEADER = "X-Total-Count-Estimated"
+
+
+def encode_values(values: List[Any]) -> str:
+    value = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(value).decode().rstrip("=")
+
+
+def decode_values(cursor: str) -> List[Any]:
+    value = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(value)
+
+
+def encode_cursor(created_at: datetime, id: uuid.UUID) -> str:
+    """
+    Opaque cursor pointing after the row `(created_at, id)` of a list ordered by
+    `(created_at, id)`.
+    """
+    return encode_values([created_at.isoformat(), str(id)])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, uuid.UUID]:
+    """
+    Raises a `ValueError` when the cursor wasn't issued by `encode_cursor`.
+    """
+    try:
+        created_at, id = decode_values(cursor)
+        return datetime.fromisoformat(created_at), uuid.UUID(id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
+
+
+def encode_ranked_cursor(rank: float, created_at: datetime, id: uuid.UUID) -> str:
+    """
+    Opaque cursor pointing after the row `(rank, created_at, id)` of a list
+    ordered by decreasing rank, then by `(created_at, id)`.
+    """
+    return encode_values([rank, created_at.isoformat(), str(id)])
+
+
+def decode_ranked_cursor(cursor: str) -> Tuple[float, datetime, uuid.UUID]:
+    """
+    Raises a `ValueError` when the cursor wasn't issued by `encode_ranked_cursor`.
+    """
+    try:
+        rank, created_at, id = decode_values(cursor)
+        return float(rank), datetime.fromisoformat(created_at), uuid.UUID(id)
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"Invalid cursor {cursor!r}") from e
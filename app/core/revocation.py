@@ -0,0 +1,85 @@
+import hashlib
+import math
+import threading
+import time
+from typing import Iterable, Iterator, Optional
+
+
+class BloomFilter:
+    """
+    Probabilistic set answering "definitely absent" or "possibly present".
+
+    **Parameters**
+
+    * `capacity`: Number of keys the filter is sized for
+    * `error_rate`: Expected false positive rate once `capacity` keys are added
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(1, capacity)
+        self.size = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Double hashing: the k positions are derived from a single digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hash_count))
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class RevocationFilter:
+    """
+    Per-worker Bloom filter of the revoked token identifiers.
+
+    The filter is rebuilt from the database every `resync_seconds` so that the
+    revocations done by the other workers are eventually seen. A token absent
+    from the filter is not revoked; a token present must be confirmed against
+    the database because of false positives.
+    """
+
+    def __init__(self, capacity: int, error_rate: float, resync_seconds: float):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.resync_seconds = resync_seconds
+        self._filter: Optional[BloomFilter] = None
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    def needs_resync(self) -> bool:
+        return (
+            self._filter is None
+            or time.monotonic() - self._synced_at >= self.resync_seconds
+        )
+
+    def resync(self, token_ids: Iterable[str]) -> None:
+        token_ids = list(token_ids)
+        # Leave room for the revocations added until the next resync
+        bloom_filter = BloomFilter(
+            max(self.capacity, 2 * len(token_ids)), self.error_rate
+        )
+        for token_id in token_ids:
+            bloom_filter.add(token_id)
+        with self._lock:
+            self._filter = bloom_filter
+            self._synced_at = time.monotonic()
+
+    def add(self, token_id: str) -> None:
+        with self._lock:
+            if self._filter is not None:
+                self._filter.add(token_id)
+
+    def might_contain(self, token_id: str) -> bool:
+        bloom_filter = self._filter
+        return bloom_filter is None or token_id in bloom_filter
@@ -1,23 +1,47 @@
+import asyncio
+import base64
 import hashlib
+import hmac
+import multiprocessing
 import random
 import string
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
 from datetime import UTC, datetime, timedelta
 from os import urandom
-from typing import Optional
+from typing import Any, Callable, List, Optional, Sequence, Tuple, TypeVar
+from uuid import UUID
 
 import jwt
-from pydantic import UUID4
 
+from app.core.cache import TTLCache
 from app.core.config import settings
 from app.schemas.token import TokenContext, TokenPayload
 
-# Parameters for scrypt function
-# Those parameters can be adjusted based on target system's capabilities
-N = 16_384  # CPU/Memory cost factor
-R = 8  # Block size
-P = 4  # Parallelization factor
-MAXMEM = 0  # 0 indicates to use the default value (32 MiB in OpenSSL 1.1.0)
-DKLEN = 64  # Length of the derived key (common choice for security)
+T = TypeVar("T")
+
+SALT_LENGTH = 16
+# Prefix of the password hashes encoding their own scrypt parameters
+SCRYPT_HASH_PREFIX = "$scrypt$"
+
+
+@dataclass(frozen=True)
+class ScryptParameters:
+    n: int  # CPU/Memory cost factor
+    r: int  # Block size
+    p: int  # Parallelization factor
+    dklen: int = 64  # Length of the derived key (common choice for security)
+
+    @property
+    def maxmem(self) -> int:
+        # Memory required by scrypt plus some headroom, OpenSSL rejects the
+        # derivation when it exceeds maxmem (32 MiB by default)
+        return 128 * self.r * (self.n + self.p + 2) + 1024 * 1024
+
+
+# Parameters of the hex encoded hashes stored before the hashes became versioned
+LEGACY_SCRYPT_PARAMETERS = ScryptParameters(n=16_384, r=8, p=4, dklen=64)
 
 
 class TokenContextError(Exception):
@@ -27,14 +51,171 @@ class TokenContextError(Exception):
         )
 
 
-def scrypt(password: str, salt: bytes) -> None:
+class PasswordHashingBusyError(Exception):
+    def __init__(self, max_pending: int):
+        super().__init__(
+            f"Password hashing queue is full ({max_pending} pending hashes)"
+        )
+
+
+class PasswordHasher:
+    """
+    Runs the CPU bound scrypt derivations outside of the event loop.
+
+    Hashes are computed in a dedicated process pool so that a burst of logins
+    does not hold the GIL or the Starlette threadpool used by the other routes.
+    At most `workers + queue_size` hashes can be pending at the same time, any
+    extra call fails fast with a `PasswordHashingBusyError`.
+
+    **Parameters**
+
+    * `workers`: Number of processes of the pool, 0 to hash in the default
+    threadpool of the event loop instead
+    * `queue_size`: Number of hashes allowed to wait for a free process
+    """
+
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.max_pending = workers + queue_size if workers else queue_size
+        self.pending = 0
+        self._lock = threading.Lock()
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self.workers and self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        with self._lock:
+            if self.pending >= self.max_pending:
+                raise PasswordHashingBusyError(self.max_pending)
+            self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    async def map(
+        self, func: Callable[..., List[T]], items: Sequence[Any], *args: Any
+    ) -> List[T]:
+        """
+        Run `func` on a chunk of `items` in each process and concatenate the
+        results, every item counts as a pending hash.
+        """
+        if not items:
+            return []
+        with self._lock:
+            if self.pending + len(items) > self.max_pending:
+                raise PasswordHashingBusyError(self.max_pending)
+            self.pending += len(items)
+        try:
+            loop = asyncio.get_running_loop()
+            size = -(-len(items) // max(self.workers, 1))
+            futures = []
+            for start in range(0, len(items), size):
+                end = start + size
+                chunk = items[start:end]
+                futures.append(loop.run_in_executor(self.executor, func, chunk, *args))
+            results = await asyncio.gather(*futures)
+        finally:
+            with self._lock:
+                self.pending -= len(items)
+        return [result for chunk in results for result in chunk]
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+
+# Validated token payloads indexed by the digest of the token, each entry expires
+# with its token
+token_cache: TTLCache[bytes, TokenPayload] = TTLCache(maxsize=settings.TOKEN_CACHE_SIZE)
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASHING_WORKERS,
+    queue_size=settings.PASSWORD_HASHING_QUEUE_SIZE,
+)
+# Hashes the passwords of the user imports one batch at a time, the logins keep
+# their own processes
+import_password_hasher = PasswordHasher(
+    workers=settings.IMPORT_HASHING_WORKERS, queue_size=settings.IMPORT_BATCH_SIZE
+)
+
+
+def scrypt(password: bytes, salt: bytes, parameters: ScryptParameters) -> bytes:
     return hashlib.scrypt(
-        str(password).encode(), salt=salt, n=N, r=R, p=P, maxmem=MAXMEM, dklen=DKLEN
+        password,
+        salt=salt,
+        n=parameters.n,
+        r=parameters.r,
+        p=parameters.p,
+        maxmem=parameters.maxmem,
+        dklen=parameters.dklen,
+    )
+
+
+def current_scrypt_parameters() -> ScryptParameters:
+    return ScryptParameters(
+        n=settings.PASSWORD_HASH_SCRYPT_N,
+        r=settings.PASSWORD_HASH_SCRYPT_R,
+        p=settings.PASSWORD_HASH_SCRYPT_P,
+    )
+
+
+def _b64encode(value: bytes) -> str:
+    return base64.b64encode(value).decode().rstrip("=")
+
+
+def _b64decode(value: str) -> bytes:
+    return base64.b64decode(value + "=" * (-len(value) % 4))
+
+
+def encode_password_hash(
+    parameters: ScryptParameters, salt: bytes, derived_key: bytes
+) -> str:
+    # Format: $scrypt$ln=<log2(N)>,r=<r>,p=<p>$<base64 salt>$<base64 key>
+    ln = parameters.n.bit_length() - 1
+    return (
+        f"{SCRYPT_HASH_PREFIX}ln={ln},r={parameters.r},p={parameters.p}"
+        f"${_b64encode(salt)}${_b64encode(derived_key)}"
+    )
+
+
+def decode_password_hash(password_hash: str) -> Tuple[ScryptParameters, bytes, bytes]:
+    if not password_hash.startswith(SCRYPT_HASH_PREFIX):
+        # Legacy hash: hex encoded salt followed by the derived key
+        salted_password_hash = bytes.fromhex(password_hash)
+        return (
+            LEGACY_SCRYPT_PARAMETERS,
+            salted_password_hash[:SALT_LENGTH],
+            salted_password_hash[SALT_LENGTH:],
+        )
+    encoded_hash = password_hash.removeprefix(SCRYPT_HASH_PREFIX)
+    encoded_parameters, encoded_salt, encoded_key = encoded_hash.split("$")
+    values = dict(item.split("=") for item in encoded_parameters.split(","))
+    derived_key = _b64decode(encoded_key)
+    parameters = ScryptParameters(
+        n=2 ** int(values["ln"]),
+        r=int(values["r"]),
+        p=int(values["p"]),
+        dklen=len(derived_key),
     )
+    return parameters, _b64decode(encoded_salt), derived_key
 
 
 def create_token(
-    user_id: UUID4,
+    user_id: UUID,
     context: TokenContext,
     *,
     sso_confirmation_code: Optional[str] = None,
@@ -54,23 +235,25 @@ def create_token(
         ),
     )
     to_encode = token_payload.model_dump()
+    # Keep the sub-second precision of iat to compare it with revocation dates
+    to_encode["iat"] = token_payload.iat.timestamp()
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY)
     return encoded_jwt
 
 
-def create_access_token(user_id: UUID4) -> str:
+def create_access_token(user_id: UUID) -> str:
     expires_delta = timedelta(seconds=settings.ACCESS_TOKEN_EXPIRES_SECONDS)
     return create_token(user_id, TokenContext.ACCESS_TOKEN, expires_delta=expires_delta)
 
 
-def create_refresh_token(user_id: UUID4) -> str:
+def create_refresh_token(user_id: UUID) -> str:
     expires_delta = timedelta(seconds=settings.REFRESH_TOKEN_EXPIRES_SECONDS)
     return create_token(
         user_id, TokenContext.REFRESH_TOKEN, expires_delta=expires_delta
     )
 
 
-def create_sso_confirmation_token(user_id: UUID4, sso_confirmation_code: str) -> str:
+def create_sso_confirmation_token(user_id: UUID, sso_confirmation_code: str) -> str:
     expires_delta = timedelta(seconds=settings.SSO_CONFIRMATION_TOKEN_EXPIRES_SECONDS)
     return create_token(
         user_id,
@@ -80,39 +263,93 @@ def create_sso_confirmation_token(user_id: UUID4, sso_confirmation_code: str) ->
     )
 
 
-def verify_token(token: str, context: TokenContext) -> TokenPayload:
+def decode_token(token: str) -> TokenPayload:
     decoded_token = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-    token_data = TokenPayload(**decoded_token)
+    return TokenPayload(**decoded_token)
+
+
+def decode_token_cached(token: str) -> TokenPayload:
+    cache_key = hashlib.sha256(token.encode()).digest()
+    token_data = token_cache.get(cache_key)
+    if token_data is None:
+        token_data = decode_token(token)
+        # Tokens without expiration are never cached
+        if token_data.exp is not None:
+            expires_at = token_data.exp.timestamp()
+            token_cache.set(cache_key, token_data, expires_at=expires_at)
+    return token_data
+
+
+def verify_token(token: str, context: TokenContext) -> TokenPayload:
+    if settings.TOKEN_CACHE_ENABLED:
+        token_data = decode_token_cached(token)
+    else:
+        token_data = decode_token(token)
     if token_data.context != context:
         raise TokenContextError(token_data.context, context)
     return token_data
 
 
 def verify_password(plain_password: str, password_hash: str) -> bool:
-    # Split the password_hash to extract the salt
-    salted_password_hash = bytes.fromhex(password_hash)
-    stored_salt = salted_password_hash[:16]
-    stored_key = salted_password_hash[16:]
+    # Extract the parameters and the salt used to produce the stored key
+    parameters, stored_salt, stored_key = decode_password_hash(password_hash)
+
+    if password_hash.startswith(SCRYPT_HASH_PREFIX):
+        password = plain_password.encode()
+    else:
+        # Legacy hashes were derived from the repr of the encoded password
+        password = str(plain_password.encode()).encode()
 
     # Derive the key from the provided plain_password and salt
-    derived_key = scrypt(plain_password.encode(), salt=stored_salt)
+    derived_key = scrypt(password, salt=stored_salt, parameters=parameters)
 
-    # Compare the derived key with the stored key
-    return derived_key == stored_key
+    # Compare the derived key with the stored key in constant time
+    return hmac.compare_digest(derived_key, stored_key)
 
 
-def get_password_hash(password: str) -> str:
+def get_password_hash(
+    password: str, parameters: Optional[ScryptParameters] = None
+) -> str:
+    parameters = parameters or current_scrypt_parameters()
+
     # Generate a random salt
-    salt = urandom(16)
+    salt = urandom(SALT_LENGTH)
 
     # Derive the key from the password and salt
-    derived_key = scrypt(str(password).encode(), salt=salt)
+    derived_key = scrypt(str(password).encode(), salt=salt, parameters=parameters)
 
-    # Concatenate the salt and derived key for storage
-    salted_password_hash = salt + derived_key
+    # Store the parameters along with the salt and the derived key
+    return encode_password_hash(parameters, salt, derived_key)
 
-    # Convert the salted password hash to hexadecimal format for storage
-    return salted_password_hash.hex()
+
+def get_password_hashes(
+    passwords: Sequence[str], parameters: Optional[ScryptParameters] = None
+) -> List[str]:
+    return [get_password_hash(password, parameters) for password in passwords]
+
+
+def password_needs_rehash(password_hash: str) -> bool:
+    if not password_hash.startswith(SCRYPT_HASH_PREFIX):
+        return True
+    parameters, _, _ = decode_password_hash(password_hash)
+    return parameters != current_scrypt_parameters()
+
+
+async def verify_password_async(plain_password: str, password_hash: str) -> bool:
+    return await password_hasher.run(verify_password, plain_password, password_hash)
+
+
+async def get_password_hash_async(password: str) -> str:
+    # Parameters are resolved by the caller, not by the hashing process
+    return await password_hasher.run(
+        get_password_hash, password, current_scrypt_parameters()
+    )
+
+
+async def get_password_hashes_async(passwords: Sequence[str]) -> List[str]:
+    return await import_password_hasher.map(
+        get_password_hashes, passwords, current_scrypt_parameters()
+    )
 
 
 def generate_sso_confirmation_code() -> str:
@@ -134,6 +371,7 @@ def generate_password_reset_token(email: str) -> str:
 def verify_password_reset_token(token: str) -> Optional[str]:
     try:
         decoded_token = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        return decoded_token["email"]
     except jwt.PyJWTError:
         return None
+    # The links sent before the email moved to the "sub" claim stay valid
+    return decoded_token.get("sub") or decoded_token.get("email")
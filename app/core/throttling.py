@@ -0,0 +1,176 @@
+import fcntl
+import hashlib
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+# Rejection counter stored at the beginning of the file
+HEADER = struct.Struct("<Q")
+# Key digest, available tokens, time of the last refill
+SLOT = struct.Struct("<16sdd")
+# Number of slots inspected before evicting the least recently refilled one
+PROBES = 8
+
+
+class SharedTokenBuckets:
+    """
+    Token buckets shared by every process of the host.
+
+    The buckets live in a memory mapped file, usually under `/dev/shm`, so that all
+    the gunicorn workers of the host consume from the same buckets. The file is a
+    fixed size hash table: when the table is full the least recently refilled
+    bucket of the probed slots is evicted. Updates are serialized with an
+    exclusive `flock` on the file.
+
+    **Parameters**
+
+    * `path`: Path of the file backing the buckets
+    * `slots`: Number of buckets that can be tracked at the same time
+    * `capacity`: Maximum number of tokens of a bucket, i.e. the allowed burst
+    * `refill_per_second`: Number of tokens added to a bucket every second
+    """
+
+    def __init__(
+        self, path: str, slots: int, capacity: float, refill_per_second: float
+    ):
+        self.path = path
+        self.slots = slots
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._fd: Optional[int] = None
+        self._map: Optional[mmap.mmap] = None
+        self._lock = threading.Lock()
+
+    @property
+    def size(self) -> int:
+        return HEADER.size + self.slots * SLOT.size
+
+    def _open(self) -> mmap.mmap:
+        # Opened lazily so that each forked worker maps the file by itself
+        if self._map is None:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            if os.fstat(fd).st_size < self.size:
+                os.ftruncate(fd, self.size)
+            self._fd = fd
+            self._map = mmap.mmap(fd, self.size)
+        return self._map
+
+    def consume(self, key: str, tokens: int = 1) -> float:
+        """
+        Take `tokens` tokens from the bucket of `key`, `tokens=0` only checks that
+        a token is available.
+
+        Returns 0 when a token was available, otherwise the number of seconds to
+        wait before a token is available.
+        """
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        start = int.from_bytes(digest[:8], "little") % self.slots
+        now = time.time()
+        with self._lock:
+            buffer = self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                offset = self._find_slot(buffer, digest, start)
+                slot_digest, available, updated_at = SLOT.unpack_from(buffer, offset)
+                if slot_digest != digest:
+                    available, updated_at = self.capacity, now
+                elapsed = max(0.0, now - updated_at)
+                available = min(
+                    self.capacity, available + elapsed * self.refill_per_second
+                )
+                retry_after = 0.0
+                if available >= 1:
+                    available -= tokens
+                else:
+                    retry_after = (1 - available) / self.refill_per_second
+                    (rejected,) = HEADER.unpack_from(buffer, 0)
+                    HEADER.pack_into(buffer, 0, rejected + 1)
+                SLOT.pack_into(buffer, offset, digest, available, now)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+        return retry_after
+
+    def _find_slot(self, buffer: mmap.mmap, digest: bytes, start: int) -> int:
+        empty = bytes(16)
+        oldest_offset, oldest_updated_at = 0, float("inf")
+        for probe in range(min(PROBES, self.slots)):
+            offset = HEADER.size + ((start + probe) % self.slots) * SLOT.size
+            slot_digest, _, updated_at = SLOT.unpack_from(buffer, offset)
+            if slot_digest in (digest, empty):
+                return offset
+            if updated_at < oldest_updated_at:
+                oldest_offset, oldest_updated_at = offset, updated_at
+        return oldest_offset
+
+    @property
+    def rejected(self) -> int:
+        with self._lock:
+            (rejected,) = HEADER.unpack_from(self._open(), 0)
+        return rejected
+
+    def reset(self) -> None:
+        with self._lock:
+            buffer = self._open()
+            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            try:
+                buffer[:] = bytes(self.size)
+            finally:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+
+
+class LoginThrottle:
+    """
+    Throttles the endpoints hashing a password by client IP and by email.
+
+    Every attempt takes a token from the bucket of the client IP, while the
+    bucket of the email is only charged by the failed attempts: knowing the
+    email of an account isn't enough to lock its owner out.
+    """
+
+    def __init__(self, directory: str, slots: int):
+        self.by_ip = SharedTokenBuckets(
+            os.path.join(directory, "login-throttle-ip"),
+            slots=slots,
+            capacity=settings.LOGIN_THROTTLE_IP_BURST,
+            refill_per_second=settings.LOGIN_THROTTLE_IP_PER_MINUTE / 60,
+        )
+        self.by_email = SharedTokenBuckets(
+            os.path.join(directory, "login-throttle-email"),
+            slots=slots,
+            capacity=settings.LOGIN_THROTTLE_EMAIL_BURST,
+            refill_per_second=settings.LOGIN_THROTTLE_EMAIL_PER_MINUTE / 60,
+        )
+
+    def check(self, ip: str, email: Optional[str] = None) -> float:
+        """
+        Returns 0 when the attempt is allowed, otherwise the seconds to wait.
+        """
+        retry_after = self.by_ip.consume(ip)
+        if not retry_after and email:
+            retry_after = self.by_email.consume(email.lower(), tokens=0)
+        return retry_after
+
+    def record_failure(self, email: str) -> None:
+        self.by_email.consume(email.lower())
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rejected_by_ip": self.by_ip.rejected,
+            "rejected_by_email": self.by_email.rejected,
+        }
+
+
+def shared_memory_directory() -> str:
+    directory = settings.LOGIN_THROTTLE_DIR
+    return directory if os.path.isdir(directory) else tempfile.gettempdir()
+
+
+login_throttle = LoginThrottle(
+    shared_memory_directory(), slots=settings.LOGIN_THROTTLE_SLOTS
+)
@@ -1,6 +1,9 @@
 from .crud_file import file
 from .crud_item import item
+from .crud_revoked_token import revoked_token
 from .crud_user import user
+from .crud_user_import import user_import
+from .crud_user_stats import user_stats
 
 # For a new basic set of CRUD operations you could just do
 
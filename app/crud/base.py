@@ -1,53 +1,344 @@
+import json
 from datetime import datetime
-from typing import Any, Dict, Generic, List, Optional, Type, TypeVar, Union
+from itertools import chain
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Generic,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+from uuid import UUID
 
 from fastapi.encoders import jsonable_encoder
 from pydantic import BaseModel
-from pydantic.types import UUID4
+from sqlalchemy import (
+    Delete,
+    Insert,
+    Row,
+    Select,
+    Update,
+    and_,
+    delete,
+    event,
+    func,
+    insert,
+    inspect,
+    or_,
+    select,
+    tuple_,
+    update,
+)
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Query, Session
-from sqlalchemy.sql.expression import false
+from sqlalchemy.orm.interfaces import ORMOption
+from sqlalchemy.sql.base import Executable
+from sqlalchemy.sql.elements import ClauseElement
 
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.pagination import (
+    decode_cursor,
+    decode_ranked_cursor,
+    encode_cursor,
+    encode_ranked_cursor,
+)
 from app.db.base_class import Base
+from app.db.routing import USE_REPLICA
 from app.models.archivable import Archivable
 
 ModelType = TypeVar("ModelType", bound=Base)
 CreateSchemaType = TypeVar("CreateSchemaType", bound=BaseModel)
 UpdateSchemaType = TypeVar("UpdateSchemaType", bound=BaseModel)
+# Rows of a page and the cursor of the next page, None on the last page
+Page = Tuple[List[ModelType], Optional[str]]
+# Number of rows and whether it was counted exactly or estimated by the planner
+Count = Tuple[int, bool]
+# Versions of the rows of a page and the cursor of the next page
+VersionsPage = Tuple[List[Row], Optional[str]]
 
 
-def apply_changes(db: Session, db_item: ModelType) -> None:
-    db.add(db_item)
-    db.commit()
-    db.refresh(db_item)
+# Session info flag of the sessions committed once by their owner, the CRUD
+# methods only flush their changes to them
+UNIT_OF_WORK = "unit_of_work"
+# Session info key of the callbacks waiting for the commit of a unit of work
+COMMIT_CALLBACKS = "commit_callbacks"
+# Session info key of the tables written by the current transaction
+WRITTEN_TABLES = "written_tables"
+
+# Cached counts of each table, keyed by the SQL of the counted rows
+count_caches: Dict[str, TTLCache[str, Count]] = {}
+
+
+def apply_changes(db: Session, db_item: Optional[ModelType] = None) -> None:
+    """
+    Send the changes to the database, the server defaults of `db_item` are
+    fetched back by the INSERT or UPDATE statement (`eager_defaults`).
+    """
+    if db_item is not None:
+        db.add(db_item)
+    if db.info.get(UNIT_OF_WORK):
+        db.flush()
+    else:
+        db.commit()
+
+
+def page_size(limit: int) -> int:
+    return max(1, min(limit, settings.MAX_PAGE_SIZE))
+
+
+def on_commit(db: Union[Session, AsyncSession], callback: Callable[[], Any]) -> None:
+    """
+    Run `callback` once the changes sent to `db` are committed.
+    """
+    if db.info.get(UNIT_OF_WORK):
+        db.info.setdefault(COMMIT_CALLBACKS, []).append(callback)
+    else:
+        callback()
+
+
+@event.listens_for(Session, "after_flush")
+def record_flushed_tables(session: Session, flush_context: Any) -> None:
+    tables = session.info.setdefault(WRITTEN_TABLES, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        tables.add(obj.__table__.name)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def record_written_tables(orm_execute_state: Any) -> None:
+    # Bulk INSERT, UPDATE and DELETE statements bypass the flush
+    if (
+        orm_execute_state.is_insert
+        or orm_execute_state.is_update
+        or (orm_execute_state.is_delete)
+    ):
+        tables = orm_execute_state.session.info.setdefault(WRITTEN_TABLES, set())
+        tables.add(orm_execute_state.statement.table.name)
+
+
+@event.listens_for(Session, "after_commit")
+def run_commit_callbacks(session: Session) -> None:
+    for table in session.info.pop(WRITTEN_TABLES, ()):
+        if table in count_caches:
+            count_caches[table].clear()
+    for callback in session.info.pop(COMMIT_CALLBACKS, []):
+        callback()
+
+
+@event.listens_for(Session, "after_rollback")
+def discard_commit_callbacks(session: Session) -> None:
+    session.info.pop(WRITTEN_TABLES, None)
+    session.info.pop(COMMIT_CALLBACKS, None)
+
+
+class explain(Executable, ClauseElement):
+    """
+    `EXPLAIN (FORMAT JSON)` of a statement, its parameters bound by the driver.
+    """
+
+    # Compiled on the misses of the count cache only
+    inherit_cache = False
+
+    def __init__(self, statement: Select) -> None:
+        self.statement = statement
+
+
+@compiles(explain, "postgresql")
+def pg_explain(element, compiler, **kw):
+    return "EXPLAIN (FORMAT JSON) " + compiler.process(element.statement, **kw)
+
+
+def count_sql(query: Select) -> str:
+    # Parameters rendered inline, the SQL is the cache key and is explained
+    return str(
+        query.compile(
+            dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+        )
+    )
+
+
+def estimated_rows(plan: Any) -> int:
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+async def apply_changes_async(
+    db: AsyncSession, db_item: Optional[ModelType] = None
+) -> None:
+    if db_item is not None:
+        db.add(db_item)
+    if db.info.get(UNIT_OF_WORK):
+        await db.flush()
+    else:
+        await db.commit()
+
+
+# Bind arguments of the reads that a replica can serve
+REPLICA_READ = {USE_REPLICA: True}
+# Bind arguments of the reads that must see the latest writes, on the primary
+PRIMARY_READ = {USE_REPLICA: False}
+
 
 class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
-    def __init__(self, model: Type[ModelType]):
+    def __init__(
+        self,
+        model: Type[ModelType],
+        loader_options: Sequence[ORMOption] = (),
+        version_columns: Sequence[Any] = (),
+    ):
         """
         CRUD object with default methods to Create, Read, Update, Delete (CRUD).
 
         **Parameters**
 
         * `model`: A SQLAlchemy model class
-        * `schema`: A Pydantic model (schema) class
+        * `loader_options`: Loader strategies of the relationships serialized by
+        the response schemas, applied to every query loading the objects
+        * `version_columns`: Expressions selected with the id and the dates of
+        the rows by the version probes, for the serialized data not stored in
+        the row itself
+
+        Every method has an `_async` counterpart working with an `AsyncSession`.
         """
         self.model = model
+        # Mapped columns, read once from the mapper to find the fields of the
+        # updates without inspecting the objects
+        self.columns = frozenset(inspect(model).column_attrs.keys())
+        self.loader_options = tuple(loader_options)
+        self.version_columns = tuple(version_columns)
+        # Built once, SQLAlchemy reuses the compiled form cached for them. The
+        # loader options are ignored by the queries selecting columns only
+        self.select_all: Select = select(model).options(*self.loader_options)
+        self.select_active: Select = self.filter_archivable(self.select_all)
+        self.counts: TTLCache[str, Count] = TTLCache(
+            maxsize=settings.COUNT_CACHE_SIZE, ttl=settings.COUNT_CACHE_TTL_SECONDS
+        )
+        count_caches[model.__table__.name] = self.counts
 
-    def filter_archivable(self, query: Query, with_archived: bool = False):
+    def filter_archivable(
+        self, query: Union[Query, Select, Update, Delete], with_archived: bool = False
+    ):
         if issubclass(self.model, Archivable) and not with_archived:
-            query = query.filter(self.model.archived == false())
+            # Same predicate as the partial indexes of the active rows
+            query = query.filter(self.model.archived_at.is_(None))
         return query
 
+    def select(self, with_archived: bool = False) -> Select:
+        return self.select_all if with_archived else self.select_active
+
+    def exclude_archived(
+        self, obj: Optional[ModelType], with_archived: bool = False
+    ) -> Optional[ModelType]:
+        if (
+            obj is not None
+            and issubclass(self.model, Archivable)
+            and not with_archived
+            and obj.archived
+        ):
+            return None
+        return obj
+
+    def paginate(
+        self,
+        query: Select,
+        *,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> Select:
+        """
+        Page of `query` ordered by `(created_at, id)` starting after the row of
+        `cursor`, or at the offset `skip` without cursor. One more row than the
+        page size is selected to know if a next page exists.
+
+        Raises a `ValueError` on an invalid cursor.
+        """
+        model = self.model
+        query = query.order_by(model.created_at, model.id)
+        query = query.limit(page_size(limit) + 1)
+        if cursor is None:
+            return query.offset(skip)
+        # Row value comparison, served by the (created_at, id) indexes
+        return query.where(tuple_(model.created_at, model.id) > decode_cursor(cursor))
+
+    def to_page(self, rows: List[ModelType], limit: int) -> Page:
+        size = page_size(limit)
+        if len(rows) <= size:
+            return rows, None
+        rows = rows[:size]
+        return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
+
+    def paginate_ranked(
+        self,
+        query: Select,
+        rank: Any,
+        *,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Select:
+        """
+        Page of `query` selecting `rank` with the objects, ordered by decreasing
+        `rank` then by `(created_at, id)`, starting after the row of `cursor`.
+
+        Raises a `ValueError` on an invalid cursor.
+        """
+        model = self.model
+        query = query.add_columns(rank)
+        if cursor is not None:
+            last_rank, created_at, id = decode_ranked_cursor(cursor)
+            query = query.where(
+                or_(
+                    rank < last_rank,
+                    and_(
+                        rank == last_rank,
+                        tuple_(model.created_at, model.id) > (created_at, id),
+                    ),
+                )
+            )
+        query = query.order_by(rank.desc(), model.created_at, model.id)
+        return query.limit(page_size(limit) + 1)
+
+    def to_ranked_page(self, rows: List[Row], limit: int) -> Page:
+        size = page_size(limit)
+        objs = [obj for obj, _ in rows[:size]]
+        if len(rows) <= size:
+            return objs, None
+        obj, rank = rows[size - 1]
+        return objs, encode_ranked_cursor(rank, obj.created_at, obj.id)
+
     def get(
-        self, db: Session, id: UUID4, with_archived: bool = False
+        self,
+        db: Session,
+        id: UUID,
+        with_archived: bool = False,
+        primary: bool = False,
     ) -> Optional[ModelType]:
-        query: Query = db.query(self.model).filter(self.model.id == id)
-        query = self.filter_archivable(query, with_archived)
-        return query.first()
+        """
+        Object `id`, read from the primary when `primary` is set. An object
+        already in the identity map is returned without a query.
+        """
+        obj = db.get(
+            self.model,
+            id,
+            options=self.loader_options,
+            bind_arguments=PRIMARY_READ if primary else REPLICA_READ,
+        )
+        return self.exclude_archived(obj, with_archived)
 
     def get_all(self, db: Session, with_archived: bool = False) -> List[ModelType]:
-        query = db.query(self.model)
-        query = self.filter_archivable(query, with_archived)
-        return query.all()
+        query = self.select(with_archived)
+        return list(db.scalars(query, bind_arguments=REPLICA_READ))
 
     def get_multi(
         self,
@@ -55,11 +346,138 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         *,
         skip: int = 0,
         limit: int = 100,
-        with_archived: bool = False
+        with_archived: bool = False,
     ) -> List[ModelType]:
-        query = db.query(self.model)
-        query = self.filter_archivable(query, with_archived)
-        return query.offset(skip).limit(limit).all()
+        rows, _ = self.get_page(db, skip=skip, limit=limit, with_archived=with_archived)
+        return rows
+
+    def get_page(
+        self,
+        db: Session,
+        *,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        with_archived: bool = False,
+    ) -> Page:
+        query = self.paginate(
+            self.select(with_archived), cursor=cursor, skip=skip, limit=limit
+        )
+        rows = list(db.scalars(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
+
+    def get_version(
+        self,
+        db: Session,
+        id: UUID,
+        *,
+        columns: Sequence[Any] = (),
+        with_archived: bool = False,
+    ) -> Optional[Row]:
+        """
+        Version of the row `id` with the extra `columns`, None if it doesn't
+        exist. The rest of the row is not loaded.
+        """
+        query = self.versions(self.select(with_archived), columns)
+        return db.execute(
+            query.where(self.model.id == id), bind_arguments=REPLICA_READ
+        ).first()
+
+    def get_page_versions(
+        self,
+        db: Session,
+        *,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        with_archived: bool = False,
+    ) -> VersionsPage:
+        """
+        Versions of the rows of the page returned by `get_page`.
+        """
+        query = self.paginate(
+            self.versions(self.select(with_archived)),
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+        )
+        rows = list(db.execute(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
+
+    def versions(self, query: Select, columns: Sequence[Any] = ()) -> Select:
+        """
+        `query` selecting only the id and the creation and last update dates of
+        the rows, a narrow probe of whether they changed.
+        """
+        model = self.model
+        return query.with_only_columns(
+            model.id,
+            model.created_at,
+            model.updated_at,
+            *self.version_columns,
+            *columns,
+            maintain_column_froms=True,
+        )
+
+    def stream(
+        self,
+        db: Session,
+        columns: Sequence[Any],
+        *,
+        with_archived: bool = False,
+        batch_size: int = 1000,
+    ) -> Iterator[Sequence[Row]]:
+        """
+        Rows of `columns` ordered by `(created_at, id)`, fetched by batches of
+        `batch_size` through a server-side cursor.
+        """
+        result = db.execute(
+            self._stream_query(columns, with_archived),
+            execution_options={"yield_per": batch_size},
+            bind_arguments=REPLICA_READ,
+        )
+        try:
+            yield from result.partitions()
+        finally:
+            result.close()
+
+    def _stream_query(self, columns: Sequence[Any], with_archived: bool) -> Select:
+        query = self.select(with_archived).with_only_columns(
+            *columns, maintain_column_froms=True
+        )
+        return query.order_by(self.model.created_at, self.model.id)
+
+    def count(self, db: Session, with_archived: bool = False) -> Count:
+        return self.count_rows(db, self.select(with_archived))
+
+    def count_rows(self, db: Session, query: Select) -> Count:
+        """
+        Number of rows selected by `query`. The planner estimates it first, and
+        the rows are only counted when the estimate is at most
+        `COUNT_EXACT_THRESHOLD`.
+        """
+        rows = self._counted_rows(query)
+        sql = count_sql(rows)
+        count = self.counts.get(sql)
+        if count is None:
+            plan = db.scalar(explain(rows), bind_arguments=REPLICA_READ)
+            estimate = estimated_rows(plan)
+            if estimate > settings.COUNT_EXACT_THRESHOLD:
+                count = (estimate, False)
+            else:
+                total = db.scalar(self._count_query(rows), bind_arguments=REPLICA_READ)
+                count = (total, True)
+            self.counts.set(sql, count)
+        return count
+
+    def _counted_rows(self, query: Select) -> Select:
+        # The ids only, without the ordering and the eagerly joined relationships
+        return query.with_only_columns(
+            self.model.id, maintain_column_froms=True
+        ).order_by(None)
+
+    def _count_query(self, rows: Select) -> Select:
+        return rows.with_only_columns(func.count(), maintain_column_froms=True)
 
     def create(self, db: Session, *, obj_in: CreateSchemaType) -> ModelType:
         obj_in_data = jsonable_encoder(obj_in)
@@ -72,22 +490,72 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
         db: Session,
         *,
         db_obj: ModelType,
-        obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
     ) -> ModelType:
-        obj_data = jsonable_encoder(db_obj)
+        # Nothing is sent to the database when no value changed
+        if self._set_fields(db_obj, obj_in):
+            apply_changes(db, db_obj)
+        return db_obj
+
+    def _set_fields(
+        self, db_obj: ModelType, obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> bool:
+        """
+        Set the columns of `db_obj` changed by `obj_in`, and return whether any
+        of them changed. The unloaded columns are set without being compared.
+        """
         if isinstance(obj_in, dict):
             update_data = obj_in
         else:
             update_data = obj_in.model_dump(exclude_unset=True)
-        for field in obj_data:
-            if field in update_data:
-                setattr(db_obj, field, update_data[field])
-        apply_changes(db, db_obj)
+        loaded = inspect(db_obj).dict
+        changed = False
+        for field in self.columns.intersection(update_data):
+            value = update_data[field]
+            if field not in loaded or loaded[field] != value:
+                setattr(db_obj, field, value)
+                changed = True
+        return changed
+
+    def update_by_id(
+        self,
+        db: Session,
+        *,
+        id: UUID,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        criteria: Sequence[Any] = (),
+    ) -> Optional[ModelType]:
+        """
+        Update the active row `id` matching `criteria` with a single
+        UPDATE ... RETURNING, without loading it first. Returns None when no
+        row matched, or when no value changed: the row is then left untouched.
+        The loader options are not applied to the returned object.
+        """
+        query = self._update_one(id, obj_in, criteria)
+        if query is None:
+            return None
+        db_obj = db.scalars(query).one_or_none()
+        if db_obj is not None:
+            apply_changes(db)
+        return db_obj
+
+    def remove_by_id(
+        self, db: Session, *, id: UUID, criteria: Sequence[Any] = ()
+    ) -> Optional[ModelType]:
+        """
+        Delete the active row `id` matching `criteria` with a single
+        DELETE ... RETURNING. Returns None when no row matched.
+        """
+        db_obj = db.scalars(self._delete_one(id, criteria)).one_or_none()
+        if db_obj is not None:
+            # Detached as by Session.delete, the commit doesn't expire it
+            db.expunge(db_obj)
+            apply_changes(db)
         return db_obj
 
     def remove(self, db: Session, obj: ModelType) -> ModelType:
         db.delete(obj)
-        db.commit()
+        apply_changes(db)
         return obj
 
     def archive(self, db: Session, obj: ModelType) -> ModelType:
@@ -101,3 +569,373 @@ class CRUDBase(Generic[ModelType, CreateSchemaType, UpdateSchemaType]):
             obj.archived_at = None
             apply_changes(db, obj)
         return obj
+
+    def create_multi(
+        self,
+        db: Session,
+        *,
+        objs_in: Sequence[CreateSchemaType],
+        values: Optional[Dict[str, Any]] = None,
+    ) -> List[ModelType]:
+        """
+        Insert the objects with `values` set on each of them. SQLAlchemy sends
+        them in batches of multi-row INSERT ... RETURNING (insertmanyvalues).
+        """
+        query, rows = self._insert_multi(objs_in, values)
+        db_objs = list(db.scalars(query, rows))
+        apply_changes(db)
+        return db_objs
+
+    def update_multi(
+        self,
+        db: Session,
+        *,
+        ids: Sequence[UUID],
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        criteria: Sequence[Any] = (),
+    ) -> List[UUID]:
+        """
+        Apply the same changes to the active rows of `ids` matching `criteria`
+        with a single UPDATE, and return the ids of the updated rows. The rows
+        already holding the changes are left untouched and not returned.
+        """
+        query = self._update_multi(ids, obj_in, criteria)
+        if query is None:
+            return []
+        ids = list(db.scalars(query))
+        apply_changes(db)
+        return ids
+
+    def archive_multi(
+        self, db: Session, *, ids: Sequence[UUID], criteria: Sequence[Any] = ()
+    ) -> List[UUID]:
+        query = self._archive_multi(ids, datetime.utcnow(), criteria)
+        ids = list(db.scalars(query))
+        apply_changes(db)
+        return ids
+
+    def unarchive_multi(
+        self, db: Session, *, ids: Sequence[UUID], criteria: Sequence[Any] = ()
+    ) -> List[UUID]:
+        ids = list(db.scalars(self._archive_multi(ids, None, criteria)))
+        apply_changes(db)
+        return ids
+
+    def remove_multi(
+        self, db: Session, *, ids: Sequence[UUID], criteria: Sequence[Any] = ()
+    ) -> List[UUID]:
+        ids = list(db.scalars(self._delete_multi(ids, criteria)))
+        apply_changes(db)
+        return ids
+
+    def _insert_multi(
+        self,
+        objs_in: Sequence[CreateSchemaType],
+        values: Optional[Dict[str, Any]],
+    ) -> Tuple[Insert, List[Dict[str, Any]]]:
+        rows = [{**obj_in.model_dump(), **(values or {})} for obj_in in objs_in]
+        query = insert(self.model).returning(self.model, sort_by_parameter_order=True)
+        return query, rows
+
+    def _changes(
+        self, obj_in: Union[UpdateSchemaType, Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        if isinstance(obj_in, dict):
+            update_data = obj_in
+        else:
+            update_data = obj_in.model_dump(exclude_unset=True)
+        return {
+            field: update_data[field]
+            for field in self.columns.intersection(update_data)
+        }
+
+    def _changed(self, changes: Dict[str, Any]) -> Any:
+        # An unchanged row is not matched, its updated_at is not bumped
+        return or_(
+            *(
+                getattr(self.model, field).is_distinct_from(value)
+                for field, value in changes.items()
+            )
+        )
+
+    def _update_multi(
+        self,
+        ids: Sequence[UUID],
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        criteria: Sequence[Any],
+    ) -> Optional[Update]:
+        changes = self._changes(obj_in)
+        if not changes:
+            return None
+        model = self.model
+        query = update(model).where(
+            model.id.in_(ids), self._changed(changes), *criteria
+        )
+        return self.filter_archivable(query).values(**changes).returning(model.id)
+
+    def _update_one(
+        self,
+        id: UUID,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        criteria: Sequence[Any],
+    ) -> Optional[Update]:
+        changes = self._changes(obj_in)
+        if not changes:
+            return None
+        model = self.model
+        query = update(model).where(model.id == id, self._changed(changes), *criteria)
+        return self.filter_archivable(query).values(**changes).returning(model)
+
+    def _delete_one(self, id: UUID, criteria: Sequence[Any]) -> Delete:
+        query = delete(self.model).where(self.model.id == id, *criteria)
+        return self.filter_archivable(query).returning(self.model)
+
+    def _archive_multi(
+        self,
+        ids: Sequence[UUID],
+        archived_at: Optional[datetime],
+        criteria: Sequence[Any],
+    ) -> Update:
+        if not issubclass(self.model, Archivable):
+            raise TypeError(f"{self.model.__name__} is not archivable")
+        query = update(self.model).where(self.model.id.in_(ids), *criteria)
+        # Only the active rows are archived, any row can be unarchived
+        if archived_at is not None:
+            query = self.filter_archivable(query)
+        return query.values(archived_at=archived_at).returning(self.model.id)
+
+    def _delete_multi(self, ids: Sequence[UUID], criteria: Sequence[Any]) -> Delete:
+        query = delete(self.model).where(self.model.id.in_(ids), *criteria)
+        return self.filter_archivable(query).returning(self.model.id)
+
+    async def get_async(
+        self,
+        db: AsyncSession,
+        id: UUID,
+        with_archived: bool = False,
+        primary: bool = False,
+    ) -> Optional[ModelType]:
+        # AsyncSession.get doesn't take bind arguments
+        obj = await db.run_sync(
+            Session.get,
+            self.model,
+            id,
+            options=self.loader_options,
+            bind_arguments=PRIMARY_READ if primary else REPLICA_READ,
+        )
+        return self.exclude_archived(obj, with_archived)
+
+    async def get_all_async(
+        self, db: AsyncSession, with_archived: bool = False
+    ) -> List[ModelType]:
+        query = self.select(with_archived)
+        return list(await db.scalars(query, bind_arguments=REPLICA_READ))
+
+    async def get_multi_async(
+        self,
+        db: AsyncSession,
+        *,
+        skip: int = 0,
+        limit: int = 100,
+        with_archived: bool = False,
+    ) -> List[ModelType]:
+        rows, _ = await self.get_page_async(
+            db, skip=skip, limit=limit, with_archived=with_archived
+        )
+        return rows
+
+    async def get_page_async(
+        self,
+        db: AsyncSession,
+        *,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        with_archived: bool = False,
+    ) -> Page:
+        query = self.paginate(
+            self.select(with_archived), cursor=cursor, skip=skip, limit=limit
+        )
+        rows = list(await db.scalars(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
+
+    async def get_version_async(
+        self,
+        db: AsyncSession,
+        id: UUID,
+        *,
+        columns: Sequence[Any] = (),
+        with_archived: bool = False,
+    ) -> Optional[Row]:
+        query = self.versions(self.select(with_archived), columns)
+        result = await db.execute(
+            query.where(self.model.id == id), bind_arguments=REPLICA_READ
+        )
+        return result.first()
+
+    async def get_page_versions_async(
+        self,
+        db: AsyncSession,
+        *,
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+        with_archived: bool = False,
+    ) -> VersionsPage:
+        query = self.paginate(
+            self.versions(self.select(with_archived)),
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+        )
+        rows = list(await db.execute(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
+
+    async def stream_async(
+        self,
+        db: AsyncSession,
+        columns: Sequence[Any],
+        *,
+        with_archived: bool = False,
+        batch_size: int = 1000,
+    ) -> AsyncIterator[Sequence[Row]]:
+        result = await db.stream(
+            self._stream_query(columns, with_archived),
+            execution_options={"yield_per": batch_size},
+            bind_arguments=REPLICA_READ,
+        )
+        try:
+            async for rows in result.partitions():
+                yield rows
+        finally:
+            await result.close()
+
+    async def count_async(self, db: AsyncSession, with_archived: bool = False) -> Count:
+        return await self.count_rows_async(db, self.select(with_archived))
+
+    async def count_rows_async(self, db: AsyncSession, query: Select) -> Count:
+        rows = self._counted_rows(query)
+        sql = count_sql(rows)
+        count = self.counts.get(sql)
+        if count is None:
+            plan = await db.scalar(explain(rows), bind_arguments=REPLICA_READ)
+            estimate = estimated_rows(plan)
+            if estimate > settings.COUNT_EXACT_THRESHOLD:
+                count = (estimate, False)
+            else:
+                total = await db.scalar(
+                    self._count_query(rows), bind_arguments=REPLICA_READ
+                )
+                count = (total, True)
+            self.counts.set(sql, count)
+        return count
+
+    async def create_async(
+        self, db: AsyncSession, *, obj_in: CreateSchemaType
+    ) -> ModelType:
+        obj_in_data = jsonable_encoder(obj_in)
+        db_obj = self.model(**obj_in_data)  # type: ignore
+        await apply_changes_async(db, db_obj)
+        return db_obj
+
+    async def update_async(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: ModelType,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+    ) -> ModelType:
+        if self._set_fields(db_obj, obj_in):
+            await apply_changes_async(db, db_obj)
+        return db_obj
+
+    async def update_by_id_async(
+        self,
+        db: AsyncSession,
+        *,
+        id: UUID,
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        criteria: Sequence[Any] = (),
+    ) -> Optional[ModelType]:
+        query = self._update_one(id, obj_in, criteria)
+        if query is None:
+            return None
+        db_obj = (await db.scalars(query)).one_or_none()
+        if db_obj is not None:
+            await apply_changes_async(db)
+        return db_obj
+
+    async def remove_by_id_async(
+        self, db: AsyncSession, *, id: UUID, criteria: Sequence[Any] = ()
+    ) -> Optional[ModelType]:
+        db_obj = (await db.scalars(self._delete_one(id, criteria))).one_or_none()
+        if db_obj is not None:
+            db.expunge(db_obj)
+            await apply_changes_async(db)
+        return db_obj
+
+    async def remove_async(self, db: AsyncSession, obj: ModelType) -> ModelType:
+        await db.delete(obj)
+        await apply_changes_async(db)
+        return obj
+
+    async def archive_async(self, db: AsyncSession, obj: ModelType) -> ModelType:
+        if issubclass(self.model, Archivable):
+            obj.archived_at = datetime.utcnow()
+            await apply_changes_async(db, obj)
+        return obj
+
+    async def unarchive_async(self, db: AsyncSession, obj: ModelType) -> ModelType:
+        if issubclass(self.model, Archivable):
+            obj.archived_at = None
+            await apply_changes_async(db, obj)
+        return obj
+
+    async def create_multi_async(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: Sequence[CreateSchemaType],
+        values: Optional[Dict[str, Any]] = None,
+    ) -> List[ModelType]:
+        query, rows = self._insert_multi(objs_in, values)
+        db_objs = list(await db.scalars(query, rows))
+        await apply_changes_async(db)
+        return db_objs
+
+    async def update_multi_async(
+        self,
+        db: AsyncSession,
+        *,
+        ids: Sequence[UUID],
+        obj_in: Union[UpdateSchemaType, Dict[str, Any]],
+        criteria: Sequence[Any] = (),
+    ) -> List[UUID]:
+        query = self._update_multi(ids, obj_in, criteria)
+        if query is None:
+            return []
+        ids = list(await db.scalars(query))
+        await apply_changes_async(db)
+        return ids
+
+    async def archive_multi_async(
+        self, db: AsyncSession, *, ids: Sequence[UUID], criteria: Sequence[Any] = ()
+    ) -> List[UUID]:
+        query = self._archive_multi(ids, datetime.utcnow(), criteria)
+        ids = list(await db.scalars(query))
+        await apply_changes_async(db)
+        return ids
+
+    async def unarchive_multi_async(
+        self, db: AsyncSession, *, ids: Sequence[UUID], criteria: Sequence[Any] = ()
+    ) -> List[UUID]:
+        ids = list(await db.scalars(self._archive_multi(ids, None, criteria)))
+        await apply_changes_async(db)
+        return ids
+
+    async def remove_multi_async(
+        self, db: AsyncSession, *, ids: Sequence[UUID], criteria: Sequence[Any] = ()
+    ) -> List[UUID]:
+        ids = list(await db.scalars(self._delete_multi(ids, criteria)))
+        await apply_changes_async(db)
+        return ids
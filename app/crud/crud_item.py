@@ -1,33 +1,336 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Sequence, Union
+from uuid import UUID
 
+from fastapi.encoders import jsonable_encoder
+from sqlalchemy import Select, cast, func, select
+from sqlalchemy.dialects.postgresql import DOUBLE_PRECISION, REGCONFIG
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app.crud.base import CRUDBase
-from app.models import Item, User
-from app.schemas import ItemCreate, ItemUpdate
+from app.models import Item, Language, User
+from app.models.item import TEXT_SEARCH_CONFIGS
+from app.schemas import ItemCreate, ItemUpdate, Principal
 
-from .base import apply_changes
+from .base import REPLICA_READ, Page, VersionsPage, apply_changes, apply_changes_async
 
 
 class CRUDItem(CRUDBase[Item, ItemCreate, ItemUpdate]):
+    def _build_item(
+        self, obj_in: ItemCreate, user: Optional[Union[User, Principal]]
+    ) -> Item:
+        # The owner is set before the INSERT, a single statement creates the item
+        return Item(**jsonable_encoder(obj_in), user_id=user.id)
+
     def create_with_user(
-        self, db: Session, *, obj_in: ItemCreate, user: Optional[User]
+        self, db: Session, *, obj_in: ItemCreate, user: Optional[Union[User, Principal]]
     ) -> Item:
-        db_item = self.create(db, obj_in=obj_in)
-        db_item.user_id = user.id
+        db_item = self._build_item(obj_in, user)
         apply_changes(db, db_item)
         return db_item
 
+    async def create_with_user_async(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: ItemCreate,
+        user: Optional[Union[User, Principal]],
+    ) -> Item:
+        db_item = self._build_item(obj_in, user)
+        await apply_changes_async(db, db_item)
+        return db_item
+
+    def create_multi_with_user(
+        self,
+        db: Session,
+        *,
+        objs_in: Sequence[ItemCreate],
+        user: Union[User, Principal],
+    ) -> List[Item]:
+        return self.create_multi(db, objs_in=objs_in, values={"user_id": user.id})
+
+    async def create_multi_with_user_async(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: Sequence[ItemCreate],
+        user: Union[User, Principal],
+    ) -> List[Item]:
+        return await self.create_multi_async(
+            db, objs_in=objs_in, values={"user_id": user.id}
+        )
+
+    def update_owned(
+        self,
+        db: Session,
+        *,
+        id: UUID,
+        obj_in: Union[ItemUpdate, Dict[str, Any]],
+        user: Union[User, Principal],
+    ) -> Optional[Item]:
+        """
+        Update the item `id` if `user` can modify it, None otherwise, with the
+        ownership checked by the UPDATE itself.
+        """
+        return self.update_by_id(
+            db, id=id, obj_in=obj_in, criteria=self._ownership(user)
+        )
+
+    def remove_owned(
+        self, db: Session, *, id: UUID, user: Union[User, Principal]
+    ) -> Optional[Item]:
+        return self.remove_by_id(db, id=id, criteria=self._ownership(user))
+
+    async def update_owned_async(
+        self,
+        db: AsyncSession,
+        *,
+        id: UUID,
+        obj_in: Union[ItemUpdate, Dict[str, Any]],
+        user: Union[User, Principal],
+    ) -> Optional[Item]:
+        return await self.update_by_id_async(
+            db, id=id, obj_in=obj_in, criteria=self._ownership(user)
+        )
+
+    async def remove_owned_async(
+        self, db: AsyncSession, *, id: UUID, user: Union[User, Principal]
+    ) -> Optional[Item]:
+        return await self.remove_by_id_async(db, id=id, criteria=self._ownership(user))
+
+    def update_multi_owned(
+        self,
+        db: Session,
+        *,
+        ids: Sequence[UUID],
+        obj_in: Union[ItemUpdate, Dict[str, Any]],
+        user: Union[User, Principal],
+    ) -> List[UUID]:
+        """
+        Update the items of `ids` that `user` can modify, and return the ids of
+        the updated items, with the ownership checked by the UPDATE itself.
+        """
+        return self.update_multi(
+            db, ids=ids, obj_in=obj_in, criteria=self._ownership(user)
+        )
+
+    def archive_multi_owned(
+        self, db: Session, *, ids: Sequence[UUID], user: Union[User, Principal]
+    ) -> List[UUID]:
+        return self.archive_multi(db, ids=ids, criteria=self._ownership(user))
+
+    def unarchive_multi_owned(
+        self, db: Session, *, ids: Sequence[UUID], user: Union[User, Principal]
+    ) -> List[UUID]:
+        return self.unarchive_multi(db, ids=ids, criteria=self._ownership(user))
+
+    def remove_multi_owned(
+        self, db: Session, *, ids: Sequence[UUID], user: Union[User, Principal]
+    ) -> List[UUID]:
+        return self.remove_multi(db, ids=ids, criteria=self._ownership(user))
+
+    async def update_multi_owned_async(
+        self,
+        db: AsyncSession,
+        *,
+        ids: Sequence[UUID],
+        obj_in: Union[ItemUpdate, Dict[str, Any]],
+        user: Union[User, Principal],
+    ) -> List[UUID]:
+        return await self.update_multi_async(
+            db, ids=ids, obj_in=obj_in, criteria=self._ownership(user)
+        )
+
+    async def archive_multi_owned_async(
+        self, db: AsyncSession, *, ids: Sequence[UUID], user: Union[User, Principal]
+    ) -> List[UUID]:
+        return await self.archive_multi_async(
+            db, ids=ids, criteria=self._ownership(user)
+        )
+
+    async def unarchive_multi_owned_async(
+        self, db: AsyncSession, *, ids: Sequence[UUID], user: Union[User, Principal]
+    ) -> List[UUID]:
+        return await self.unarchive_multi_async(
+            db, ids=ids, criteria=self._ownership(user)
+        )
+
+    async def remove_multi_owned_async(
+        self, db: AsyncSession, *, ids: Sequence[UUID], user: Union[User, Principal]
+    ) -> List[UUID]:
+        return await self.remove_multi_async(
+            db, ids=ids, criteria=self._ownership(user)
+        )
+
+    def _ownership(self, user: Union[User, Principal]) -> List[Any]:
+        # Admin users can modify any item
+        return [] if user.is_admin else [Item.user_id == user.id]
+
+    def search(
+        self,
+        db: Session,
+        *,
+        text: str,
+        language: Language,
+        user: Optional[Union[User, Principal]] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Page:
+        """
+        Active items matching `text` in the web search syntax (quoted phrases,
+        `or`, `-` to exclude a word), the items of `user` only when given. The
+        items are ordered by decreasing relevance, `language` selects the text
+        search configuration of the query.
+
+        Raises a `ValueError` on an invalid cursor.
+        """
+        query = self._search_query(text, language, user, cursor, limit)
+        rows = db.execute(query, bind_arguments=REPLICA_READ).all()
+        return self.to_ranked_page(rows, limit)
+
+    async def search_async(
+        self,
+        db: AsyncSession,
+        *,
+        text: str,
+        language: Language,
+        user: Optional[Union[User, Principal]] = None,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Page:
+        query = self._search_query(text, language, user, cursor, limit)
+        rows = (await db.execute(query, bind_arguments=REPLICA_READ)).all()
+        return self.to_ranked_page(rows, limit)
+
+    def _search_query(
+        self,
+        text: str,
+        language: Language,
+        user: Optional[Union[User, Principal]],
+        cursor: Optional[str],
+        limit: int,
+    ) -> Select:
+        config = cast(TEXT_SEARCH_CONFIGS[language], REGCONFIG)
+        tsquery = func.websearch_to_tsquery(config, text)
+        # Cast from real, the cursor holds the exact value sent by both drivers
+        rank = cast(func.ts_rank(Item.search_vector, tsquery), DOUBLE_PRECISION)
+        # Served by the GIN index of the active items
+        query = self.select_active.where(Item.search_vector.bool_op("@@")(tsquery))
+        if user is not None:
+            query = query.where(Item.user_id == user.id)
+        return self.paginate_ranked(query, rank, cursor=cursor, limit=limit)
+
+    def get_owners(
+        self, db: Session, *, ids: Sequence[UUID], with_archived: bool = False
+    ) -> Dict[UUID, Optional[UUID]]:
+        """
+        Owner of each existing item of `ids`, checked once for a whole batch.
+        """
+        rows = db.execute(self._owners_query(ids, with_archived))
+        return {id: user_id for id, user_id in rows}
+
+    async def get_owners_async(
+        self, db: AsyncSession, *, ids: Sequence[UUID], with_archived: bool = False
+    ) -> Dict[UUID, Optional[UUID]]:
+        rows = await db.execute(self._owners_query(ids, with_archived))
+        return {id: user_id for id, user_id in rows}
+
+    def _owners_query(self, ids: Sequence[UUID], with_archived: bool) -> Select:
+        query = select(Item.id, Item.user_id).where(Item.id.in_(ids))
+        return self.filter_archivable(query, with_archived)
+
     def get_multi_by_user(
-        self, db: Session, *, user: User, skip: int = 0, limit: int = 100
+        self,
+        db: Session,
+        *,
+        user: Union[User, Principal],
+        skip: int = 0,
+        limit: int = 100,
+    ) -> List[Item]:
+        rows, _ = self.get_page_by_user(db, user=user, skip=skip, limit=limit)
+        return rows
+
+    def get_page_by_user(
+        self,
+        db: Session,
+        *,
+        user: Union[User, Principal],
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> Page:
+        query = self.paginate(
+            self._by_user_query(user), cursor=cursor, skip=skip, limit=limit
+        )
+        rows = list(db.scalars(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
+
+    def get_page_versions_by_user(
+        self,
+        db: Session,
+        *,
+        user: Union[User, Principal],
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> VersionsPage:
+        query = self.paginate(
+            self.versions(self._by_user_query(user)),
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
+        )
+        rows = list(db.execute(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
+
+    def _by_user_query(self, user: Union[User, Principal]) -> Select:
+        return self.select_all.where(Item.user_id == user.id)
+
+    async def get_multi_by_user_async(
+        self,
+        db: AsyncSession,
+        *,
+        user: Union[User, Principal],
+        skip: int = 0,
+        limit: int = 100,
     ) -> List[Item]:
-        return (
-            db.query(self.model)
-            .filter(Item.user_id == user.id)
-            .offset(skip)
-            .limit(limit)
-            .all()
+        rows, _ = await self.get_page_by_user_async(
+            db, user=user, skip=skip, limit=limit
+        )
+        return rows
+
+    async def get_page_by_user_async(
+        self,
+        db: AsyncSession,
+        *,
+        user: Union[User, Principal],
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> Page:
+        query = self.paginate(
+            self._by_user_query(user), cursor=cursor, skip=skip, limit=limit
+        )
+        rows = list(await db.scalars(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
+
+    async def get_page_versions_by_user_async(
+        self,
+        db: AsyncSession,
+        *,
+        user: Union[User, Principal],
+        cursor: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100,
+    ) -> VersionsPage:
+        query = self.paginate(
+            self.versions(self._by_user_query(user)),
+            cursor=cursor,
+            skip=skip,
+            limit=limit,
         )
+        rows = list(await db.execute(query, bind_arguments=REPLICA_READ))
+        return self.to_page(rows, limit)
 
 
 item = CRUDItem(Item)
@@ -0,0 +1,123 @@
+import asyncio
+from datetime import UTC, datetime
+from typing import List
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import Delete, Insert, Select, delete, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.revocation import RevocationFilter
+from app.models import RevokedToken
+from app.schemas import TokenPayload
+
+from .base import PRIMARY_READ, CRUDBase, apply_changes, apply_changes_async
+
+revocation_filter = RevocationFilter(
+    capacity=settings.REVOCATION_FILTER_CAPACITY,
+    error_rate=settings.REVOCATION_FILTER_ERROR_RATE,
+    resync_seconds=settings.REVOCATION_FILTER_RESYNC_SECONDS,
+)
+
+# One reload of the filter at a time in each event loop, the requests checking
+# a token meanwhile wait for it instead of loading the denylist again
+resync_locks: "WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = (
+    WeakKeyDictionary()
+)
+
+
+def resync_lock() -> asyncio.Lock:
+    loop = asyncio.get_running_loop()
+    lock = resync_locks.get(loop)
+    if lock is None:
+        lock = resync_locks[loop] = asyncio.Lock()
+    return lock
+
+
+def active_token_ids_query() -> Select:
+    return select(RevokedToken.token_id).where(
+        RevokedToken.expires_at > datetime.now(UTC)
+    )
+
+
+def revoked_token_query(token_id: str) -> Select:
+    return select(RevokedToken.id).where(RevokedToken.token_id == token_id)
+
+
+def revoke_query(token_data: TokenPayload) -> Insert:
+    assert token_data.exp is not None, "Tokens without expiration can't be revoked"
+    # Revoking a token twice, even concurrently, keeps the first revocation
+    return (
+        insert(RevokedToken)
+        .values(
+            token_id=token_data.random_value,
+            user_id=token_data.user_id,
+            expires_at=token_data.exp,
+        )
+        .on_conflict_do_nothing(index_elements=[RevokedToken.token_id])
+    )
+
+
+def delete_expired_query() -> Delete:
+    # Forget the revocations of the tokens that expired in the meantime
+    return delete(RevokedToken).where(RevokedToken.expires_at <= datetime.now(UTC))
+
+
+class CRUDRevokedToken(CRUDBase[RevokedToken, TokenPayload, TokenPayload]):
+    def get_active_token_ids(self, db: Session) -> List[str]:
+        # A lagging replica would miss the latest revocations until next resync
+        return list(db.scalars(active_token_ids_query(), bind_arguments=PRIMARY_READ))
+
+    async def get_active_token_ids_async(self, db: AsyncSession) -> List[str]:
+        query = active_token_ids_query()
+        return list(await db.scalars(query, bind_arguments=PRIMARY_READ))
+
+    def resync_filter(self, db: Session) -> None:
+        revocation_filter.resync(self.get_active_token_ids(db))
+
+    async def resync_filter_async(self, db: AsyncSession) -> None:
+        revocation_filter.resync(await self.get_active_token_ids_async(db))
+
+    def revoke(self, db: Session, *, token_data: TokenPayload) -> None:
+        db.execute(delete_expired_query())
+        db.execute(revoke_query(token_data))
+        apply_changes(db)
+        revocation_filter.add(token_data.random_value)
+
+    async def revoke_async(self, db: AsyncSession, *, token_data: TokenPayload) -> None:
+        await db.execute(delete_expired_query())
+        await db.execute(revoke_query(token_data))
+        await apply_changes_async(db)
+        revocation_filter.add(token_data.random_value)
+
+    def is_revoked(self, db: Session, *, token_id: str) -> bool:
+        if not settings.REVOCATION_FILTER_ENABLED:
+            return self._is_revoked_in_db(db, token_id)
+        if revocation_filter.needs_resync():
+            self.resync_filter(db)
+        # Tokens absent from the filter are never looked up in the database
+        if not revocation_filter.might_contain(token_id):
+            return False
+        return self._is_revoked_in_db(db, token_id)
+
+    async def is_revoked_async(self, db: AsyncSession, *, token_id: str) -> bool:
+        if not settings.REVOCATION_FILTER_ENABLED:
+            return await self._is_revoked_in_db_async(db, token_id)
+        if revocation_filter.needs_resync():
+            async with resync_lock():
+                if revocation_filter.needs_resync():
+                    await self.resync_filter_async(db)
+        if not revocation_filter.might_contain(token_id):
+            return False
+        return await self._is_revoked_in_db_async(db, token_id)
+
+    def _is_revoked_in_db(self, db: Session, token_id: str) -> bool:
+        return db.scalars(revoked_token_query(token_id)).first() is not None
+
+    async def _is_revoked_in_db_async(self, db: AsyncSession, token_id: str) -> bool:
+        return (await db.scalars(revoked_token_query(token_id))).first() is not None
+
+
+revoked_token = CRUDRevokedToken(RevokedToken)
@@ -1,28 +1,228 @@
-from typing import Optional
+import io
+import re
+from datetime import UTC, datetime
+from enum import Enum
+from functools import partial
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
+from uuid import UUID
 
 from fastapi.encoders import jsonable_encoder
-from pydantic.types import UUID4
-from sqlalchemy.orm import Session
+from sqlalchemy import (
+    Insert,
+    Row,
+    Select,
+    StatementLambdaElement,
+    String,
+    any_,
+    bindparam,
+    cast,
+    column,
+    func,
+    lambda_stmt,
+    literal,
+    or_,
+    select,
+    table,
+    text,
+)
+from sqlalchemy.dialects.postgresql import (
+    ARRAY,
+    DOUBLE_PRECISION,
+    aggregate_order_by,
+    insert,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, joinedload
 
+from app.core.cache import TTLCache
+from app.core.config import settings
 from app.core.security import (
     generate_sso_confirmation_code,
     get_password_hash,
+    get_password_hash_async,
+    get_password_hashes,
+    get_password_hashes_async,
+    password_needs_rehash,
     verify_password,
+    verify_password_async,
 )
 from app.crud.base import CRUDBase
-from app.models import Provider, Role, User
-from app.schemas import UserCreate, UserUpdate
+from app.models import File, Provider, Role, User, UserStats
+from app.models.user import USER_SEARCH_COLUMNS
+from app.schemas import Principal, UserCreate, UserUpdate
+from app.utils import uuid7
+
+from .base import REPLICA_READ, Page, apply_changes, apply_changes_async, on_commit
+
+# Snapshots of the authenticated users indexed by user id
+principal_cache: TTLCache[str, Principal] = TTLCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS
+)
+
+
+# Relationships serialized by the user schemas: `profile_picture_url` is built
+# from the id and the owner of the profile picture, joined to the user row with
+# the counters of its items
+USER_LOADER_OPTIONS = (
+    joinedload(User.profile_pic).load_only(File.id, File.user_id),
+    joinedload(User.stats),
+)
+# The profile picture is stored in its own row, its id is part of the version
+USER_VERSION_COLUMNS = (
+    select(
+        func.string_agg(
+            cast(File.id, String), aggregate_order_by(literal(","), File.id)
+        )
+    )
+    .where(File.user_id == User.id)
+    .scalar_subquery()
+    .label("profile_pic_ids"),
+    # Updated by the triggers of the items, without changing the user row
+    select(func.concat_ws(",", UserStats.items, UserStats.active_items))
+    .where(UserStats.user_id == User.id)
+    .scalar_subquery()
+    .label("stats"),
+)
+
+
+# The lambdas are analyzed once, the following calls only extract the values of
+# the parameters to reuse the cached statement
+def user_by_email_query(email: str, with_archived: bool) -> StatementLambdaElement:
+    query = lambda_stmt(
+        lambda: select(User).options(*USER_LOADER_OPTIONS).where(User.email == email)
+    )
+    if not with_archived:
+        query += lambda q: q.where(User.archived_at.is_(None))
+    return query
 
-from .base import apply_changes
+
+def user_by_sso_provider_id_query(
+    sso_provider_id: str, provider: Provider, with_archived: bool
+) -> StatementLambdaElement:
+    query = lambda_stmt(
+        lambda: select(User)
+        .options(*USER_LOADER_OPTIONS)
+        .where(User.sso_provider_id == sso_provider_id, User.provider == provider)
+    )
+    if not with_archived:
+        query += lambda q: q.where(User.archived_at.is_(None))
+    return query
+
+
+MISSING_SSO_PROVIDER_ID = (
+    "Invalid arguments for an SSO user, missing sso_provider_id in UserCreate"
+)
+
+# Columns of the imported users, copied into a staging table dropped at the end
+# of the transaction. The other columns take their server defaults, the Python
+# defaults of the model are not applied by COPY
+IMPORT_COLUMNS = (
+    "id",
+    "email",
+    "password_hash",
+    "role",
+    "language",
+    "provider",
+    "sso_provider_id",
+    "first_name",
+    "last_name",
+    "confirmed",
+)
+IMPORT_STAGING_TABLE = "person_import"
+create_staging_table_query = text(
+    f"CREATE TEMPORARY TABLE {IMPORT_STAGING_TABLE} ON COMMIT DROP AS "
+    f"SELECT {', '.join(IMPORT_COLUMNS)} FROM person WITH NO DATA"
+)
+copy_staging_table_sql = (
+    f"COPY {IMPORT_STAGING_TABLE} ({', '.join(IMPORT_COLUMNS)}) FROM STDIN"
+)
+
+
+def copy_value(value: Any) -> str:
+    # Text format of COPY
+    if value is None:
+        return "\\N"
+    if isinstance(value, Enum):
+        value = value.value
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def active_emails_query(emails: Sequence[str]) -> Select:
+    # A single array parameter, served by the unique index of the active emails
+    return select(User.email).where(
+        User.email == any_(bindparam("emails", list(emails), type_=ARRAY(String))),
+        User.archived_at.is_(None),
+    )
+
+
+def insert_staged_users_query() -> Insert:
+    staging = table(IMPORT_STAGING_TABLE, *map(column, IMPORT_COLUMNS))
+    return (
+        insert(User)
+        .from_select(IMPORT_COLUMNS, select(staging))
+        .on_conflict_do_nothing(
+            index_elements=[User.email], index_where=User.archived_at.is_(None)
+        )
+        .returning(User.id, User.email)
+    )
+
+
+def like_prefix(text: str) -> str:
+    # The wildcards and the escape character are matched literally
+    return re.sub(r"([\\%_])", r"\\\1", text) + "%"
 
 
 class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
+    def get_principal(self, db: Session, id: UUID) -> Optional[Principal]:
+        principal = principal_cache.get(str(id))
+        if principal is None:
+            # A lagging replica could cache again the snapshot invalidated by a
+            # write, with the old role or tokens_valid_after
+            user = self.get(db, id=id, primary=True)
+            if user is None:
+                return None
+            principal = Principal.model_validate(user)
+            principal_cache.set(str(id), principal)
+        return principal
+
+    async def get_principal_async(
+        self, db: AsyncSession, id: UUID
+    ) -> Optional[Principal]:
+        principal = principal_cache.get(str(id))
+        if principal is None:
+            user = await self.get_async(db, id=id, primary=True)
+            if user is None:
+                return None
+            principal = Principal.model_validate(user)
+            principal_cache.set(str(id), principal)
+        return principal
+
+    def invalidate_principal(self, id: UUID) -> None:
+        principal_cache.pop(str(id))
+
+    def invalidate_principal_on_commit(
+        self, db: Union[Session, AsyncSession], id: UUID
+    ) -> None:
+        # Invalidated before the commit, the old snapshot could be cached again
+        on_commit(db, partial(self.invalidate_principal, id))
+
     def get_by_email(
         self, db: Session, *, email: str, with_archived: Optional[bool] = False
     ) -> Optional[User]:
-        query = db.query(User).filter(User.email == email)
-        query = self.filter_archivable(query, with_archived)
-        return query.first()
+        query = user_by_email_query(email, bool(with_archived))
+        return db.scalar(query, bind_arguments=REPLICA_READ)
+
+    async def get_by_email_async(
+        self, db: AsyncSession, *, email: str, with_archived: Optional[bool] = False
+    ) -> Optional[User]:
+        query = user_by_email_query(email, bool(with_archived))
+        return await db.scalar(query, bind_arguments=REPLICA_READ)
 
     def get_by_sso_provider_id(
         self,
@@ -30,52 +230,331 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
         *,
         sso_provider_id: str,
         provider: Provider,
-        with_archived: Optional[bool] = False
+        with_archived: Optional[bool] = False,
     ) -> Optional[User]:
         assert (
             provider != Provider.EMAIL
         ), "Email provider is not stored with an sso_provider_id"
-        query = (
-            db.query(User)
-            .filter(User.sso_provider_id == sso_provider_id)
-            .filter(User.provider == provider)
+        query = user_by_sso_provider_id_query(
+            sso_provider_id, provider, bool(with_archived)
         )
-        query = self.filter_archivable(query, with_archived)
-        return query.first()
+        return db.scalar(query)
 
-    def create(
-        self, db: Session, *, obj_in: UserCreate, role: Optional[Role] = Role.CUSTOMER
-    ) -> User:
-        obj_in_data: dict = jsonable_encoder(obj_in)
-        password = obj_in_data.pop("password", None)
-        sso_provider_id = obj_in_data.pop("sso_provider_id", None)
-        provider: Provider = obj_in.provider
-        if provider == Provider.EMAIL:
-            assert (
-                password is not None
-            ), "Invalid arguments for an Email user, missing password in UserCreate"
+    async def get_by_sso_provider_id_async(
+        self,
+        db: AsyncSession,
+        *,
+        sso_provider_id: str,
+        provider: Provider,
+        with_archived: Optional[bool] = False,
+    ) -> Optional[User]:
+        assert (
+            provider != Provider.EMAIL
+        ), "Email provider is not stored with an sso_provider_id"
+        query = user_by_sso_provider_id_query(
+            sso_provider_id, provider, bool(with_archived)
+        )
+        return await db.scalar(query)
+
+    def search(
+        self,
+        db: Session,
+        *,
+        text: str,
+        fuzzy: bool = False,
+        role: Optional[Role] = None,
+        provider: Optional[Provider] = None,
+        with_archived: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Page:
+        """
+        Users whose email, first name or last name starts with `text`, or
+        contains a word similar to `text` when `fuzzy`, ignoring the case. The
+        users are ordered by decreasing similarity to `text`.
+
+        Raises a `ValueError` on an invalid cursor.
+        """
+        query = self._search_query(
+            text, fuzzy, role, provider, with_archived, cursor, limit
+        )
+        rows = db.execute(query, bind_arguments=REPLICA_READ).all()
+        return self.to_ranked_page(rows, limit)
+
+    async def search_async(
+        self,
+        db: AsyncSession,
+        *,
+        text: str,
+        fuzzy: bool = False,
+        role: Optional[Role] = None,
+        provider: Optional[Provider] = None,
+        with_archived: bool = False,
+        cursor: Optional[str] = None,
+        limit: int = 100,
+    ) -> Page:
+        query = self._search_query(
+            text, fuzzy, role, provider, with_archived, cursor, limit
+        )
+        rows = (await db.execute(query, bind_arguments=REPLICA_READ)).all()
+        return self.to_ranked_page(rows, limit)
+
+    def _search_query(
+        self,
+        text: str,
+        fuzzy: bool,
+        role: Optional[Role],
+        provider: Optional[Provider],
+        with_archived: bool,
+        cursor: Optional[str],
+        limit: int,
+    ) -> Select:
+        columns = [getattr(User, name) for name in USER_SEARCH_COLUMNS]
+        # Each condition is served by the trigram index of its column
+        if fuzzy:
+            # Word similarity above pg_trgm.word_similarity_threshold
+            matches = [column.bool_op("%>")(text) for column in columns]
         else:
-            assert (
-                sso_provider_id is not None
-            ), "Invalid arguments for an SSO user, missing sso_provider_id in UserCreate"
+            matches = [column.ilike(like_prefix(text)) for column in columns]
+        rank = cast(
+            func.greatest(*(func.word_similarity(text, column) for column in columns)),
+            DOUBLE_PRECISION,
+        )
+        query = self.select(with_archived).where(or_(*matches))
+        if role is not None:
+            query = query.where(User.role == role)
+        if provider is not None:
+            query = query.where(User.provider == provider)
+        return self.paginate_ranked(query, rank, cursor=cursor, limit=limit)
 
-        password_hash = (
-            get_password_hash(password) if provider == Provider.EMAIL else None
+    def get_active_emails(self, db: Session, *, emails: Sequence[str]) -> Set[str]:
+        """
+        Emails of `emails` taken by an active user, checked with a single query.
+        """
+        return set(db.scalars(active_emails_query(emails)))
+
+    async def get_active_emails_async(
+        self, db: AsyncSession, *, emails: Sequence[str]
+    ) -> Set[str]:
+        return set(await db.scalars(active_emails_query(emails)))
+
+    def import_multi(
+        self,
+        db: Session,
+        *,
+        objs_in: Sequence[UserCreate],
+        role: Role = Role.CUSTOMER,
+    ) -> List[Row]:
+        """
+        Create the users of `objs_in` with a COPY into a staging table and a
+        single INSERT. The users whose email is taken by an active user are
+        skipped: checked before hashing the passwords, and again by the INSERT
+        for the users created in the meantime. The emails of `objs_in` must be
+        distinct.
+
+        Returns the id and the email of the created users.
+        """
+        taken = self.get_active_emails(db, emails=[obj_in.email for obj_in in objs_in])
+        objs_in = self._importable(objs_in, taken)
+        passwords = self._import_passwords(objs_in)
+        password_hashes = get_password_hashes([p for p in passwords if p is not None])
+        rows = self._import_rows(objs_in, role, passwords, password_hashes)
+        db.execute(create_staging_table_query)
+        data = "".join("\t".join(map(copy_value, row)) + "\n" for row in rows)
+        cursor = db.connection().connection.cursor()
+        cursor.copy_expert(copy_staging_table_sql, io.StringIO(data))
+        created = db.execute(insert_staged_users_query()).all()
+        apply_changes(db)
+        return created
+
+    async def import_multi_async(
+        self,
+        db: AsyncSession,
+        *,
+        objs_in: Sequence[UserCreate],
+        role: Role = Role.CUSTOMER,
+    ) -> List[Row]:
+        taken = await self.get_active_emails_async(
+            db, emails=[obj_in.email for obj_in in objs_in]
+        )
+        objs_in = self._importable(objs_in, taken)
+        passwords = self._import_passwords(objs_in)
+        # Spread over the processes of the import hasher
+        password_hashes = await get_password_hashes_async(
+            [p for p in passwords if p is not None]
         )
+        rows = self._import_rows(objs_in, role, passwords, password_hashes)
+        await db.execute(create_staging_table_query)
+        connection = await (await db.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            IMPORT_STAGING_TABLE, records=rows, columns=IMPORT_COLUMNS
+        )
+        created = (await db.execute(insert_staged_users_query())).all()
+        await apply_changes_async(db)
+        return created
+
+    def _importable(
+        self, objs_in: Sequence[UserCreate], taken: Set[str]
+    ) -> List[UserCreate]:
+        return [obj_in for obj_in in objs_in if obj_in.email not in taken]
+
+    def _import_passwords(self, objs_in: Sequence[UserCreate]) -> List[Optional[str]]:
+        return [self._validated_password(obj_in) for obj_in in objs_in]
+
+    def _import_rows(
+        self,
+        objs_in: Sequence[UserCreate],
+        role: Role,
+        passwords: Sequence[Optional[str]],
+        password_hashes: Sequence[str],
+    ) -> List[Tuple]:
+        hashes = iter(password_hashes)
+        rows = []
+        # Built from the schemas, an ORM object per row would be slower than COPY
+        for obj_in, password in zip(objs_in, passwords):
+            if obj_in.provider != Provider.EMAIL:
+                assert obj_in.sso_provider_id is not None, MISSING_SSO_PROVIDER_ID
+            values = {
+                **obj_in.model_dump(),
+                "id": uuid7(),
+                "role": role,
+                "confirmed": False,
+                "password_hash": next(hashes) if password is not None else None,
+            }
+            rows.append(tuple(values[name] for name in IMPORT_COLUMNS))
+        return rows
 
-        db_obj = User(
+    def _build_user(
+        self, obj_in: UserCreate, role: Optional[Role], password_hash: Optional[str]
+    ) -> User:
+        obj_in_data: dict = jsonable_encoder(obj_in)
+        obj_in_data.pop("password", None)
+        sso_provider_id = obj_in_data.pop("sso_provider_id", None)
+        if obj_in.provider != Provider.EMAIL:
+            assert sso_provider_id is not None, MISSING_SSO_PROVIDER_ID
+        return User(
             **obj_in_data,
             role=role,
             password_hash=password_hash,
-            sso_provider_id=sso_provider_id
+            sso_provider_id=sso_provider_id,
+            # Known to be empty, the relationships aren't loaded after the INSERT
+            profile_pic=None,
+            stats=None,
         )  # type: ignore
 
+    def _validated_password(self, obj_in: UserCreate) -> Optional[str]:
+        if obj_in.provider != Provider.EMAIL:
+            return None
+        assert (
+            obj_in.password is not None
+        ), "Invalid arguments for an Email user, missing password in UserCreate"
+        return obj_in.password
+
+    def create(
+        self, db: Session, *, obj_in: UserCreate, role: Optional[Role] = Role.CUSTOMER
+    ) -> User:
+        password = self._validated_password(obj_in)
+        password_hash = get_password_hash(password) if password is not None else None
+        db_obj = self._build_user(obj_in, role, password_hash)
         apply_changes(db, db_obj)
         return db_obj
 
+    async def create_async(
+        self,
+        db: AsyncSession,
+        *,
+        obj_in: UserCreate,
+        role: Optional[Role] = Role.CUSTOMER,
+    ) -> User:
+        password = self._validated_password(obj_in)
+        password_hash = (
+            await get_password_hash_async(password) if password is not None else None
+        )
+        db_obj = self._build_user(obj_in, role, password_hash)
+        await apply_changes_async(db, db_obj)
+        return db_obj
+
+    def update(
+        self,
+        db: Session,
+        *,
+        db_obj: User,
+        obj_in: Union[UserUpdate, Dict[str, Any]],
+    ) -> User:
+        if self._set_fields(db_obj, obj_in):
+            apply_changes(db, db_obj)
+            self.invalidate_principal_on_commit(db, db_obj.id)
+        return db_obj
+
+    async def update_async(
+        self,
+        db: AsyncSession,
+        *,
+        db_obj: User,
+        obj_in: Union[UserUpdate, Dict[str, Any]],
+    ) -> User:
+        if self._set_fields(db_obj, obj_in):
+            await apply_changes_async(db, db_obj)
+            self.invalidate_principal_on_commit(db, db_obj.id)
+        return db_obj
+
+    def remove(self, db: Session, obj: User) -> User:
+        obj = super().remove(db, obj)
+        self.invalidate_principal_on_commit(db, obj.id)
+        return obj
+
+    async def remove_async(self, db: AsyncSession, obj: User) -> User:
+        obj = await super().remove_async(db, obj)
+        self.invalidate_principal_on_commit(db, obj.id)
+        return obj
+
+    def archive(self, db: Session, obj: User) -> User:
+        obj = super().archive(db, obj)
+        self.invalidate_principal_on_commit(db, obj.id)
+        return obj
+
+    async def archive_async(self, db: AsyncSession, obj: User) -> User:
+        obj = await super().archive_async(db, obj)
+        self.invalidate_principal_on_commit(db, obj.id)
+        return obj
+
+    def unarchive(self, db: Session, obj: User) -> User:
+        obj = super().unarchive(db, obj)
+        self.invalidate_principal_on_commit(db, obj.id)
+        return obj
+
+    async def unarchive_async(self, db: AsyncSession, obj: User) -> User:
+        obj = await super().unarchive_async(db, obj)
+        self.invalidate_principal_on_commit(db, obj.id)
+        return obj
+
+    def revoke_tokens(self, db: Session, *, db_obj: User) -> User:
+        """
+        Revoke every token issued to the user until now.
+        """
+        db_obj.tokens_valid_after = datetime.now(UTC)
+        apply_changes(db, db_obj)
+        self.invalidate_principal_on_commit(db, db_obj.id)
+        return db_obj
+
+    async def revoke_tokens_async(self, db: AsyncSession, *, db_obj: User) -> User:
+        db_obj.tokens_valid_after = datetime.now(UTC)
+        await apply_changes_async(db, db_obj)
+        self.invalidate_principal_on_commit(db, db_obj.id)
+        return db_obj
+
     def update_password(self, db: Session, *, db_obj: User, new_password: str) -> User:
         db_obj.password_hash = get_password_hash(new_password)
         apply_changes(db, db_obj)
+        self.invalidate_principal_on_commit(db, db_obj.id)
+        return db_obj
+
+    async def update_password_async(
+        self, db: AsyncSession, *, db_obj: User, new_password: str
+    ) -> User:
+        db_obj.password_hash = await get_password_hash_async(new_password)
+        await apply_changes_async(db, db_obj)
+        self.invalidate_principal_on_commit(db, db_obj.id)
         return db_obj
 
     def authenticate(self, db: Session, *, email: str, password: str) -> Optional[User]:
@@ -84,12 +563,30 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             return None
         if not verify_password(password, user.password_hash):
             return None
+        if password_needs_rehash(user.password_hash):
+            # Upgrade the stored hash to the current parameters
+            user.password_hash = get_password_hash(password)
+            apply_changes(db, user)
+        return user
+
+    async def authenticate_async(
+        self, db: AsyncSession, *, email: str, password: str
+    ) -> Optional[User]:
+        user = await self.get_by_email_async(db, email=email)
+        if not user:
+            return None
+        if not await verify_password_async(password, user.password_hash):
+            return None
+        if password_needs_rehash(user.password_hash):
+            # Upgrade the stored hash to the current parameters
+            user.password_hash = await get_password_hash_async(password)
+            await apply_changes_async(db, user)
         return user
 
     def get_by_sso_confirmation_code(
         self,
         db: Session,
-        user_id: UUID4,
+        user_id: UUID,
         sso_confirmation_code: str,
         with_archived: Optional[bool] = False,
     ) -> Optional[User]:
@@ -98,10 +595,31 @@ class CRUDUser(CRUDBase[User, UserCreate, UserUpdate]):
             return None
         return user
 
+    async def get_by_sso_confirmation_code_async(
+        self,
+        db: AsyncSession,
+        user_id: UUID,
+        sso_confirmation_code: str,
+        with_archived: Optional[bool] = False,
+    ) -> Optional[User]:
+        user = await self.get_async(db, id=user_id, with_archived=with_archived)
+        if user is None or user.sso_confirmation_code != sso_confirmation_code:
+            return None
+        return user
+
     def update_sso_confirmation_code(self, db: Session, user: User) -> User:
         user.sso_confirmation_code = generate_sso_confirmation_code()
         apply_changes(db, user)
         return user
 
+    async def update_sso_confirmation_code_async(
+        self, db: AsyncSession, user: User
+    ) -> User:
+        user.sso_confirmation_code = generate_sso_confirmation_code()
+        await apply_changes_async(db, user)
+        return user
+
 
-user = CRUDUser(User)
+user = CRUDUser(
+    User, loader_options=USER_LOADER_OPTIONS, version_columns=USER_VERSION_COLUMNS
+)
@@ -0,0 +1,6 @@
+from app.models import UserImport
+from app.schemas.user_import import UserImportCreate, UserImportUpdate
+
+from .base import CRUDBase
+
+user_import = CRUDBase[UserImport, UserImportCreate, UserImportUpdate](UserImport)
@@ -0,0 +1,108 @@
+from typing import List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from sqlalchemy import Insert, Select, Update, func, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.models import Item, User, UserStats
+from app.schemas import UserStats as UserStatsSchema
+
+from .base import CRUDBase, apply_changes, apply_changes_async
+
+# Id of the last user of a reconciled batch, None once every user was checked,
+# and the users whose counters were repaired
+Reconciliation = Tuple[Optional[UUID], List[UUID]]
+
+
+def users_batch_query(after: Optional[UUID], limit: int) -> Select:
+    # Walks the primary key index of the users, archived ones included
+    query = select(User.id).order_by(User.id).limit(limit)
+    if after is not None:
+        query = query.where(User.id > after)
+    return query
+
+
+def create_missing_stats_query(ids: Sequence[UUID]) -> Insert:
+    return (
+        insert(UserStats)
+        .values([{"user_id": id} for id in ids])
+        .on_conflict_do_nothing(index_elements=[UserStats.user_id])
+    )
+
+
+def lock_stats_query(ids: Sequence[UUID]) -> Select:
+    return (
+        select(UserStats.user_id)
+        .where(UserStats.user_id.in_(ids))
+        .order_by(UserStats.user_id)
+        .with_for_update()
+    )
+
+
+def repair_stats_query(ids: Sequence[UUID]) -> Update:
+    counts = (
+        select(
+            User.id.label("user_id"),
+            func.count(Item.id).label("items"),
+            func.count(Item.id)
+            .filter(Item.archived_at.is_(None))
+            .label("active_items"),
+        )
+        .outerjoin(Item, Item.user_id == User.id)
+        .where(User.id.in_(ids))
+        .group_by(User.id)
+        .subquery()
+    )
+    # `items` is also a method of the column collections
+    return (
+        update(UserStats)
+        .where(
+            UserStats.user_id == counts.c.user_id,
+            or_(
+                UserStats.items != counts.c["items"],
+                UserStats.active_items != counts.c.active_items,
+            ),
+        )
+        .values(items=counts.c["items"], active_items=counts.c.active_items)
+        .returning(UserStats.user_id)
+        .execution_options(synchronize_session=False)
+    )
+
+
+class CRUDUserStats(CRUDBase[UserStats, UserStatsSchema, UserStatsSchema]):
+    def reconcile(
+        self, db: Session, *, after: Optional[UUID] = None, limit: int = 1_000
+    ) -> Reconciliation:
+        """
+        Recount the items of the `limit` users following the user id `after`
+        and repair the counters that drifted from them.
+
+        The counters of the batch, created for the users without items, are
+        locked before counting: the items written by a concurrent transaction
+        are either counted or added by its triggers once the batch committed.
+        """
+        ids = list(db.scalars(users_batch_query(after, limit)))
+        if not ids:
+            return None, []
+        db.execute(create_missing_stats_query(ids))
+        db.execute(lock_stats_query(ids))
+        repaired = list(db.scalars(repair_stats_query(ids)))
+        apply_changes(db)
+        return ids[-1], repaired
+
+    async def reconcile_async(
+        self, db: AsyncSession, *, after: Optional[UUID] = None, limit: int = 1_000
+    ) -> Reconciliation:
+        ids = list(await db.scalars(users_batch_query(after, limit)))
+        if not ids:
+            return None, []
+        await db.execute(create_missing_stats_query(ids))
+        await db.execute(lock_stats_query(ids))
+        repaired = list(await db.scalars(repair_stats_query(ids)))
+        await apply_changes_async(db)
+        return ids[-1], repaired
+
+
+user_stats = CRUDUserStats(UserStats)
@@ -1,12 +1,10 @@
-import uuid
-
-from sqlalchemy import Column, DateTime
+from sqlalchemy import Column, DateTime, FetchedValue
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.sql import expression
 from sqlalchemy.types import DateTime
 
-from app.utils import to_snake_case
+from app.utils import to_snake_case, uuid7
 
 from sqlalchemy.orm import as_declarative, declared_attr  # type: ignore # isort: skip
 
@@ -23,13 +21,21 @@ def pg_utcnow(element, compiler, **kw):
 
 @as_declarative()
 class Base:
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4, index=True)
+    # Time-ordered keys, the primary key index is the only index of the column
+    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid7)
     created_at = Column(
         DateTime(timezone=True), server_default=utcnow(), nullable=False
     )
-    updated_at = Column(DateTime(timezone=True), onupdate=utcnow())
+    # FetchedValue (no DDL) makes the INSERT return its NULL value, otherwise the
+    # eager defaults would load it with a SELECT after the INSERT
+    updated_at = Column(
+        DateTime(timezone=True), onupdate=utcnow(), server_default=FetchedValue()
+    )
 
     __name__: str
+    # The server defaults are returned by the INSERT and UPDATE statements
+    # (RETURNING) instead of being loaded by a SELECT when they are accessed
+    __mapper_args__ = {"eager_defaults": True}
 
     # Generate __tablename__ automatically
     @declared_attr
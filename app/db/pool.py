@@ -0,0 +1,70 @@
+import threading
+import time
+from typing import Any, Dict
+
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+
+class PoolMetrics:
+    """
+    Time spent by the callers waiting for a connection of the pool.
+    """
+
+    def __init__(self) -> None:
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, wait_seconds: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+
+class TimedPoolMixin:
+    """
+    Records the checkout wait time of a `QueuePool` and reports its gauges.
+    """
+
+    metrics: PoolMetrics
+
+    def __init__(self, *args: Any, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def _do_get(self) -> Any:
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            self.metrics.observe(time.perf_counter() - start)
+
+    def recreate(self) -> Pool:
+        # Keep the metrics when the engine is disposed
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def stats(self) -> Dict[str, Any]:
+        metrics = self.metrics
+        return {
+            "size": self.size(),
+            "in_use": self.checkedout(),
+            # The overflow counter is negative until the pool is full
+            "overflow": max(0, self.overflow()),
+            "checkouts": metrics.checkouts,
+            "wait_ms_mean": round(
+                metrics.wait_seconds_total / max(1, metrics.checkouts) * 1000, 3
+            ),
+            "wait_ms_max": round(metrics.wait_seconds_max * 1000, 3),
+        }
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
@@ -0,0 +1,100 @@
+import random
+from typing import Any, Dict, List, MutableMapping, Optional
+
+from sqlalchemy import UpdateBase, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from sqlalchemy.orm import Session
+
+# Header carrying the position in the WAL of the primary of the last write done
+# by the client, its next reads are done on the primary until the replica
+# replayed this position
+CONSISTENCY_TOKEN_HEADER = "X-Consistency-Token"
+# Bind argument of the statements that can be served by a replica
+USE_REPLICA = "use_replica"
+
+# Highest WAL position known to be replayed by each replica
+replayed_lsn: Dict[AsyncEngine, int] = {}
+
+
+def parse_lsn(value: Optional[str]) -> Optional[int]:
+    """
+    Position in the WAL of a Postgres LSN formatted as `16/B374D848`.
+    """
+    if not value:
+        return None
+    try:
+        high, low = value.split("/")
+        return (int(high, 16) << 32) + int(low, 16)
+    except ValueError:
+        return None
+
+
+async def replica_replay_lsn(replica: AsyncEngine) -> Optional[int]:
+    async with replica.connect() as connection:
+        lsn = await connection.scalar(text("SELECT pg_last_wal_replay_lsn()::text"))
+    return parse_lsn(lsn)
+
+
+async def choose_replica(
+    replicas: List[AsyncEngine], min_lsn: Optional[int]
+) -> Optional[AsyncEngine]:
+    """
+    Pick a replica that replayed the WAL up to `min_lsn`, or None if the reads
+    must be done on the primary.
+    """
+    if not replicas:
+        return None
+    replica = random.choice(replicas)
+    if min_lsn is None or replayed_lsn.get(replica, -1) >= min_lsn:
+        return replica
+    lsn = await replica_replay_lsn(replica)
+    if lsn is None:
+        # Not in recovery, the server is not lagging behind anything
+        return replica
+    replayed_lsn[replica] = max(lsn, replayed_lsn.get(replica, -1))
+    return replica if lsn >= min_lsn else None
+
+
+class RoutingSession(Session):
+    """
+    Sends the statements executed with the `use_replica` bind argument to the
+    replica chosen for the session, and everything else to the primary.
+
+    Once the session wrote to the primary, all its reads go to the primary.
+    """
+
+    def get_bind(self, mapper: Any = None, clause: Any = None, **kw: Any) -> Any:
+        if self._flushing or isinstance(clause, UpdateBase):
+            self.info["wrote"] = True
+            self.info["replica"] = None
+        replica: Optional[AsyncEngine] = self.info.get("replica")
+        if replica is not None and kw.get(USE_REPLICA):
+            return replica.sync_engine
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+class RoutingAsyncSession(AsyncSession):
+    """
+    Records the WAL position of the primary after a commit that wrote to it, to
+    send it to the client as a consistency token.
+    """
+
+    async def route_reads(
+        self,
+        replicas: List[AsyncEngine],
+        consistency_token: Optional[str],
+        state: MutableMapping[str, Any],
+    ) -> None:
+        if not replicas:
+            return
+        self.info["replica"] = await choose_replica(
+            replicas, parse_lsn(consistency_token)
+        )
+        self.info["state"] = state
+
+    async def commit(self) -> None:
+        wrote = self.info.pop("wrote", False)
+        await super().commit()
+        if wrote and "state" in self.info:
+            lsn = await self.scalar(text("SELECT pg_current_wal_lsn()::text"))
+            self.info["state"]["consistency_token"] = lsn
@@ -1,7 +1,77 @@
+from typing import Any, Dict
+from uuid import uuid4
+
 from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 
 from app.core.config import settings
+from app.db.pool import TimedAsyncAdaptedQueuePool, TimedQueuePool
+from app.db.routing import RoutingAsyncSession, RoutingSession
+
+pool_options: Dict[str, Any] = {
+    "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+    "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+    "pool_pre_ping": settings.DB_POOL_PRE_PING,
+}
+
+async_connect_args: Dict[str, Any] = {}
+if settings.DB_PGBOUNCER_TRANSACTION_MODE:
+    # Consecutive transactions may run on different server connections, the
+    # prepared statements must not outlive their transaction
+    async_connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+    }
 
-engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, pool_pre_ping=True)
+# Synchronous stack used by Alembic, the scripts and the tests
+engine = create_engine(
+    settings.SQLALCHEMY_DATABASE_URI,
+    poolclass=TimedQueuePool,
+    pool_size=settings.DB_SYNC_POOL_SIZE,
+    max_overflow=0,
+    **pool_options,
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Asynchronous stack used by the API
+async_engine = create_async_engine(
+    settings.SQLALCHEMY_ASYNC_DATABASE_URI,
+    poolclass=TimedAsyncAdaptedQueuePool,
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    connect_args=async_connect_args,
+    **pool_options,
+)
+# Every replica gets the same pool as the primary from its own max_connections
+replica_engines = [
+    create_async_engine(
+        uri,
+        poolclass=TimedAsyncAdaptedQueuePool,
+        pool_size=settings.DB_POOL_SIZE,
+        max_overflow=settings.DB_MAX_OVERFLOW,
+        connect_args=async_connect_args,
+        **pool_options,
+    )
+    for uri in settings.SQLALCHEMY_ASYNC_REPLICA_URIS
+]
+# Objects are not expired on commit as an expired attribute can't be lazy loaded
+# outside of the greenlet running the session
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=RoutingAsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+)
+
+
+def pool_stats() -> Dict[str, Any]:
+    return {
+        "sync": engine.pool.stats(),  # type: ignore
+        "async": async_engine.pool.stats(),  # type: ignore
+        "replicas": [
+            replica.pool.stats() for replica in replica_engines  # type: ignore
+        ],
+    }
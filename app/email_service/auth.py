@@ -1,3 +1,6 @@
+import logging
+from typing import Iterable
+
 from app.core.config import settings
 
 from .base import EmailTemplate, send_email
@@ -36,3 +39,12 @@ def send_new_account_email(email: str) -> None:
             "link": link,
         },
     )
+
+
+def send_new_account_emails(emails: Iterable[str]) -> None:
+    # A failed email doesn't prevent sending the next ones
+    for email in emails:
+        try:
+            send_new_account_email(email)
+        except Exception:
+            logging.exception(f"New account email not sent to {email}")
@@ -1,13 +1,69 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
 
 from app.api.api_v1.api import api_router
+from app.api.middleware import ConsistencyTokenMiddleware
 from app.core.config import EnvTag, settings
+from app.core.etag import ETAG_HEADER
+from app.core.pagination import (
+    NEXT_CURSOR_HEADER,
+    TOTAL_COUNT_ESTIMATED_HEADER,
+    TOTAL_COUNT_HEADER,
+)
+from app.core.security import (
+    PasswordHashingBusyError,
+    import_password_hasher,
+    password_hasher,
+)
+from app.db.routing import CONSISTENCY_TOKEN_HEADER
+from app.db.session import async_engine, replica_engines
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    yield
+    password_hasher.shutdown()
+    import_password_hasher.shutdown()
+    # The pooled asyncpg connections are bound to the event loop being closed
+    await async_engine.dispose()
+    for replica in replica_engines:
+        await replica.dispose()
+
 
 app = FastAPI(
-    title=settings.PROJECT_NAME, openapi_url=f"{settings.API_V1_STR}/openapi.json"
+    title=settings.PROJECT_NAME,
+    openapi_url=f"{settings.API_V1_STR}/openapi.json",
+    lifespan=lifespan,
 )
 
+
+@app.exception_handler(PasswordHashingBusyError)
+async def password_hashing_busy_handler(
+    request: Request, exc: PasswordHashingBusyError
+) -> JSONResponse:
+    # Shed the load early instead of queuing more CPU bound work
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Server busy, please retry later"},
+        headers={"Retry-After": "1"},
+    )
+
+
+app.add_middleware(ConsistencyTokenMiddleware)
+
+# Response headers readable by the frontend apps
+EXPOSED_HEADERS = [
+    CONSISTENCY_TOKEN_HEADER,
+    ETAG_HEADER,
+    NEXT_CURSOR_HEADER,
+    TOTAL_COUNT_HEADER,
+    TOTAL_COUNT_ESTIMATED_HEADER,
+]
+
 # Set all CORS enabled origins
 if settings.BACKEND_CORS_ORIGINS:
     if settings.TAG == EnvTag.PROD:
@@ -17,6 +73,7 @@ if settings.BACKEND_CORS_ORIGINS:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=EXPOSED_HEADERS,
         )
     elif settings.TAG == EnvTag.STAG:
         # CORS set for a frontend app in staging environment deployed on any Vercel Preview - Modify this accordingly to match the pattern of your preview environment or more strictly to match the url of your staging deployment. Mobile apps do not need any specific CORS settings to be able to call the backend
@@ -26,6 +83,7 @@ if settings.BACKEND_CORS_ORIGINS:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=EXPOSED_HEADERS,
         )
     elif settings.TAG == EnvTag.DEV:
         app.add_middleware(
@@ -34,6 +92,7 @@ if settings.BACKEND_CORS_ORIGINS:
             allow_credentials=True,
             allow_methods=["*"],
             allow_headers=["*"],
+            expose_headers=EXPOSED_HEADERS,
         )
     else:
         raise Exception(f"Provided TAG: {settings.TAG} is not supported")
@@ -1,3 +1,6 @@
 from .file import File
 from .item import Item
+from .revoked_token import RevokedToken
 from .user import DEFAULT_LANGUAGE, Language, Provider, Role, SSOProvider, User
+from .user_import import ImportStatus, UserImport
+from .user_stats import UserStats
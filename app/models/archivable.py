@@ -1,7 +1,17 @@
-from sqlalchemy import Column, DateTime
+from typing import Any
+
+from sqlalchemy import Column, DateTime, Index, text
 from sqlalchemy.ext.hybrid import hybrid_property
 
 
+def active_index(name: str, *columns: str, **kw: Any) -> Index:
+    """
+    Partial index of the rows not archived, matched by the queries filtering
+    them with `archived_at IS NULL`.
+    """
+    return Index(name, *columns, postgresql_where=text("archived_at IS NULL"), **kw)
+
+
 class Archivable:
     archived_at = Column(DateTime)
 
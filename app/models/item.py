@@ -1,12 +1,45 @@
-from sqlalchemy import Column, ForeignKey, String
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, Computed, ForeignKey, Index, String
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 
 from app.db.base_class import Base
 
-from .archivable import Archivable
+from .archivable import Archivable, active_index
+from .user import Language
+
+# Text search configuration of each language. A new language changes the
+# expression of the search vector and needs a migration
+TEXT_SEARCH_CONFIGS = {Language.EN: "english", Language.FR: "french"}
+
+
+def search_vector_expression() -> str:
+    # The lexemes of every configuration, searched with the configuration of the
+    # language of the user. The name ranks above the description
+    return " || ".join(
+        f"setweight(to_tsvector('{config}'::regconfig, coalesce(name, '')), 'A') || "
+        f"setweight(to_tsvector('{config}'::regconfig, coalesce(description, '')), 'B')"
+        for config in TEXT_SEARCH_CONFIGS.values()
+    )
 
 
 class Item(Base, Archivable):
     name = Column(String)
     description = Column(String)
     user_id = Column(UUID(as_uuid=True), ForeignKey("person.id"))
+    # Maintained by Postgres and left unmapped, it would be returned by every
+    # INSERT and UPDATE (eager_defaults). The search queries use the column
+    search_vector = Column(
+        TSVECTOR, Computed(search_vector_expression(), persisted=True)
+    )
+
+    __mapper_args__ = {**Base.__mapper_args__, "exclude_properties": ["search_vector"]}
+
+    __table_args__ = (
+        # Keyset pagination of the active items
+        active_index("ix_item_active_created_at_id", "created_at", "id"),
+        # Keyset pagination of the items of a user, also covers the foreign key
+        Index("ix_item_user_id_created_at_id", "user_id", "created_at", "id"),
+        # Full-text search of the active items
+        active_index(
+            "ix_item_active_search_vector", "search_vector", postgresql_using="gin"
+        ),
+    )
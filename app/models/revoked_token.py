@@ -0,0 +1,14 @@
+from sqlalchemy import Column, DateTime, ForeignKey, String
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.base_class import Base
+
+
+class RevokedToken(Base):
+    # Identifier of the revoked token, the random value of its payload
+    token_id = Column(String, unique=True, index=True, nullable=False)
+    user_id = Column(
+        UUID(as_uuid=True), ForeignKey("person.id", ondelete="CASCADE"), index=True
+    )
+    # Revoked tokens are forgotten once they would have expired anyway
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
@@ -1,13 +1,13 @@
 from enum import Enum
 from typing import TYPE_CHECKING, Literal, Optional
 
-from sqlalchemy import Boolean, Column, String
+from sqlalchemy import Boolean, Column, DateTime, Index, String
 from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import relationship
 
 from app.db.base_class import Base
 
-from .archivable import Archivable
+from .archivable import Archivable, active_index
 
 if TYPE_CHECKING:
     from .file import File  # noqa: F401
@@ -38,17 +38,40 @@ class Provider(str, Enum):
 # Modify this to match the SSO providers you are using in your project
 SSOProvider = Literal[Provider.GOOGLE, Provider.FACEBOOK, Provider.GITHUB]
 
+# Columns matched by the admin search of the users
+USER_SEARCH_COLUMNS = ("email", "first_name", "last_name")
+
 
 class User(Base, Archivable):
     # Override the table name to avoid any confusion with SQL reserved word "user" during generated migration scripts
     __tablename__ = "person"
+    __table_args__ = (
+        # Keyset pagination of the users, with and without the archived ones
+        Index("ix_person_created_at_id", "created_at", "id"),
+        active_index("ix_person_active_created_at_id", "created_at", "id"),
+        # An archived user doesn't hold on to its email, it can be registered again
+        active_index("ix_person_active_email", "email", unique=True),
+        active_index("ix_person_active_sso_provider_id", "sso_provider_id", "provider"),
+        # Prefix and fuzzy search of the users (pg_trgm), archived ones included
+        *(
+            Index(
+                f"ix_person_{column}_trgm",
+                column,
+                postgresql_using="gin",
+                postgresql_ops={column: "gin_trgm_ops"},
+            )
+            for column in USER_SEARCH_COLUMNS
+        ),
+    )
     # Authentication
-    email = Column(String, unique=True, index=True, nullable=False)
+    email = Column(String, nullable=False)
     password_hash = Column(String)
     role = Column(String, default=Role.CUSTOMER, nullable=False)
     language = Column(String, default=DEFAULT_LANGUAGE, nullable=False)
     confirmed = Column(Boolean, default=False)
     sso_confirmation_code = Column(String)
+    # Tokens issued before this date are revoked
+    tokens_valid_after = Column(DateTime(timezone=True))
     # Personal information
     first_name = Column(String, default="")
     last_name = Column(String, default="")
@@ -58,11 +81,15 @@ class User(Base, Archivable):
     postcode = Column(String)
     state = Column(String)
     provider = Column(String, default=Provider.EMAIL, nullable=False)
-    sso_provider_id = Column(String, index=True)
+    sso_provider_id = Column(String)
+    # Loaded by the queries of CRUDUser with their loader options. A lazy load
+    # would issue a query per user of a list, and fails with an AsyncSession
     profile_pic = relationship(
         "File", backref="user", uselist=False, cascade="all, delete"
     )
     items = relationship("Item", backref="user", lazy="dynamic", cascade="all, delete")
+    # Maintained by Postgres, None until the first item of the user
+    stats = relationship("UserStats", uselist=False, viewonly=True)
 
     @hybrid_property
     def is_admin(self) -> bool:
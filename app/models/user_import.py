@@ -0,0 +1,27 @@
+from enum import Enum
+
+from sqlalchemy import Column, DateTime, Integer, String
+from sqlalchemy.dialects.postgresql import JSONB
+
+from app.db.base_class import Base
+
+
+class ImportStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+
+
+class UserImport(Base):
+    # Progress of an import, updated after each batch of rows
+    status = Column(String, default=ImportStatus.PENDING, nullable=False)
+    format = Column(String, nullable=False)
+    rows_read = Column(Integer, default=0, nullable=False)
+    rows_imported = Column(Integer, default=0, nullable=False)
+    rows_failed = Column(Integer, default=0, nullable=False)
+    # Line and reason of the first MAX_IMPORT_FAILURES rows not imported
+    failures = Column(JSONB, default=list, nullable=False)
+    # Error that stopped the import
+    error = Column(String)
+    finished_at = Column(DateTime(timezone=True))
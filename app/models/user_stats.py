@@ -0,0 +1,81 @@
+from sqlalchemy import DDL, Column, ForeignKey, Integer, event
+from sqlalchemy.dialects.postgresql import UUID
+
+from app.db.base_class import Base
+
+# Changes of the counters of the owners of the items of a statement, from the
+# transition tables of the triggers below
+ITEM_CHANGES = {
+    "INSERT": "SELECT user_id, 1 AS items, (archived_at IS NULL)::int AS "
+    "active_items FROM new_items",
+    "DELETE": "SELECT user_id, -1 AS items, -(archived_at IS NULL)::int AS "
+    "active_items FROM old_items",
+}
+ITEM_CHANGES["UPDATE"] = f"{ITEM_CHANGES['INSERT']} UNION ALL {ITEM_CHANGES['DELETE']}"
+
+
+def count_items_statement(changes: str) -> str:
+    # One upsert per statement, whatever its number of items. The rows are
+    # locked in the order of the users to avoid deadlocks between statements
+    return (
+        "INSERT INTO user_stats AS stats (user_id, items, active_items) "
+        f"SELECT user_id, sum(items), sum(active_items) FROM ({changes}) AS changes "
+        "WHERE user_id IS NOT NULL GROUP BY user_id "
+        "HAVING sum(items) <> 0 OR sum(active_items) <> 0 ORDER BY user_id "
+        "ON CONFLICT (user_id) DO UPDATE SET "
+        "items = stats.items + excluded.items, "
+        "active_items = stats.active_items + excluded.active_items, "
+        "updated_at = TIMEZONE('utc', CURRENT_TIMESTAMP);"
+    )
+
+
+COUNT_ITEMS_FUNCTION = f"""
+CREATE FUNCTION count_user_items() RETURNS trigger LANGUAGE plpgsql AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        {count_items_statement(ITEM_CHANGES["INSERT"])}
+    ELSIF TG_OP = 'UPDATE' THEN
+        {count_items_statement(ITEM_CHANGES["UPDATE"])}
+    ELSE
+        {count_items_statement(ITEM_CHANGES["DELETE"])}
+    END IF;
+    RETURN NULL;
+END
+$$
+"""
+COUNT_ITEMS_TRIGGERS = [
+    "CREATE TRIGGER item_count_inserts AFTER INSERT ON item "
+    "REFERENCING NEW TABLE AS new_items "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_user_items()",
+    # Transition tables can't be combined with a list of columns, the updates
+    # leaving the owner and the archive date unchanged don't write any counter
+    "CREATE TRIGGER item_count_updates AFTER UPDATE ON item "
+    "REFERENCING OLD TABLE AS old_items NEW TABLE AS new_items "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_user_items()",
+    "CREATE TRIGGER item_count_deletes AFTER DELETE ON item "
+    "REFERENCING OLD TABLE AS old_items "
+    "FOR EACH STATEMENT EXECUTE FUNCTION count_user_items()",
+]
+
+
+class UserStats(Base):
+    # Counters of the items of a user, created with its first item and kept up
+    # to date by the triggers of the item table
+    id = None
+    user_id = Column(
+        UUID(as_uuid=True),
+        ForeignKey("person.id", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    items = Column(Integer, default=0, nullable=False)
+    active_items = Column(Integer, default=0, nullable=False)
+
+
+# Created with the tables by `create_all`, the migrations create them as well
+for statement in (COUNT_ITEMS_FUNCTION, *COUNT_ITEMS_TRIGGERS):
+    event.listen(Base.metadata, "after_create", DDL(statement))
+event.listen(
+    Base.metadata,
+    "before_drop",
+    DDL("DROP FUNCTION IF EXISTS count_user_items() CASCADE"),
+)
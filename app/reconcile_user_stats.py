@@ -0,0 +1,50 @@
+import argparse
+import logging
+import time
+
+from app import crud
+from app.core.config import settings
+from app.db.session import SessionLocal
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def reconcile(batch_size: int, pause: float) -> int:
+    """
+    Repair the counters of the items of every user, one batch of users per
+    transaction. Returns the number of repaired users.
+    """
+    repaired = 0
+    batches = 0
+    after = None
+    with SessionLocal() as db:
+        while True:
+            after, users = crud.user_stats.reconcile(db, after=after, limit=batch_size)
+            if after is None:
+                break
+            batches += 1
+            repaired += len(users)
+            # The triggers keep the counters exact, a drift is worth a look
+            if users:
+                logger.warning(f"Repaired the item counters of {users}")
+            # Leaves room to the writes waiting for the counters of the batch
+            time.sleep(pause)
+    logger.info(f"Reconciled {batches} batches of users, repaired {repaired}")
+    return repaired
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Recount the items of the users and repair their stats"
+    )
+    parser.add_argument(
+        "--batch-size", type=int, default=settings.USER_STATS_RECONCILE_BATCH_SIZE
+    )
+    parser.add_argument("--pause", type=float, default=0.0)
+    args = parser.parse_args()
+    reconcile(args.batch_size, args.pause)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,9 @@
+from .bulk import BulkFailure, BulkIds, BulkResult
 from .file import File, FileCreate, FileUpdate
-from .item import Item, ItemCreate, ItemUpdate
+from .item import Item, ItemBulkCreate, ItemBulkUpdate, ItemCreate, ItemUpdate
 from .msg import Msg
+from .pagination import Pagination
 from .token import AuthResponse, Token, TokenContext, TokenPayload
-from .user import User, UserCreate, UserUpdate
+from .user import Principal, User, UserCreate, UserUpdate
+from .user_import import ImportFailure, UserImport, UserImportCreate, UserImportUpdate
+from .user_stats import UserStats
@@ -0,0 +1,22 @@
+from typing import List
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+from app.core.config import settings
+
+
+class BulkIds(BaseModel):
+    ids: List[UUID] = Field(min_length=1, max_length=settings.MAX_BULK_SIZE)
+
+
+class BulkFailure(BaseModel):
+    id: UUID
+    detail: str
+
+
+# Outcome of a bulk operation, the unchanged items already held the changes
+class BulkResult(BaseModel):
+    succeeded: List[UUID] = []
+    failed: List[BulkFailure] = []
+    unchanged: List[UUID] = []
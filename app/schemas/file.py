@@ -1,7 +1,7 @@
 from typing import Optional
+from uuid import UUID
 
 from pydantic import BaseModel, ConfigDict
-from pydantic.types import UUID4
 
 
 # Shared properties
@@ -23,7 +23,7 @@ class FileUpdate(FileBase):
 class FileInDBBase(FileBase):
     model_config = ConfigDict(from_attributes=True)
 
-    id: UUID4
+    id: UUID
 
 
 # Additional properties to return via API
@@ -33,7 +33,7 @@ class File(FileInDBBase):
 
 # Additional properties stored in DB
 class FileInDB(FileInDBBase):
-    user_id: Optional[UUID4] = None
-    client_with_picture_id: Optional[UUID4] = None
-    client_under_contract_id: Optional[UUID4] = None
+    user_id: Optional[UUID] = None
+    client_with_picture_id: Optional[UUID] = None
+    client_under_contract_id: Optional[UUID] = None
     filename: Optional[str] = "file_64735.pdf"
@@ -1,9 +1,11 @@
-from typing import Optional
+from typing import Any, List, Optional
+from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict
-from pydantic.types import UUID4
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
+from app.core.config import settings
 from app.schemas.archivable import Archivable
+from app.schemas.bulk import BulkIds
 
 
 # Shared properties
@@ -22,10 +24,26 @@ class ItemUpdate(ItemBase):
     pass
 
 
+class ItemBulkCreate(BaseModel):
+    items: List[ItemCreate] = Field(min_length=1, max_length=settings.MAX_BULK_SIZE)
+
+
+# The same changes applied to every item
+class ItemBulkUpdate(BulkIds):
+    changes: ItemUpdate
+
+    @field_validator("changes")
+    @classmethod
+    def has_changes(cls, value: Any) -> Any:
+        if not value.model_fields_set:
+            raise ValueError("No changes to apply")
+        return value
+
+
 class ItemInDBBase(ItemBase):
     model_config = ConfigDict(from_attributes=True)
 
-    id: UUID4
+    id: UUID
 
 
 # Additional properties to return via API
@@ -35,4 +53,4 @@ class Item(ItemInDBBase):
 
 # Additional properties stored in DB
 class ItemInDB(ItemInDBBase, Archivable):
-    user_id: Optional[UUID4] = None
+    user_id: Optional[UUID] = None
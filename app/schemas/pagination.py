@@ -0,0 +1,10 @@
+from typing import Optional
+
+from pydantic import BaseModel
+
+
+class Pagination(BaseModel):
+    skip: int = 0
+    limit: int = 100
+    # Opaque cursor returned by the previous page, replaces the offset
+    cursor: Optional[str] = None
@@ -2,7 +2,7 @@ from datetime import datetime
 from enum import Enum
 from typing import Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict
 
 from .user import User
 
@@ -26,6 +26,9 @@ class Token(BaseModel):
 
 
 class TokenPayload(BaseModel):
+    # Payloads are shared between requests by the token cache
+    model_config = ConfigDict(frozen=True)
+
     exp: Optional[datetime]
     iat: datetime
     context: TokenContext
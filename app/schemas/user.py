@@ -1,10 +1,12 @@
-from typing import Optional
+from datetime import datetime
+from typing import Any, Optional
+from uuid import UUID
 
-from pydantic import BaseModel, ConfigDict, EmailStr
-from pydantic.types import UUID4
+from pydantic import BaseModel, ConfigDict, EmailStr, field_validator
 
-from app.models.user import Provider, Role, DEFAULT_LANGUAGE, Language
+from app.models.user import DEFAULT_LANGUAGE, Language, Provider, Role
 from app.schemas.archivable import Archivable
+from app.schemas.user_stats import UserStats
 
 
 # Shared properties
@@ -31,7 +33,7 @@ class UserUpdate(UserBase):
 class UserInDBBase(UserBase, Archivable):
     model_config = ConfigDict(from_attributes=True)
 
-    id: UUID4
+    id: UUID
     confirmed: Optional[bool]
     role: Role
     language: Language
@@ -40,6 +42,14 @@ class UserInDBBase(UserBase, Archivable):
     is_moderator: bool
     is_customer: bool
     profile_picture_url: Optional[str]
+    # Loaded with the user row, also into the cached principal
+    stats: UserStats = UserStats()
+
+    @field_validator("stats", mode="before")
+    @classmethod
+    def stats_of_user_without_items(cls, value: Any) -> Any:
+        # No row until the first item of the user
+        return UserStats() if value is None else value
 
 
 # Additional properties to return via API
@@ -47,6 +57,16 @@ class User(UserInDBBase):
     pass
 
 
+# Read-only snapshot of the authenticated user cached between requests
+class Principal(UserInDBBase):
+    model_config = ConfigDict(from_attributes=True, frozen=True)
+
+    tokens_valid_after: Optional[datetime] = None
+    # Version of the snapshot
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+
 # Additional properties stored in DB
 class UserInDB(UserInDBBase):
     full_name: Optional[str] = "John Doe"
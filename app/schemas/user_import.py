@@ -0,0 +1,39 @@
+from datetime import datetime
+from typing import List, Optional
+from uuid import UUID
+
+from pydantic import BaseModel, ConfigDict
+
+from app.models.user_import import ImportStatus
+
+
+class ImportFailure(BaseModel):
+    # Line of the file, starting at 1 with the header of a CSV file
+    line: int
+    detail: str
+
+
+# Properties to receive on creation
+class UserImportCreate(BaseModel):
+    format: str
+
+
+# Progress of the import, reported after each batch
+class UserImportUpdate(BaseModel):
+    status: ImportStatus
+    rows_read: int
+    rows_imported: int
+    rows_failed: int
+    failures: List[ImportFailure] = []
+    error: Optional[str] = None
+    finished_at: Optional[datetime] = None
+
+
+# Additional properties to return via API
+class UserImport(UserImportUpdate):
+    model_config = ConfigDict(from_attributes=True)
+
+    id: UUID
+    format: str
+    created_at: datetime
+    updated_at: Optional[datetime] = None
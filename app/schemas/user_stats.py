@@ -0,0 +1,9 @@
+from pydantic import BaseModel, ConfigDict
+
+
+# Counters maintained by Postgres, returned with the users
+class UserStats(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
+    items: int = 0
+    active_items: int = 0
@@ -1,10 +1,23 @@
-from typing import Dict
+import tracemalloc
+import uuid
+from typing import Any, Dict, Generator, List
 
+import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
 
+from app import crud
 from app.core.config import settings
-from app.tests.utils.utils import random_lower_string
+from app.core.etag import ETAG_HEADER, IF_NONE_MATCH_HEADER
+from app.core.pagination import NEXT_CURSOR_HEADER, encode_cursor
+from app.db.session import async_engine
+from app.models import Language
+from app.schemas import ItemCreate
+from app.tests.utils.queries import count_queries
+from app.tests.utils.user import authentication_token_from_email, create_random_user
+from app.tests.utils.utils import random_lower_string, stream_without_buffering
 
 
 def test_create_item(
@@ -111,3 +124,363 @@ def test_delete_item(
     assert deleted_item["id"] == item["id"]
     assert deleted_item["name"] == item["name"]
     assert deleted_item["description"] == item["description"]
+
+
+def test_delete_item_deleted_concurrently(
+    client: TestClient,
+    normal_user_token_headers: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    url = f"{settings.API_V1_STR}/items/"
+    r = client.post(url, headers=normal_user_token_headers, json={"name": "race"})
+    item = r.json()
+
+    # The DELETE found nothing, the item is not deleted a second time
+    async def remove_owned_async(*args: Any, **kwargs: Any) -> None:
+        return None
+
+    monkeypatch.setattr(crud.item, "remove_owned_async", remove_owned_async)
+    r = client.delete(f"{url}{item['id']}", headers=normal_user_token_headers)
+    assert r.status_code == status.HTTP_404_NOT_FOUND
+    monkeypatch.undo()
+    r = client.get(f"{url}{item['id']}", headers=normal_user_token_headers)
+    assert r.status_code == status.HTTP_200_OK
+
+
+def test_item_round_trips(
+    client: TestClient, normal_user_token_headers: Dict[str, str]
+) -> None:
+    # Load the principal of the user in the cache
+    client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+
+    with count_queries() as queries:
+        r = client.post(
+            f"{settings.API_V1_STR}/items/",
+            headers=normal_user_token_headers,
+            json={"name": random_lower_string()},
+        )
+    assert r.status_code == status.HTTP_200_OK
+    # INSERT ... RETURNING, COMMIT
+    assert queries.count == 1
+    assert queries.commits == 1
+    item_id = r.json()["id"]
+
+    with count_queries() as queries:
+        r = client.put(
+            f"{settings.API_V1_STR}/items/{item_id}",
+            headers=normal_user_token_headers,
+            json={"description": random_lower_string()},
+        )
+    assert r.status_code == status.HTTP_200_OK
+    # UPDATE ... RETURNING with the ownership check, COMMIT
+    assert queries.round_trips == 2
+
+    with count_queries() as queries:
+        r = client.delete(
+            f"{settings.API_V1_STR}/items/{item_id}",
+            headers=normal_user_token_headers,
+        )
+    assert r.status_code == status.HTTP_200_OK
+    # DELETE ... RETURNING with the ownership check, COMMIT
+    assert queries.round_trips == 2
+
+
+def test_update_and_delete_item_of_another_user(
+    client: TestClient, db: Session, normal_user_token_headers: Dict[str, str]
+) -> None:
+    item = crud.item.create_with_user(
+        db, obj_in=ItemCreate(), user=create_random_user(db)
+    )
+    url = f"{settings.API_V1_STR}/items/{item.id}"
+    r = client.put(url, headers=normal_user_token_headers, json={"name": "changed"})
+    assert r.status_code == status.HTTP_403_FORBIDDEN
+    r = client.delete(url, headers=normal_user_token_headers)
+    assert r.status_code == status.HTTP_403_FORBIDDEN
+
+    url = f"{settings.API_V1_STR}/items/{uuid.uuid4()}"
+    r = client.put(url, headers=normal_user_token_headers, json={"name": "changed"})
+    assert r.status_code == status.HTTP_404_NOT_FOUND
+    r = client.delete(url, headers=normal_user_token_headers)
+    assert r.status_code == status.HTTP_404_NOT_FOUND
+
+
+def test_get_item_not_modified(
+    client: TestClient, normal_user_token_headers: Dict[str, str]
+) -> None:
+    r = client.post(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        json={"name": random_lower_string()},
+    )
+    assert r.status_code == status.HTTP_200_OK, "Could not create an item"
+    url = f"{settings.API_V1_STR}/items/{r.json()['id']}"
+
+    r = client.get(url, headers=normal_user_token_headers)
+    assert r.status_code == status.HTTP_200_OK
+    etag = r.headers[ETAG_HEADER]
+
+    with count_queries() as queries:
+        r = client.get(
+            url, headers={**normal_user_token_headers, IF_NONE_MATCH_HEADER: etag}
+        )
+    assert r.status_code == status.HTTP_304_NOT_MODIFIED
+    assert r.headers[ETAG_HEADER] == etag
+    assert r.content == b""
+    # The version probe only, the item is not loaded
+    assert queries.count == 1
+
+    r = client.put(url, headers=normal_user_token_headers, json={"name": "changed"})
+    assert r.status_code == status.HTTP_200_OK
+    r = client.get(
+        url, headers={**normal_user_token_headers, IF_NONE_MATCH_HEADER: etag}
+    )
+    assert r.status_code == status.HTTP_200_OK
+    assert r.json()["name"] == "changed"
+    assert r.headers[ETAG_HEADER] != etag
+
+
+def test_read_items_not_modified(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    crud.item.create_with_user(db, obj_in=ItemCreate(), user=user)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    url = f"{settings.API_V1_STR}/items/"
+
+    r = client.get(url, headers=headers, params={"limit": 1})
+    assert r.status_code == status.HTTP_200_OK
+    etag = r.headers[ETAG_HEADER]
+    r = client.get(
+        url, headers={**headers, IF_NONE_MATCH_HEADER: etag}, params={"limit": 1}
+    )
+    assert r.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Same rows in the page, but a next page to announce
+    crud.item.create_with_user(db, obj_in=ItemCreate(), user=user)
+    r = client.get(
+        url, headers={**headers, IF_NONE_MATCH_HEADER: etag}, params={"limit": 1}
+    )
+    assert r.status_code == status.HTTP_200_OK
+    assert NEXT_CURSOR_HEADER in r.headers
+    assert r.headers[ETAG_HEADER] != etag
+
+
+def test_read_items_by_pages(
+    client: TestClient, db: Session, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    user = create_random_user(db)
+    item_ids = [
+        str(crud.item.create_with_user(db, obj_in=ItemCreate(), user=user).id)
+        for _ in range(5)
+    ]
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    monkeypatch.setattr(settings, "MAX_PAGE_SIZE", 2)
+
+    pages, cursor = [], None
+    while True:
+        r = client.get(
+            f"{settings.API_V1_STR}/items/",
+            headers=headers,
+            # The limit is capped to the maximum page size
+            params={"limit": 100, **({"cursor": cursor} if cursor else {})},
+        )
+        assert r.status_code == status.HTTP_200_OK
+        pages.append([item["id"] for item in r.json()])
+        cursor = r.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+    assert pages == [item_ids[0:2], item_ids[2:4], item_ids[4:]]
+
+    # Offset mode
+    r = client.get(f"{settings.API_V1_STR}/items/", headers=headers, params={"skip": 3})
+    assert [item["id"] for item in r.json()] == item_ids[3:]
+    assert NEXT_CURSOR_HEADER not in r.headers
+
+
+def test_read_items_invalid_cursor(
+    client: TestClient, normal_user_token_headers: Dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/items/",
+        headers=normal_user_token_headers,
+        params={"cursor": "invalid"},
+    )
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_search_items(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    crud.user.update(db, db_obj=user, obj_in={"language": Language.FR})
+    names = ["Les chevaux courent", "Un cheval blanc", "Une maison", "Cheval gris"]
+    items = [
+        crud.item.create_with_user(db, obj_in=ItemCreate(name=name), user=user)
+        for name in names
+    ]
+    crud.item.archive(db, items[3])
+    crud.item.create_with_user(
+        db, obj_in=ItemCreate(name="Cheval noir"), user=create_random_user(db)
+    )
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+
+    results, cursor = [], None
+    while True:
+        r = client.get(
+            f"{settings.API_V1_STR}/items/search",
+            headers=headers,
+            # "chevaux" and "cheval" share the same French stem
+            params={
+                "q": "chevaux",
+                "limit": 1,
+                **({"cursor": cursor} if cursor else {}),
+            },
+        )
+        assert r.status_code == status.HTTP_200_OK
+        results += [item["name"] for item in r.json()]
+        cursor = r.headers.get(NEXT_CURSOR_HEADER)
+        if cursor is None:
+            break
+    # The archived item and the item of the other user are left out
+    assert sorted(results) == ["Les chevaux courent", "Un cheval blanc"]
+
+    r = client.get(
+        f"{settings.API_V1_STR}/items/search",
+        headers=headers,
+        params={
+            "q": "chevaux",
+            "cursor": encode_cursor(items[0].created_at, items[0].id),
+        },
+    )
+    assert r.status_code == status.HTTP_400_BAD_REQUEST
+
+
+def test_bulk_items(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    other_item = crud.item.create_with_user(
+        db, obj_in=ItemCreate(), user=create_random_user(db)
+    )
+    names = [random_lower_string() for _ in range(3)]
+    url = f"{settings.API_V1_STR}/items/bulk"
+
+    with count_queries() as queries:
+        r = client.post(
+            url, headers=headers, json={"items": [{"name": n} for n in names]}
+        )
+    assert r.status_code == status.HTTP_200_OK
+    assert [item["name"] for item in r.json()] == names
+    # A single INSERT ... RETURNING for the batch
+    assert sum(s.startswith("INSERT") for s in queries.statements) == 1
+    assert queries.commits == 1
+    ids = [item["id"] for item in r.json()]
+
+    unknown_id = str(uuid.uuid4())
+    r = client.put(
+        url,
+        headers=headers,
+        json={
+            "ids": [*ids, str(other_item.id), unknown_id],
+            "changes": {"description": "bulk"},
+        },
+    )
+    assert r.status_code == status.HTTP_200_OK
+    assert sorted(r.json()["succeeded"]) == sorted(ids)
+    failed = {f["id"]: f["detail"] for f in r.json()["failed"]}
+    assert failed == {
+        str(other_item.id): "Current user do not have enough privilege",
+        unknown_id: "Item not found",
+    }
+    r = client.get(f"{url[:-5]}/{ids[0]}", headers=headers)
+    assert r.json()["description"] == "bulk"
+    # The items already holding the changes are not rewritten
+    r = client.put(
+        url, headers=headers, json={"ids": ids, "changes": {"description": "bulk"}}
+    )
+    assert r.json() == {"succeeded": [], "failed": [], "unchanged": ids}
+    r = client.put(url, headers=headers, json={"ids": ids, "changes": {}})
+    assert r.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+
+    r = client.request("DELETE", f"{url}/archive", headers=headers, json={"ids": ids})
+    assert sorted(r.json()["succeeded"]) == sorted(ids)
+    r = client.get(f"{url[:-5]}/{ids[0]}", headers=headers)
+    assert r.status_code == status.HTTP_404_NOT_FOUND
+    r = client.put(f"{url}/unarchive", headers=headers, json={"ids": ids[:1]})
+    assert r.json() == {"succeeded": ids[:1], "failed": [], "unchanged": []}
+
+    # Like the archived items, they can't be deleted
+    r = client.request("DELETE", url, headers=headers, json={"ids": ids})
+    assert r.json()["succeeded"] == ids[:1]
+    assert [f["id"] for f in r.json()["failed"]] == ids[1:]
+    assert crud.item.get(db, id=ids[0]) is None
+    assert crud.item.get(db, id=other_item.id)
+
+
+# Enough rows for the export to be streamed in a few dozen batches
+EXPORTED_ITEMS = 50_000
+
+
+@pytest.fixture(scope="module")
+def exported_items(db: Session) -> Generator[int, None, None]:
+    user = create_random_user(db)
+    db.execute(
+        text(
+            "INSERT INTO item (id, name, description, user_id) "
+            "SELECT gen_random_uuid(), 'export', 'export', :user_id "
+            "FROM generate_series(1, :count)"
+        ),
+        {"user_id": user.id, "count": EXPORTED_ITEMS},
+    )
+    db.commit()
+    yield db.scalar(text("SELECT count(*) FROM item WHERE archived_at IS NULL"))
+    db.execute(text("DELETE FROM item WHERE user_id = :id"), {"id": user.id})
+    db.commit()
+    crud.user.remove(db, user)
+
+
+def test_export_items_memory(
+    client: TestClient, superuser_token_headers: Dict[str, str], exported_items: int
+) -> None:
+    path = f"{settings.API_V1_STR}/items/export"
+    options: List[Dict[str, Any]] = []
+
+    def record_options(conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        if "FROM item" in statement:
+            options.append(dict(args[-2].execution_options))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", record_options)
+    tracemalloc.start()
+    try:
+        r = stream_without_buffering(client, path, superuser_token_headers)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        event.remove(async_engine.sync_engine, "before_cursor_execute", record_options)
+
+    assert r["status"] == status.HTTP_200_OK
+    assert r["lines"] == exported_items
+    assert r["chunks"] >= exported_items // settings.EXPORT_BATCH_SIZE
+    # The rows are fetched from a server side cursor, one batch at a time
+    assert [o.get("yield_per") for o in options] == [settings.EXPORT_BATCH_SIZE]
+    assert options[0]["stream_results"]
+    # Loading the whole table would take tens of megabytes
+    assert peak < 10 * 1024 * 1024, peak
+
+
+def test_export_items_client_disconnect(
+    client: TestClient, superuser_token_headers: Dict[str, str], exported_items: int
+) -> None:
+    path = f"{settings.API_V1_STR}/items/export"
+    r = stream_without_buffering(
+        client, path, superuser_token_headers, "format=csv", disconnect_after=3
+    )
+
+    assert r["status"] == status.HTTP_200_OK
+    assert r["chunks"] < 10
+    # The cursor and its connection are released with the response
+    assert async_engine.pool.stats()["in_use"] == 0
+
+
+def test_export_items_as_normal_user(
+    client: TestClient, normal_user_token_headers: Dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/items/export", headers=normal_user_token_headers
+    )
+    assert r.status_code == status.HTTP_403_FORBIDDEN
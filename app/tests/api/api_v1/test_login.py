@@ -1,9 +1,17 @@
+import os
+from ipaddress import ip_network
 from typing import Dict
 
-from fastapi import status
+import pytest
+from fastapi import Request, status
 from fastapi.testclient import TestClient
+from sqlalchemy.orm import Session
 
+from app.api import deps
 from app.core.config import settings
+from app.core.throttling import LoginThrottle
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
 
 
 def test_get_access_token(client: TestClient) -> None:
@@ -28,3 +36,97 @@ def test_use_access_token(
     result = r.json()
     assert r.status_code == status.HTTP_200_OK
     assert "email" in result
+
+
+def test_login_is_throttled_by_email(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, tmp_path: str
+) -> None:
+    monkeypatch.setattr(settings, "LOGIN_THROTTLE_ENABLED", True)
+    monkeypatch.setattr(deps, "login_throttle", LoginThrottle(tmp_path, slots=16))
+    login_data = {"username": settings.FIRST_SUPERUSER, "password": "wrong"}
+    for _ in range(settings.LOGIN_THROTTLE_EMAIL_BURST):
+        r = client.post(
+            f"{settings.API_V1_STR}/auth/login/access-token", data=login_data
+        )
+        assert r.status_code == status.HTTP_401_UNAUTHORIZED
+    r = client.post(f"{settings.API_V1_STR}/auth/login/access-token", data=login_data)
+    assert r.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert int(r.headers["Retry-After"]) > 0
+    assert os.path.exists(os.path.join(tmp_path, "login-throttle-email"))
+
+
+def test_successful_logins_are_not_throttled_by_email(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, tmp_path: str
+) -> None:
+    monkeypatch.setattr(settings, "LOGIN_THROTTLE_ENABLED", True)
+    monkeypatch.setattr(deps, "login_throttle", LoginThrottle(tmp_path, slots=16))
+    login_data = {
+        "username": settings.FIRST_SUPERUSER,
+        "password": settings.FIRST_SUPERUSER_PASSWORD,
+    }
+    for _ in range(settings.LOGIN_THROTTLE_EMAIL_BURST + 1):
+        r = client.post(
+            f"{settings.API_V1_STR}/auth/login/access-token", data=login_data
+        )
+        assert r.status_code == status.HTTP_200_OK
+
+
+def forwarded_request(client_ip: str, forwarded_for: str) -> Request:
+    headers = [(b"x-forwarded-for", forwarded_for.encode())]
+    return Request({"type": "http", "client": (client_ip, 1234), "headers": headers})
+
+
+def test_get_client_ip_from_trusted_proxies(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(settings, "TRUSTED_PROXIES", [ip_network("10.0.0.0/8")])
+    request = forwarded_request("10.0.0.1", "1.1.1.1")
+    assert deps.get_client_ip(request) == "1.1.1.1"
+    # Only the address appended by the trusted proxies is used
+    request = forwarded_request("10.0.0.1", "3.3.3.3, 1.1.1.1, 10.0.0.2")
+    assert deps.get_client_ip(request) == "1.1.1.1"
+    # The header sent by an untrusted client is ignored
+    request = forwarded_request("4.4.4.4", "5.5.5.5")
+    assert deps.get_client_ip(request) == "4.4.4.4"
+
+
+def login(client: TestClient, email: str, password: str) -> Dict[str, str]:
+    login_data = {"username": email, "password": password}
+    r = client.post(f"{settings.API_V1_STR}/auth/login/access-token", data=login_data)
+    assert r.status_code == status.HTTP_200_OK
+    return r.json()
+
+
+def test_logout_revokes_refresh_token(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = create_random_user(db, password=password)
+    tokens = login(client, user.email, password)
+    r = client.post(f"{settings.API_V1_STR}/auth/refresh", json=tokens["refresh_token"])
+    assert r.status_code == status.HTTP_200_OK
+    r = client.post(f"{settings.API_V1_STR}/auth/logout", json=tokens["refresh_token"])
+    assert r.status_code == status.HTTP_200_OK
+    r = client.post(f"{settings.API_V1_STR}/auth/refresh", json=tokens["refresh_token"])
+    assert r.status_code == status.HTTP_403_FORBIDDEN
+    assert r.json()["detail"] == "Token revoked"
+    # Logging out again is a no-op
+    r = client.post(f"{settings.API_V1_STR}/auth/logout", json=tokens["refresh_token"])
+    assert r.status_code == status.HTTP_200_OK
+
+
+def test_revoke_all_tokens(client: TestClient, db: Session) -> None:
+    password = random_lower_string()
+    user = create_random_user(db, password=password)
+    tokens = login(client, user.email, password)
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    r = client.post(f"{settings.API_V1_STR}/users/me/revoke-tokens", headers=headers)
+    assert r.status_code == status.HTTP_200_OK
+    r = client.post(f"{settings.API_V1_STR}/auth/refresh", json=tokens["refresh_token"])
+    assert r.status_code == status.HTTP_403_FORBIDDEN
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=headers)
+    assert r.status_code == status.HTTP_403_FORBIDDEN
+    r = client.put(
+        f"{settings.API_V1_STR}/users/me", headers=headers, json={"first_name": "x"}
+    )
+    assert r.status_code == status.HTTP_403_FORBIDDEN
+    # Tokens issued after the revocation are accepted
+    tokens = login(client, user.email, password)
+    r = client.post(f"{settings.API_V1_STR}/auth/refresh", json=tokens["refresh_token"])
+    assert r.status_code == status.HTTP_200_OK
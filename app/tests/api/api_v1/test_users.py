@@ -1,12 +1,22 @@
+import json
 from typing import Dict
-from unittest.mock import patch
+from unittest.mock import AsyncMock, patch
+from uuid import uuid4
 
 from fastapi import status
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
 
-from app import crud
+from app import crud, models, schemas
 from app.core.config import settings
+from app.core.etag import ETAG_HEADER, IF_NONE_MATCH_HEADER
+from app.core.pagination import (
+    NEXT_CURSOR_HEADER,
+    TOTAL_COUNT_ESTIMATED_HEADER,
+    TOTAL_COUNT_HEADER,
+)
+from app.core.security import PasswordHashingBusyError
+from app.tests.utils.queries import count_queries
 from app.tests.utils.user import authentication_token_from_email, create_random_user
 from app.tests.utils.utils import random_email, random_lower_string
 
@@ -32,6 +42,70 @@ def test_api_users_get_me_as_normal_user(
     assert current_user["email"] == settings.EMAIL_TEST_USER
 
 
+def test_api_users_get_me_from_principal_cache(
+    client: TestClient, normal_user_token_headers: Dict[str, str]
+) -> None:
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers)
+    assert r.status_code == status.HTTP_200_OK
+    with count_queries() as queries:
+        r = client.get(
+            f"{settings.API_V1_STR}/users/me", headers=normal_user_token_headers
+        )
+    assert r.status_code == status.HTTP_200_OK
+    assert queries.count == 0
+
+
+def test_api_users_get_me_not_modified(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    url = f"{settings.API_V1_STR}/users/me"
+
+    etag = client.get(url, headers=headers).headers[ETAG_HEADER]
+    r = client.get(url, headers={**headers, IF_NONE_MATCH_HEADER: f"W/{etag}"})
+    assert r.status_code == status.HTTP_304_NOT_MODIFIED
+
+    r = client.put(url, headers=headers, json={"first_name": random_lower_string()})
+    assert r.status_code == status.HTTP_200_OK
+    r = client.get(url, headers={**headers, IF_NONE_MATCH_HEADER: etag})
+    assert r.status_code == status.HTTP_200_OK
+    assert r.headers[ETAG_HEADER] != etag
+
+
+def test_api_users_get_me_with_stats(client: TestClient, db: Session) -> None:
+    user = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    url = f"{settings.API_V1_STR}/users/me"
+    r = client.get(url, headers=headers)
+    assert r.json()["stats"] == {"items": 0, "active_items": 0}
+    etag = r.headers[ETAG_HEADER]
+
+    r = client.post(f"{settings.API_V1_STR}/items/", headers=headers, json={})
+    assert r.status_code == status.HTTP_200_OK
+    # The snapshot of the user is refreshed once its cache entry expired
+    crud.user.invalidate_principal(user.id)
+    with count_queries() as queries:
+        r = client.get(url, headers={**headers, IF_NONE_MATCH_HEADER: etag})
+    assert r.status_code == status.HTTP_200_OK
+    assert r.json()["stats"] == {"items": 1, "active_items": 1}
+    assert r.headers[ETAG_HEADER] != etag
+    # Joined to the user row
+    assert queries.count == 1
+
+
+def test_api_users_update_me_round_trips(
+    client: TestClient, normal_user_token_headers: Dict[str, str]
+) -> None:
+    with count_queries() as queries:
+        r = client.put(
+            f"{settings.API_V1_STR}/users/me",
+            headers=normal_user_token_headers,
+            json={"first_name": random_lower_string()},
+        )
+    assert r.status_code == status.HTTP_200_OK
+    # SELECT, UPDATE ... RETURNING, COMMIT
+    assert queries.round_trips == 3
+
+
 def do_nothing(*args, **kwargs):
     return None
 
@@ -70,6 +144,24 @@ def test_api_users_get_by_id(
     assert existing_user.email == api_user["email"]
 
 
+def test_api_users_get_by_id_with_stats(
+    client: TestClient, superuser_token_headers: dict, db: Session
+) -> None:
+    user = create_random_user(db)
+    url = f"{settings.API_V1_STR}/users/{user.id}"
+    r = client.get(url, headers=superuser_token_headers)
+    assert r.json()["stats"] == {"items": 0, "active_items": 0}
+    etag = r.headers[ETAG_HEADER]
+
+    item = crud.item.create_with_user(db, obj_in=schemas.ItemCreate(), user=user)
+    crud.item.create_with_user(db, obj_in=schemas.ItemCreate(), user=user)
+    crud.item.archive(db, item)
+    # The user row is unchanged, its ETag follows the counters
+    r = client.get(url, headers={**superuser_token_headers, IF_NONE_MATCH_HEADER: etag})
+    assert r.status_code == status.HTTP_200_OK
+    assert r.json()["stats"] == {"items": 2, "active_items": 1}
+
+
 def test_api_users_create_with_existing_username(
     client: TestClient, superuser_token_headers: dict, db: Session
 ) -> None:
@@ -110,6 +202,33 @@ def test_api_users_get_multiple(
     assert len(all_users) > 1
     for item in all_users:
         assert "email" in item
+    total, _ = crud.user.count(db)
+    assert r.headers[TOTAL_COUNT_HEADER] == str(total)
+    assert r.headers[TOTAL_COUNT_ESTIMATED_HEADER] == "false"
+
+
+def test_api_users_get_multiple_constant_queries(
+    client: TestClient, superuser_token_headers: dict, db: Session
+) -> None:
+    for _ in range(10):
+        user = create_random_user(db)
+        db.add(models.File(name="profile", user_id=user.id))
+    db.commit()
+    url = f"{settings.API_V1_STR}/users/"
+    client.get(url, headers=superuser_token_headers)
+
+    statements = []
+    for limit in (1, 10):
+        # The last users, created with a profile picture
+        params = {"limit": limit, "skip": crud.user.count(db)[0] - limit}
+        crud.user.counts.clear()
+        with count_queries() as queries:
+            r = client.get(url, headers=superuser_token_headers, params=params)
+        assert len(r.json()) == limit
+        assert all(user["profile_picture_url"] for user in r.json())
+        statements.append(queries.count)
+    # The profile pictures are joined to the page, not loaded user by user
+    assert statements[0] == statements[1]
 
 
 def test_api_users_get_multiple_unauthorized(client: TestClient) -> None:
@@ -124,6 +243,196 @@ def test_api_users_get_multiple_as_normal_user(
     assert r.status_code == status.HTTP_403_FORBIDDEN
 
 
+def test_api_users_search(
+    client: TestClient,
+    superuser_token_headers: dict,
+    normal_user_token_headers: Dict[str, str],
+    db: Session,
+) -> None:
+    last_name = random_lower_string()
+    exact, longer, archived = (create_random_user(db) for _ in range(3))
+    crud.user.update(db, db_obj=exact, obj_in={"last_name": last_name})
+    crud.user.update(
+        db,
+        db_obj=longer,
+        obj_in={"last_name": f"{last_name}son", "role": models.Role.MODERATOR},
+    )
+    crud.user.update(db, db_obj=archived, obj_in={"last_name": last_name})
+    crud.user.archive(db, archived)
+    url = f"{settings.API_V1_STR}/users/search"
+
+    def search(**params) -> list:
+        r = client.get(url, headers=superuser_token_headers, params=params)
+        assert r.status_code == status.HTTP_200_OK
+        return [user["id"] for user in r.json()]
+
+    # Prefix of the last name, ignoring the case
+    assert search(q=last_name[:10].upper()) == [str(exact.id), str(longer.id)]
+    assert search(q=last_name[:10], with_archived=True) == [
+        str(exact.id),
+        str(longer.id),
+        str(archived.id),
+    ]
+    assert search(q=last_name[:10], role="moderator") == [str(longer.id)]
+    assert search(q=last_name[:10], provider="google") == []
+    assert search(q=exact.email[:12]) == [str(exact.id)]
+    # A typo matches the similar names only
+    typo = last_name[:16] + "0" + last_name[17:]
+    assert search(q=typo) == []
+    assert search(q=typo, fuzzy=True) == [str(exact.id), str(longer.id)]
+
+    r = client.get(
+        url, headers=superuser_token_headers, params={"q": last_name, "limit": 1}
+    )
+    assert [user["id"] for user in r.json()] == [str(exact.id)]
+    r = client.get(
+        url,
+        headers=superuser_token_headers,
+        params={"q": last_name, "cursor": r.headers[NEXT_CURSOR_HEADER]},
+    )
+    assert [user["id"] for user in r.json()] == [str(longer.id)]
+    assert NEXT_CURSOR_HEADER not in r.headers
+
+    r = client.get(url, headers=superuser_token_headers, params={"q": "ab"})
+    assert r.status_code == status.HTTP_422_UNPROCESSABLE_CONTENT
+    r = client.get(url, headers=normal_user_token_headers, params={"q": last_name})
+    assert r.status_code == status.HTTP_403_FORBIDDEN
+
+
+def test_api_users_import_csv(
+    client: TestClient, superuser_token_headers: dict, db: Session
+) -> None:
+    existing = create_random_user(db)
+    email, sso_email = random_email(), random_email()
+    password = random_lower_string()
+    body = "\n".join(
+        [
+            "email,password,first_name,provider,sso_provider_id",
+            f"{email},{password},Ada,,",
+            f"not-an-email,{password},,,",
+            f"{existing.email},{password},,,",
+            f"{email},{password},,,",
+            f"{sso_email},,,google,{random_lower_string()}",
+            f"{random_email()},,,,",
+        ]
+    )
+    with patch("app.api.imports.send_new_account_emails") as send_emails:
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers=superuser_token_headers,
+            params={"format": "csv"},
+            content=body,
+        )
+    assert r.status_code == status.HTTP_202_ACCEPTED
+    # The import ran in the background before the response was read
+    r = client.get(
+        f"{settings.API_V1_STR}/users/import/{r.json()['id']}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == status.HTTP_200_OK
+    progress = r.json()
+    assert progress["status"] == models.ImportStatus.DONE
+    assert progress["rows_read"] == 6
+    assert progress["rows_imported"] == 2
+    assert progress["rows_failed"] == 4
+    failures = {failure["line"]: failure["detail"] for failure in progress["failures"]}
+    assert failures.keys() == {3, 4, 5, 7}
+    assert failures[3].startswith("email:")
+    assert "already exists" in failures[4]
+    assert failures[5] == "Duplicate email in the file"
+    assert failures[7] == "Missing password for an email user"
+    send_emails.assert_called_once_with([email, sso_email])
+
+    user = crud.user.authenticate(db, email=email, password=password)
+    assert user
+    assert user.first_name == "Ada"
+    assert user.role == models.Role.CUSTOMER
+    sso_user = crud.user.get_by_email(db, email=sso_email)
+    assert sso_user
+    assert sso_user.provider == models.Provider.GOOGLE
+    assert sso_user.password_hash is None
+
+
+def test_api_users_import_ndjson(
+    client: TestClient, superuser_token_headers: dict, db: Session
+) -> None:
+    email = random_email()
+    body = "\n".join(
+        [
+            json.dumps({"email": email, "password": random_lower_string()}),
+            "{not json",
+            "",
+            json.dumps({"email": random_email()}),
+        ]
+    )
+    with patch("app.api.imports.send_new_account_emails"):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers=superuser_token_headers,
+            params={"role": models.Role.MODERATOR.value},
+            content=body,
+        )
+    assert r.status_code == status.HTTP_202_ACCEPTED
+    r = client.get(
+        f"{settings.API_V1_STR}/users/import/{r.json()['id']}",
+        headers=superuser_token_headers,
+    )
+    progress = r.json()
+    assert progress["status"] == models.ImportStatus.DONE
+    assert (progress["rows_read"], progress["rows_imported"]) == (3, 1)
+    assert [failure["line"] for failure in progress["failures"]] == [2, 4]
+    user = crud.user.get_by_email(db, email=email)
+    assert user
+    assert user.role == models.Role.MODERATOR
+
+
+def test_api_users_import_with_hashing_busy(
+    client: TestClient, superuser_token_headers: dict, db: Session
+) -> None:
+    email = random_email()
+    body = json.dumps({"email": email, "password": random_lower_string()})
+    busy = AsyncMock(side_effect=PasswordHashingBusyError(1))
+    with (
+        patch("app.api.imports.send_new_account_emails"),
+        patch.object(crud.user, "import_multi_async", busy),
+        patch("app.api.imports.HASHING_MAX_ATTEMPTS", 3),
+        patch("app.api.imports.HASHING_RETRY_DELAY", 0),
+    ):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers=superuser_token_headers,
+            content=body,
+        )
+    assert r.status_code == status.HTTP_202_ACCEPTED
+    assert busy.await_count == 3
+    r = client.get(
+        f"{settings.API_V1_STR}/users/import/{r.json()['id']}",
+        headers=superuser_token_headers,
+    )
+    progress = r.json()
+    assert progress["status"] == models.ImportStatus.DONE
+    assert (progress["rows_imported"], progress["rows_failed"]) == (0, 1)
+    assert "server was busy" in progress["failures"][0]["detail"]
+    assert crud.user.get_by_email(db, email=email) is None
+
+
+def test_api_users_import_too_large(
+    client: TestClient, superuser_token_headers: dict
+) -> None:
+    with patch.object(settings, "MAX_IMPORT_BYTES", 10):
+        r = client.post(
+            f"{settings.API_V1_STR}/users/import",
+            headers=superuser_token_headers,
+            content=json.dumps({"email": random_email()}),
+        )
+    assert r.status_code == status.HTTP_413_CONTENT_TOO_LARGE
+    r = client.get(
+        f"{settings.API_V1_STR}/users/import/{uuid4()}",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == status.HTTP_404_NOT_FOUND
+
+
 def test_api_users_archive(
     client: TestClient, superuser_token_headers: dict, db: Session
 ) -> None:
@@ -168,6 +477,26 @@ def test_api_users_unarchive(
     assert user_after_unarchive.archived is False
 
 
+def test_api_users_unarchive_with_email_taken(
+    client: TestClient, superuser_token_headers: dict, db: Session
+) -> None:
+    user = create_random_user(db)
+    r = client.delete(
+        f"{settings.API_V1_STR}/users/{user.id}/archive",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == status.HTTP_200_OK
+    user_in = schemas.UserCreate(email=user.email, password=random_lower_string())
+    crud.user.create(db, obj_in=user_in)
+    r = client.put(
+        f"{settings.API_V1_STR}/users/{user.id}/unarchive",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == status.HTTP_409_CONFLICT
+    db.expire_all()
+    assert crud.user.get(db, id=user.id, with_archived=True).archived is True
+
+
 def test_api_users_archive_self(
     client: TestClient, superuser_token_headers: dict, db: Session
 ) -> None:
@@ -195,3 +524,21 @@ def test_api_users_archive_self(
     assert r.status_code == status.HTTP_200_OK
     assert user.id == user_after_unarchive.id
     assert user_after_unarchive.archived is False
+
+
+def test_api_users_archived_user_is_rejected_immediately(
+    client: TestClient, superuser_token_headers: dict, db: Session
+) -> None:
+    user = create_random_user(db)
+    user_headers = authentication_token_from_email(
+        client=client, email=user.email, db=db
+    )
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=user_headers)
+    assert r.status_code == status.HTTP_200_OK
+    r = client.delete(
+        f"{settings.API_V1_STR}/users/{user.id}/archive",
+        headers=superuser_token_headers,
+    )
+    assert r.status_code == status.HTTP_200_OK
+    r = client.get(f"{settings.API_V1_STR}/users/me", headers=user_headers)
+    assert r.status_code == status.HTTP_404_NOT_FOUND
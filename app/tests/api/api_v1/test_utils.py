@@ -0,0 +1,28 @@
+from typing import Dict
+
+from fastapi import status
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+
+
+def test_read_metrics(
+    client: TestClient, superuser_token_headers: Dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics", headers=superuser_token_headers
+    )
+    assert r.status_code == status.HTTP_200_OK
+    metrics = r.json()
+    assert metrics["token_cache"]["hits"] >= 0
+    assert metrics["db_pool"]["async"]["size"] == settings.DB_POOL_SIZE
+    assert metrics["db_pool"]["async"]["checkouts"] > 0
+
+
+def test_read_metrics_as_normal_user(
+    client: TestClient, normal_user_token_headers: Dict[str, str]
+) -> None:
+    r = client.get(
+        f"{settings.API_V1_STR}/utils/metrics", headers=normal_user_token_headers
+    )
+    assert r.status_code == status.HTTP_403_FORBIDDEN
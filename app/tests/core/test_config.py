@@ -0,0 +1,18 @@
+import pytest
+from pydantic import ValidationError
+
+from app.core.config import Settings
+
+
+def test_db_pool_is_derived_from_the_worker_share() -> None:
+    settings = Settings(DB_MAX_CONNECTIONS=100, WEB_CONCURRENCY=4)
+    # 25 connections per worker, 2 of them for the synchronous engine
+    assert settings.DB_POOL_SIZE == 11
+    assert settings.DB_MAX_OVERFLOW == 12
+
+
+def test_db_pool_must_fit_the_worker_share() -> None:
+    with pytest.raises(ValidationError):
+        Settings(DB_MAX_CONNECTIONS=100, WEB_CONCURRENCY=4, DB_POOL_SIZE=30)
+    with pytest.raises(ValidationError):
+        Settings(DB_MAX_CONNECTIONS=8, WEB_CONCURRENCY=4)
@@ -0,0 +1,33 @@
+import uuid
+from datetime import UTC, datetime
+
+import pytest
+
+from app.core.pagination import (
+    decode_cursor,
+    decode_ranked_cursor,
+    encode_cursor,
+    encode_ranked_cursor,
+)
+
+
+def test_cursor_round_trip() -> None:
+    created_at, id = datetime.now(UTC), uuid.uuid4()
+    cursor = encode_cursor(created_at, id)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == (created_at, id)
+
+
+@pytest.mark.parametrize("cursor", ["", "not-a-cursor", "WzFd"])
+def test_invalid_cursor(cursor: str) -> None:
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_ranked_cursor_round_trip() -> None:
+    rank, created_at, id = 0.0607927, datetime.now(UTC), uuid.uuid4()
+    cursor = encode_ranked_cursor(rank, created_at, id)
+    assert decode_ranked_cursor(cursor) == (rank, created_at, id)
+    # Not a cursor of the lists ordered by creation date
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,34 @@
+import secrets
+
+from app.core.revocation import BloomFilter, RevocationFilter
+
+
+def test_bloom_filter_has_no_false_negatives() -> None:
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    keys = [secrets.token_hex(16) for _ in range(1000)]
+    for key in keys:
+        bloom_filter.add(key)
+    assert all(key in bloom_filter for key in keys)
+
+
+def test_bloom_filter_false_positive_rate() -> None:
+    bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+    for _ in range(1000):
+        bloom_filter.add(secrets.token_hex(16))
+    false_positives = sum(secrets.token_hex(16) in bloom_filter for _ in range(10000))
+    assert false_positives < 300
+
+
+def test_revocation_filter_resync() -> None:
+    revocation_filter = RevocationFilter(
+        capacity=100, error_rate=0.001, resync_seconds=3600
+    )
+    assert revocation_filter.needs_resync()
+    # Everything might be revoked until the first resync
+    assert revocation_filter.might_contain("a")
+    revocation_filter.resync(["a"])
+    assert not revocation_filter.needs_resync()
+    assert revocation_filter.might_contain("a")
+    assert not revocation_filter.might_contain("b")
+    revocation_filter.add("b")
+    assert revocation_filter.might_contain("b")
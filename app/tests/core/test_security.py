@@ -0,0 +1,99 @@
+import asyncio
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+import jwt
+import pytest
+
+from app.core import security
+from app.core.config import settings
+from app.core.security import PasswordHasher, PasswordHashingBusyError, ScryptParameters
+from app.schemas import TokenContext
+
+
+def test_password_hash_async_roundtrip() -> None:
+    password_hash = asyncio.run(security.get_password_hash_async("password"))
+    assert security.verify_password("password", password_hash)
+    assert asyncio.run(security.verify_password_async("password", password_hash))
+    assert not asyncio.run(security.verify_password_async("wrong", password_hash))
+
+
+def test_password_hasher_rejects_when_queue_is_full() -> None:
+    hasher = PasswordHasher(workers=0, queue_size=1)
+    release = threading.Event()
+
+    async def run() -> None:
+        pending = asyncio.ensure_future(hasher.run(release.wait))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordHashingBusyError):
+            await hasher.run(release.wait)
+        release.set()
+        await pending
+
+    asyncio.run(run())
+    assert hasher.pending == 0
+
+
+def test_verify_token_is_cached_until_expiration() -> None:
+    user_id = uuid.uuid4()
+    token = security.create_access_token(user_id)
+    security.token_cache.clear()
+    hits = security.token_cache.hits
+    token_data = security.verify_token(token, TokenContext.ACCESS_TOKEN)
+    assert security.verify_token(token, TokenContext.ACCESS_TOKEN) == token_data
+    assert security.token_cache.hits == hits + 1
+    assert token_data.user_id == str(user_id)
+    with pytest.raises(security.TokenContextError):
+        security.verify_token(token, TokenContext.REFRESH_TOKEN)
+
+
+def test_expired_token_is_not_served_from_cache() -> None:
+    token = security.create_token(
+        uuid.uuid4(), TokenContext.ACCESS_TOKEN, expires_delta=timedelta(seconds=1)
+    )
+    security.verify_token(token, TokenContext.ACCESS_TOKEN)
+    time.sleep(1.1)
+    with pytest.raises(jwt.ExpiredSignatureError):
+        security.verify_token(token, TokenContext.ACCESS_TOKEN)
+
+
+def legacy_password_hash(password: str) -> str:
+    # Hex encoded hash produced before the hashes encoded their parameters
+    salt = os.urandom(16)
+    derived_key = hashlib.scrypt(
+        str(password.encode()).encode(), salt=salt, n=16_384, r=8, p=4, dklen=64
+    )
+    return (salt + derived_key).hex()
+
+
+def test_password_hash_encodes_its_parameters() -> None:
+    parameters = ScryptParameters(n=1024, r=4, p=1)
+    password_hash = security.get_password_hash("password", parameters)
+    assert password_hash.startswith("$scrypt$ln=10,r=4,p=1$")
+    decoded_parameters, salt, _ = security.decode_password_hash(password_hash)
+    assert decoded_parameters == parameters
+    assert len(salt) == security.SALT_LENGTH
+    assert security.verify_password("password", password_hash)
+    assert not security.verify_password("wrong", password_hash)
+    assert security.password_needs_rehash(password_hash)
+
+
+def test_legacy_password_hash_is_verified_and_needs_rehash() -> None:
+    password_hash = legacy_password_hash("password")
+    assert security.verify_password("password", password_hash)
+    assert not security.verify_password("wrong", password_hash)
+    assert security.password_needs_rehash(password_hash)
+    assert not security.password_needs_rehash(security.get_password_hash("password"))
+
+
+def test_password_reset_token_with_legacy_email_claim() -> None:
+    email = "user@example.com"
+    token = security.generate_password_reset_token(email)
+    assert security.verify_password_reset_token(token) == email
+    legacy_token = jwt.encode({"email": email}, settings.SECRET_KEY)
+    assert security.verify_password_reset_token(legacy_token) == email
+    assert security.verify_password_reset_token("invalid") is None
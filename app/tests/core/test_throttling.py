@@ -0,0 +1,53 @@
+import multiprocessing
+import os
+
+from app.core.throttling import SharedTokenBuckets
+
+
+def consume_in_process(path: str) -> None:
+    buckets = SharedTokenBuckets(path, slots=16, capacity=2, refill_per_second=0.01)
+    buckets.consume("1.2.3.4")
+
+
+def test_token_bucket_rejects_when_empty(tmp_path: str) -> None:
+    buckets = SharedTokenBuckets(
+        os.path.join(tmp_path, "buckets"), slots=16, capacity=2, refill_per_second=1
+    )
+    assert buckets.consume("1.2.3.4") == 0
+    assert buckets.consume("1.2.3.4") == 0
+    retry_after = buckets.consume("1.2.3.4")
+    assert 0 < retry_after <= 1
+    assert buckets.consume("5.6.7.8") == 0
+    assert buckets.rejected == 1
+
+
+def test_token_buckets_are_shared_between_processes(tmp_path: str) -> None:
+    path = os.path.join(tmp_path, "buckets")
+    process = multiprocessing.get_context("spawn").Process(
+        target=consume_in_process, args=(path,)
+    )
+    process.start()
+    process.join()
+    buckets = SharedTokenBuckets(path, slots=16, capacity=2, refill_per_second=0.01)
+    assert buckets.consume("1.2.3.4") == 0
+    assert buckets.consume("1.2.3.4") > 0
+
+
+def test_token_buckets_evict_when_full(tmp_path: str) -> None:
+    buckets = SharedTokenBuckets(
+        os.path.join(tmp_path, "buckets"), slots=2, capacity=1, refill_per_second=0.01
+    )
+    assert buckets.consume("a") == 0
+    assert buckets.consume("b") == 0
+    assert buckets.consume("c") == 0
+    assert buckets.consume("c") > 0
+
+
+def test_token_bucket_check_without_consuming(tmp_path: str) -> None:
+    buckets = SharedTokenBuckets(
+        os.path.join(tmp_path, "buckets"), slots=16, capacity=1, refill_per_second=0.01
+    )
+    assert buckets.consume("a", tokens=0) == 0
+    assert buckets.consume("a", tokens=0) == 0
+    assert buckets.consume("a") == 0
+    assert buckets.consume("a", tokens=0) > 0
@@ -1,9 +1,15 @@
+import pytest
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import crud
+from app.core.config import settings
+from app.crud.base import UNIT_OF_WORK
+from app.models import Item
 from app.schemas.item import ItemCreate, ItemUpdate
+from app.tests.utils.queries import count_queries
 from app.tests.utils.user import create_random_user
-from app.tests.utils.utils import random_lower_string
+from app.tests.utils.utils import random_lower_string, run_in_async_session
 
 
 def test_create_item(db: Session) -> None:
@@ -17,6 +23,17 @@ def test_create_item(db: Session) -> None:
     assert item.user_id == user.id
 
 
+def test_item_ids_are_time_ordered(db: Session) -> None:
+    user = create_random_user(db)
+    items = crud.item.create_multi_with_user(
+        db, objs_in=[ItemCreate() for _ in range(3)], user=user
+    )
+    item = crud.item.create_with_user(db=db, obj_in=ItemCreate(), user=user)
+    assert all(i.id.version == 7 for i in items)
+    # The first 48 bits are the creation time in milliseconds
+    assert max(i.id.int >> 80 for i in items) <= item.id.int >> 80
+
+
 def test_get_item(db: Session) -> None:
     name = random_lower_string()
     description = random_lower_string()
@@ -46,6 +63,54 @@ def test_update_item(db: Session) -> None:
     assert item.user_id == item2.user_id
 
 
+def test_update_item_without_changes(db: Session) -> None:
+    user = create_random_user(db)
+    item = crud.item.create_with_user(db=db, obj_in=ItemCreate(), user=user)
+    # Loaded again, the commit expired its attributes
+    item = crud.item.get(db=db, id=item.id)
+    item_update = ItemUpdate(name=item.name)
+    with count_queries() as queries:
+        item2 = crud.item.update(db=db, db_obj=item, obj_in=item_update)
+    assert item2 is item
+    assert queries.round_trips == 0
+    with count_queries() as queries:
+        crud.item.update(db=db, db_obj=item, obj_in={"description": "changed"})
+    assert sum(s.startswith("UPDATE item SET description") for s in queries.statements)
+
+
+def test_update_and_remove_owned_item(db: Session) -> None:
+    user = create_random_user(db)
+    other_user = create_random_user(db)
+    item = crud.item.create_with_user(db=db, obj_in=ItemCreate(), user=user)
+    updated_at = crud.item.get(db=db, id=item.id).updated_at
+
+    assert (
+        crud.item.update_owned(
+            db, id=item.id, obj_in={"name": "changed"}, user=other_user
+        )
+        is None
+    )
+    # Unchanged rows are not updated
+    assert (
+        crud.item.update_owned(db, id=item.id, obj_in={"name": item.name}, user=user)
+        is None
+    )
+    assert crud.item.get(db=db, id=item.id).updated_at == updated_at
+
+    with count_queries() as queries:
+        item2 = crud.item.update_owned(
+            db, id=item.id, obj_in={"name": "changed"}, user=user
+        )
+    # UPDATE ... RETURNING, COMMIT
+    assert queries.round_trips == 2
+    assert item2.name == "changed"
+
+    assert crud.item.remove_owned(db, id=item.id, user=other_user) is None
+    item3 = crud.item.remove_owned(db, id=item.id, user=user)
+    assert item3.id == item.id
+    assert crud.item.get(db=db, id=item.id) is None
+
+
 def test_delete_item(db: Session) -> None:
     name = random_lower_string()
     description = random_lower_string()
@@ -59,3 +124,75 @@ def test_delete_item(db: Session) -> None:
     assert item2.name == name
     assert item2.description == description
     assert item2.user_id == user.id
+
+
+def test_item_lifecycle_async(db: Session) -> None:
+    user = create_random_user(db)
+    item_in = ItemCreate(name=random_lower_string(), description=random_lower_string())
+    description2 = random_lower_string()
+
+    async def lifecycle(db: AsyncSession) -> None:
+        item = await crud.item.create_with_user_async(db=db, obj_in=item_in, user=user)
+        assert item.user_id == user.id
+        stored_item = await crud.item.get_async(db=db, id=item.id)
+        assert stored_item is item
+        items = await crud.item.get_multi_by_user_async(db=db, user=user)
+        assert [i.id for i in items] == [item.id]
+        item_update = ItemUpdate(description=description2)
+        item2 = await crud.item.update_async(db=db, db_obj=item, obj_in=item_update)
+        assert item2.description == description2
+        await crud.item.remove_async(db=db, obj=item)
+        assert await crud.item.get_async(db=db, id=item.id) is None
+
+    run_in_async_session(lifecycle)
+
+
+def test_unit_of_work_flushes_without_commit(db: Session) -> None:
+    user = create_random_user(db)
+    item_in = ItemCreate(name=random_lower_string())
+
+    async def create(async_db: AsyncSession) -> None:
+        async_db.info[UNIT_OF_WORK] = True
+        item = await crud.item.create_with_user_async(
+            db=async_db, obj_in=item_in, user=user
+        )
+        # Returned by the INSERT, read without loading the attribute
+        assert item.created_at is not None
+        item = await crud.item.update_async(
+            db=async_db, db_obj=item, obj_in=ItemUpdate(description="updated")
+        )
+        assert item.updated_at is not None
+        await async_db.rollback()
+        assert await crud.item.get_async(db=async_db, id=item.id) is None
+
+    run_in_async_session(create)
+
+
+def test_count_items(db: Session, monkeypatch: pytest.MonkeyPatch) -> None:
+    user = create_random_user(db)
+    query = crud.item.select_active.where(Item.user_id == user.id)
+    assert crud.item.count_rows(db, query) == (0, True)
+
+    # Cached until a write to the table is committed
+    item = crud.item.create_with_user(db, obj_in=ItemCreate(), user=user)
+    assert crud.item.count_rows(db, query) == (1, True)
+    crud.item.archive(db, item)
+    assert crud.item.count_rows(db, query) == (0, True)
+
+    # Estimated by the planner above the threshold
+    monkeypatch.setattr(settings, "COUNT_EXACT_THRESHOLD", -1)
+    crud.item.counts.clear()
+    total, exact = crud.item.count(db)
+    assert not exact
+    assert total >= 0
+
+    # The parameters are bound by the driver, not parsed out of the SQL
+    query = crud.item.select_active.where(Item.name == "a :name b %s")
+    assert crud.item.count_rows(db, query)[0] >= 0
+
+    async def count(async_db: AsyncSession) -> int:
+        total, _ = await crud.item.count_rows_async(async_db, query)
+        return total
+
+    crud.item.counts.clear()
+    assert run_in_async_session(count) >= 0
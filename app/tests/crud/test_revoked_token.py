@@ -0,0 +1,73 @@
+import asyncio
+from datetime import UTC, datetime, timedelta
+from typing import List
+
+import pytest
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import crud, models
+from app.core.config import settings
+from app.crud.crud_revoked_token import revocation_filter
+from app.db.session import AsyncSessionLocal, async_engine
+from app.schemas import TokenContext, TokenPayload
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import random_lower_string
+
+
+def test_concurrent_checks_resync_the_filter_once(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    monkeypatch.setattr(settings, "REVOCATION_FILTER_ENABLED", True)
+    monkeypatch.setattr(revocation_filter, "_filter", None)
+    get_active_token_ids_async = crud.revoked_token.get_active_token_ids_async
+    loads: List[int] = []
+
+    async def count_loads(db: AsyncSession) -> List[str]:
+        loads.append(1)
+        await asyncio.sleep(0.05)
+        return await get_active_token_ids_async(db)
+
+    monkeypatch.setattr(crud.revoked_token, "get_active_token_ids_async", count_loads)
+
+    async def is_revoked() -> bool:
+        async with AsyncSessionLocal() as db:
+            return await crud.revoked_token.is_revoked_async(db, token_id="unknown")
+
+    async def run() -> List[bool]:
+        try:
+            return await asyncio.gather(*(is_revoked() for _ in range(5)))
+        finally:
+            await async_engine.dispose()
+
+    assert asyncio.run(run()) == [False] * 5
+    assert len(loads) == 1
+
+
+def test_concurrent_revocations_of_a_token(db: Session) -> None:
+    now = datetime.now(UTC)
+    token_data = TokenPayload(
+        exp=now + timedelta(days=1),
+        iat=now,
+        context=TokenContext.REFRESH_TOKEN,
+        user_id=str(create_random_user(db).id),
+        sso_confirmation_code=None,
+        random_value=random_lower_string(),
+    )
+
+    async def revoke() -> None:
+        async with AsyncSessionLocal() as db:
+            await crud.revoked_token.revoke_async(db, token_data=token_data)
+
+    async def run() -> None:
+        try:
+            await asyncio.gather(*(revoke() for _ in range(3)))
+        finally:
+            await async_engine.dispose()
+
+    asyncio.run(run())
+    query = select(func.count()).where(
+        models.RevokedToken.token_id == token_data.random_value
+    )
+    assert db.scalar(query) == 1
@@ -1,10 +1,18 @@
 from fastapi.encoders import jsonable_encoder
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
 from app import crud
+from app.core.security import SCRYPT_HASH_PREFIX
+from app.crud.base import UNIT_OF_WORK
 from app.schemas import UserCreate, UserUpdate
+from app.tests.core.test_security import legacy_password_hash
 from app.tests.utils.user import create_random_user
-from app.tests.utils.utils import random_email, random_lower_string
+from app.tests.utils.utils import (
+    random_email,
+    random_lower_string,
+    run_in_async_session,
+)
 
 
 def test_create_user(db: Session) -> None:
@@ -76,3 +84,114 @@ def test_unarchive_user(db: Session) -> None:
     assert unarchived_user is not None
     assert unarchived_user.archived is False
     assert unarchived_user.id == user.id
+
+
+def test_authenticate_user_async() -> None:
+    email = random_email()
+    password = random_lower_string()
+    user_in = UserCreate(email=email, password=password)
+
+    async def authenticate(db: AsyncSession) -> None:
+        user = await crud.user.create_async(db, obj_in=user_in)
+        authenticated_user = await crud.user.authenticate_async(
+            db, email=email, password=password
+        )
+        assert authenticated_user
+        assert user.email == authenticated_user.email
+        wrong_password_user = await crud.user.authenticate_async(
+            db, email=email, password=random_lower_string()
+        )
+        assert wrong_password_user is None
+
+    run_in_async_session(authenticate)
+
+
+def test_update_password_async(db: Session) -> None:
+    user = create_random_user(db)
+    new_password = random_lower_string()
+
+    async def update_password(db: AsyncSession) -> None:
+        async_user = await crud.user.get_async(db, id=user.id)
+        await crud.user.update_password_async(
+            db, db_obj=async_user, new_password=new_password
+        )
+
+    run_in_async_session(update_password)
+    db.expire(user)
+    authenticated_user = crud.user.authenticate(
+        db, email=user.email, password=new_password
+    )
+    assert authenticated_user
+    assert authenticated_user.id == user.id
+
+
+def test_get_principal_is_invalidated_on_update(db: Session) -> None:
+    user = create_random_user(db)
+    principal = crud.user.get_principal(db, id=user.id)
+    assert principal
+    assert principal.id == user.id
+    assert crud.user.get_principal(db, id=user.id) is principal
+    new_first_name = random_lower_string()
+    crud.user.update(db, db_obj=user, obj_in={"first_name": new_first_name})
+    updated_principal = crud.user.get_principal(db, id=user.id)
+    assert updated_principal
+    assert updated_principal.first_name == new_first_name
+
+
+def test_principal_is_invalidated_on_commit_of_unit_of_work(db: Session) -> None:
+    user = create_random_user(db)
+    principal = crud.user.get_principal(db, id=user.id)
+
+    async def update(async_db: AsyncSession) -> None:
+        async_db.info[UNIT_OF_WORK] = True
+        db_obj = await crud.user.get_async(async_db, id=user.id)
+        await crud.user.update_async(
+            async_db, db_obj=db_obj, obj_in={"first_name": random_lower_string()}
+        )
+        assert crud.user.get_principal(db, id=user.id) is principal
+        await async_db.commit()
+        assert crud.user.get_principal(db, id=user.id) is not principal
+
+    run_in_async_session(update)
+
+
+def test_get_principal_of_archived_user(db: Session) -> None:
+    user = create_random_user(db)
+    assert crud.user.get_principal(db, id=user.id)
+    crud.user.archive(db, obj=user)
+    assert crud.user.get_principal(db, id=user.id) is None
+
+
+def test_authenticate_user_rehashes_legacy_password(db: Session) -> None:
+    user = create_random_user(db)
+    password = random_lower_string()
+    user.password_hash = legacy_password_hash(password)
+    db.commit()
+    authenticated_user = crud.user.authenticate(db, email=user.email, password=password)
+    assert authenticated_user
+    assert authenticated_user.password_hash.startswith(SCRYPT_HASH_PREFIX)
+    assert crud.user.authenticate(db, email=user.email, password=password)
+
+
+def test_import_multi(db: Session) -> None:
+    existing = create_random_user(db)
+    password = random_lower_string()
+    objs_in = [
+        UserCreate(email=random_email(), password=password, first_name="Tab\tbed"),
+        UserCreate(email=existing.email, password=password),
+        UserCreate(
+            email=random_email(), provider="github", sso_provider_id="Back\\slash"
+        ),
+    ]
+    created = crud.user.import_multi(db, objs_in=objs_in)
+    assert [row.email for row in created] == [objs_in[0].email, objs_in[2].email]
+    user = crud.user.authenticate(db, email=objs_in[0].email, password=password)
+    assert user
+    assert user.first_name == "Tab\tbed"
+    assert user.confirmed is False
+    sso_user = crud.user.get(db, id=created[1].id)
+    assert sso_user
+    assert sso_user.sso_provider_id == "Back\\slash"
+    assert crud.user.get_active_emails(
+        db, emails=[objs_in[0].email, random_email()]
+    ) == {objs_in[0].email}
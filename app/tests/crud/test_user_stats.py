@@ -0,0 +1,89 @@
+from typing import Tuple
+from uuid import UUID
+
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app import crud
+from app.models import User, UserStats
+from app.schemas import ItemCreate
+from app.tests.utils.user import create_random_user
+from app.tests.utils.utils import run_in_async_session
+
+
+def item_counts(db: Session, user: User) -> Tuple[int, int]:
+    stats = db.execute(
+        select(UserStats.items, UserStats.active_items).where(
+            UserStats.user_id == user.id
+        )
+    ).first()
+    return (stats.items, stats.active_items) if stats else (0, 0)
+
+
+def test_user_stats_follow_the_item_writes(db: Session) -> None:
+    user = create_random_user(db)
+    other = create_random_user(db)
+    assert item_counts(db, user) == (0, 0)
+    item = crud.item.create_with_user(db, obj_in=ItemCreate(), user=user)
+    items = crud.item.create_multi_with_user(
+        db, objs_in=[ItemCreate() for _ in range(4)], user=user
+    )
+    assert item_counts(db, user) == (5, 5)
+
+    crud.item.archive(db, item)
+    crud.item.archive_multi(db, ids=[items[0].id, items[1].id])
+    assert item_counts(db, user) == (5, 2)
+    crud.item.unarchive_multi(db, ids=[items[0].id])
+    # Only the updates changing the owner or the archive date count
+    crud.item.update_multi(db, ids=[i.id for i in items], obj_in={"name": "renamed"})
+    assert item_counts(db, user) == (5, 3)
+
+    crud.item.update_by_id(db, id=items[2].id, obj_in={"user_id": other.id})
+    assert item_counts(db, user) == (4, 2)
+    assert item_counts(db, other) == (1, 1)
+    crud.item.remove(db, item)
+    # The archived items[1] is not removed
+    crud.item.remove_multi(db, ids=[items[0].id, items[1].id, items[2].id])
+    assert item_counts(db, user) == (2, 1)
+    assert item_counts(db, other) == (0, 0)
+
+
+def test_user_stats_are_loaded_with_the_user(db: Session) -> None:
+    user = create_random_user(db)
+    crud.item.create_multi_with_user(
+        db, objs_in=[ItemCreate(), ItemCreate()], user=user
+    )
+
+    async def get_user(db: AsyncSession) -> User:
+        return await crud.user.get_async(db, id=user.id)
+
+    # Loaded by the query of the user, read after the session was closed
+    async_user = run_in_async_session(get_user)
+    assert (async_user.stats.items, async_user.stats.active_items) == (2, 2)
+
+
+def test_reconcile_user_stats(db: Session) -> None:
+    user = create_random_user(db)
+    crud.item.create_multi_with_user(
+        db, objs_in=[ItemCreate() for _ in range(3)], user=user
+    )
+    db.execute(update(UserStats).where(UserStats.user_id == user.id).values(items=42))
+    db.commit()
+    # The batch of the single user following `after`
+    after = UUID(int=user.id.int - 1)
+    assert crud.user_stats.reconcile(db, after=after, limit=1) == (user.id, [user.id])
+    assert item_counts(db, user) == (3, 3)
+    # Nothing to repair anymore
+    assert crud.user_stats.reconcile(db, after=after, limit=1) == (user.id, [])
+
+    # The users without items get their counters as well
+    user = create_random_user(db)
+
+    async def reconcile(db: AsyncSession) -> None:
+        assert await crud.user_stats.reconcile_async(
+            db, after=UUID(int=user.id.int - 1), limit=1
+        ) == (user.id, [])
+
+    run_in_async_session(reconcile)
+    assert db.get(UserStats, user.id) is not None
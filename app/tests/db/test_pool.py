@@ -0,0 +1,29 @@
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.exc import TimeoutError
+
+from app.core.config import settings
+from app.db.pool import TimedQueuePool
+
+
+def test_timed_pool_stats() -> None:
+    engine = create_engine(
+        settings.SQLALCHEMY_DATABASE_URI,
+        poolclass=TimedQueuePool,
+        pool_size=1,
+        max_overflow=1,
+        pool_timeout=0.05,
+    )
+    first, second = engine.connect(), engine.connect()
+    stats = engine.pool.stats()
+    assert stats["in_use"] == 2
+    assert stats["overflow"] == 1
+    with pytest.raises(TimeoutError):
+        engine.connect()
+    assert engine.pool.stats()["wait_ms_max"] >= 50
+    first.close()
+    second.close()
+    assert engine.pool.stats()["in_use"] == 0
+    engine.dispose()
+    # The metrics are kept by the recreated pool
+    assert engine.pool.stats()["checkouts"] == 3
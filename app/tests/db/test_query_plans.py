@@ -0,0 +1,196 @@
+"""
+Query plan regression suite.
+
+Every CRUD query runs against a seeded database and its plan must not read a
+whole table of the application with a sequential scan. The queries are only
+explained, and the seed is rolled back at the end of the module.
+"""
+
+import json
+from datetime import UTC, datetime
+from typing import Any, Callable, Dict, Generator, Iterator, List, Tuple
+
+import pytest
+from sqlalchemy import delete, event, text
+from sqlalchemy.orm import Session
+
+from app import crud, models, schemas
+from app.crud.base import UNIT_OF_WORK
+from app.crud.crud_revoked_token import revoked_token_query
+from app.db.base_class import Base
+from app.db.session import engine
+
+USERS = 5_000
+ITEMS_PER_USER = 10
+
+TABLES = {table.name for table in Base.metadata.sorted_tables}
+
+SEED = [
+    "INSERT INTO person (id, email, role, language, provider, sso_provider_id, "
+    "archived_at, created_at) "
+    "SELECT gen_random_uuid(), 'plan-' || n || '@example.com', 'customer', 'en', "
+    "'google', 'plan-' || n, CASE WHEN n % 10 = 0 THEN now() END, "
+    "now() - n * interval '1 second' FROM generate_series(1, :users) AS n",
+    "INSERT INTO file (id, name, filename, user_id, created_at) "
+    "SELECT gen_random_uuid(), 'plan', 'plan', id, now() FROM person "
+    "WHERE email LIKE 'plan-%'",
+    "INSERT INTO item (id, name, user_id, archived_at, created_at) "
+    "SELECT gen_random_uuid(), 'plan', id, CASE WHEN n % 10 = 0 THEN now() END, "
+    "now() - n * interval '1 millisecond' FROM person, "
+    "generate_series(1, :items) AS n WHERE email LIKE 'plan-%'",
+    "INSERT INTO revoked_token (id, token_id, user_id, expires_at, created_at) "
+    "SELECT gen_random_uuid(), 'plan-' || n, NULL, "
+    "now() + CASE WHEN n % 100 = 0 THEN -1 ELSE 1 END * interval '1 hour', now() "
+    "FROM generate_series(1, :users) AS n",
+]
+
+
+@pytest.fixture(scope="module")
+def plan_db() -> Generator[Session, None, None]:
+    connection = engine.connect()
+    transaction = connection.begin()
+    # The CRUD methods only flush, the transaction is never committed
+    db = Session(bind=connection, info={UNIT_OF_WORK: True})
+    for statement in SEED:
+        db.execute(text(statement), {"users": USERS, "items": ITEMS_PER_USER})
+    for table in TABLES:
+        db.execute(text(f"ANALYZE {table}"))
+    yield db
+    db.close()
+    transaction.rollback()
+    connection.close()
+
+
+@pytest.fixture(scope="module")
+def seeded(plan_db: Session) -> Dict[str, Any]:
+    user = plan_db.scalar(
+        text("SELECT id FROM person WHERE email = 'plan-1234@example.com'")
+    )
+    items = list(
+        plan_db.scalars(text("SELECT id FROM item WHERE user_id = :id"), {"id": user})
+    )
+    return {"user": crud.user.get(plan_db, id=user), "items": items}
+
+
+def captured_statements(db: Session, call: Callable[[], Any]) -> List[Tuple]:
+    statements: List[Tuple] = []
+
+    def capture(conn: Any, cursor: Any, statement: str, parameters: Any, *_) -> None:
+        statements.append((statement, parameters))
+
+    connection = db.connection()
+    event.listen(connection, "before_cursor_execute", capture)
+    try:
+        db.expunge_all()
+        call()
+    finally:
+        event.remove(connection, "before_cursor_execute", capture)
+    return statements
+
+
+def plan_nodes(plan: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def sequential_scans(db: Session, statement: str, parameters: Any) -> List[str]:
+    result = db.connection().exec_driver_sql(
+        f"EXPLAIN (FORMAT JSON) {statement}", parameters
+    )
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return [
+        node["Relation Name"]
+        for node in plan_nodes(plan[0]["Plan"])
+        if node["Node Type"] == "Seq Scan" and node["Relation Name"] in TABLES
+    ]
+
+
+QUERIES: Dict[str, Callable[[Session, Dict[str, Any]], Any]] = {
+    "user_get": lambda db, s: crud.user.get(db, id=s["user"].id),
+    "user_get_by_email": lambda db, s: crud.user.get_by_email(
+        db, email="plan-1234@example.com"
+    ),
+    "user_get_by_sso_provider_id": lambda db, s: crud.user.get_by_sso_provider_id(
+        db, sso_provider_id="plan-1234", provider=models.Provider.GOOGLE
+    ),
+    "user_get_page": lambda db, s: crud.user.get_page(db, limit=20),
+    "user_get_next_page": lambda db, s: crud.user.get_page(
+        db, cursor=crud.user.get_page(db, limit=20)[1], limit=20
+    ),
+    "user_get_page_with_archived": lambda db, s: crud.user.get_page(
+        db, limit=20, with_archived=True
+    ),
+    "user_get_version": lambda db, s: crud.user.get_version(db, s["user"].id),
+    "user_get_page_versions": lambda db, s: crud.user.get_page_versions(db, limit=20),
+    "item_get": lambda db, s: crud.item.get(db, id=s["items"][0]),
+    "item_get_version": lambda db, s: crud.item.get_version(
+        db, s["items"][0], columns=[models.Item.user_id]
+    ),
+    "item_get_page_versions_by_user": lambda db, s: (
+        crud.item.get_page_versions_by_user(db, user=s["user"], limit=20)
+    ),
+    "item_get_page": lambda db, s: crud.item.get_page(db, limit=20),
+    "item_get_next_page": lambda db, s: crud.item.get_page(
+        db, cursor=crud.item.get_page(db, limit=20)[1], limit=20
+    ),
+    "item_get_page_by_user": lambda db, s: crud.item.get_page_by_user(
+        db, user=s["user"], limit=20
+    ),
+    "user_get_active_emails": lambda db, s: crud.user.get_active_emails(
+        db, emails=[f"plan-{n}@example.com" for n in range(20)]
+    ),
+    "user_stats_reconcile": lambda db, s: crud.user_stats.reconcile(
+        db, after=s["user"].id, limit=20
+    ),
+    "user_search": lambda db, s: crud.user.search(
+        db, text="plan-123", provider=models.Provider.GOOGLE, limit=20
+    ),
+    "user_search_fuzzy": lambda db, s: crud.user.search(
+        db, text="zebra", fuzzy=True, role=models.Role.CUSTOMER, limit=20
+    ),
+    "item_search": lambda db, s: crud.item.search(
+        db, text="zebra", language=models.Language.EN, limit=20
+    ),
+    "item_search_by_user": lambda db, s: crud.item.search(
+        db, text="plan", language=models.Language.FR, user=s["user"], limit=20
+    ),
+    "item_get_owners": lambda db, s: crud.item.get_owners(db, ids=s["items"]),
+    "item_update_multi": lambda db, s: crud.item.update_multi(
+        db, ids=s["items"], obj_in=schemas.ItemUpdate(name="plan")
+    ),
+    "item_update_owned": lambda db, s: crud.item.update_owned(
+        db, id=s["items"][0], obj_in={"name": "changed"}, user=s["user"]
+    ),
+    "item_remove_owned": lambda db, s: crud.item.remove_owned(
+        db, id=s["items"][0], user=s["user"]
+    ),
+    "item_archive_multi": lambda db, s: crud.item.archive_multi(db, ids=s["items"]),
+    "item_remove_multi": lambda db, s: crud.item.remove_multi(db, ids=s["items"]),
+    "revoked_token_lookup": lambda db, s: db.scalar(revoked_token_query("plan-42")),
+    "revoked_token_purge": lambda db, s: db.execute(
+        delete(models.RevokedToken).where(
+            models.RevokedToken.expires_at <= datetime.now(UTC)
+        )
+    ),
+}
+
+
+@pytest.mark.parametrize("name", QUERIES)
+def test_query_plan_has_no_sequential_scan(
+    plan_db: Session, seeded: Dict[str, Any], name: str
+) -> None:
+    savepoint = plan_db.begin_nested()
+    # Rolled back whatever the outcome, a failed statement would otherwise abort
+    # the transaction shared by the next cases
+    try:
+        statements = captured_statements(
+            plan_db, lambda: QUERIES[name](plan_db, seeded)
+        )
+        assert statements
+        for statement, parameters in statements:
+            assert sequential_scans(plan_db, statement, parameters) == [], statement
+    finally:
+        savepoint.rollback()
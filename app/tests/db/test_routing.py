@@ -0,0 +1,133 @@
+from typing import Any, Dict, Generator, Optional
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import NullPool
+
+from app.core.config import settings
+from app.crud.crud_revoked_token import revocation_filter
+from app.db import routing
+from app.db.session import replica_engines
+from app.tests.utils.queries import count_queries
+from app.tests.utils.user import authentication_token_from_email, create_random_user
+from app.tests.utils.utils import random_lower_string
+
+ITEMS_URL = f"{settings.API_V1_STR}/items/"
+
+
+@pytest.fixture
+def replica() -> Generator[AsyncEngine, None, None]:
+    # A single local server is available, the replica is a second engine on it
+    replica = create_async_engine(
+        settings.SQLALCHEMY_ASYNC_DATABASE_URI, poolclass=NullPool
+    )
+    replica_engines.append(replica)
+    yield replica
+    replica_engines.remove(replica)
+    routing.replayed_lsn.pop(replica, None)
+
+
+def test_parse_lsn() -> None:
+    assert routing.parse_lsn("0/0") == 0
+    assert routing.parse_lsn("16/B374D848") == (0x16 << 32) + 0xB374D848
+    assert routing.parse_lsn("1/0") > routing.parse_lsn("0/FFFFFFFF")  # type: ignore
+    assert routing.parse_lsn(None) is None
+    assert routing.parse_lsn("invalid") is None
+
+
+def test_reads_are_routed_to_the_replica(
+    client: TestClient,
+    replica: AsyncEngine,
+    normal_user_token_headers: Dict[str, str],
+) -> None:
+    with count_queries(replica.sync_engine) as replica_queries:
+        r = client.get(ITEMS_URL, headers=normal_user_token_headers)
+    assert r.status_code == 200
+    assert any("FROM item" in s for s in replica_queries.statements)
+    assert routing.CONSISTENCY_TOKEN_HEADER not in r.headers
+
+    with count_queries(replica.sync_engine) as replica_queries:
+        r = client.post(
+            ITEMS_URL,
+            headers=normal_user_token_headers,
+            json={"name": random_lower_string()},
+        )
+    assert r.status_code == 200
+    assert replica_queries.count == 0
+    assert routing.parse_lsn(r.headers[routing.CONSISTENCY_TOKEN_HEADER])
+
+
+def test_reads_wait_for_the_replica_to_catch_up(
+    client: TestClient,
+    replica: AsyncEngine,
+    normal_user_token_headers: Dict[str, str],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    replay_lsn: Optional[int] = 0
+
+    async def replica_replay_lsn(engine: Any) -> Optional[int]:
+        return replay_lsn
+
+    monkeypatch.setattr(routing, "replica_replay_lsn", replica_replay_lsn)
+    r = client.post(
+        ITEMS_URL,
+        headers=normal_user_token_headers,
+        json={"name": random_lower_string()},
+    )
+    token = r.headers[routing.CONSISTENCY_TOKEN_HEADER]
+    headers = {**normal_user_token_headers, routing.CONSISTENCY_TOKEN_HEADER: token}
+
+    with count_queries(replica.sync_engine) as replica_queries:
+        r = client.get(ITEMS_URL, headers=headers)
+    assert r.status_code == 200
+    assert replica_queries.count == 0
+    assert r.json()[-1]["id"]
+
+    replay_lsn = routing.parse_lsn(token)
+    with count_queries(replica.sync_engine) as replica_queries:
+        r = client.get(ITEMS_URL, headers=headers)
+    assert any("FROM item" in s for s in replica_queries.statements)
+
+
+def test_revocation_filter_is_resynced_from_the_primary(
+    client: TestClient,
+    db: Session,
+    replica: AsyncEngine,
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    password = random_lower_string()
+    user = create_random_user(db, password=password)
+    r = client.post(
+        f"{settings.API_V1_STR}/auth/login/access-token",
+        data={"username": user.email, "password": password},
+    )
+    refresh_token = r.json()["refresh_token"]
+    monkeypatch.setattr(settings, "REVOCATION_FILTER_ENABLED", True)
+    monkeypatch.setattr(revocation_filter, "_filter", None)
+
+    with count_queries(replica.sync_engine) as replica_queries:
+        r = client.post(f"{settings.API_V1_STR}/auth/refresh", json=refresh_token)
+    assert r.status_code == 200
+    assert any("FROM person" in s for s in replica_queries.statements)
+    assert not any("revoked_token" in s for s in replica_queries.statements)
+
+
+def test_principal_is_reloaded_from_the_primary(
+    client: TestClient,
+    db: Session,
+    replica: AsyncEngine,
+) -> None:
+    user = create_random_user(db)
+    headers = authentication_token_from_email(client=client, email=user.email, db=db)
+    url = f"{settings.API_V1_STR}/users/me"
+    first_name = random_lower_string()
+    r = client.put(url, headers=headers, json={"first_name": first_name})
+    assert r.status_code == 200
+
+    # The update invalidated the cached principal
+    with count_queries(replica.sync_engine) as replica_queries:
+        r = client.get(url, headers=headers)
+    assert r.json()["first_name"] == first_name
+    assert not any("FROM person" in s for s in replica_queries.statements)
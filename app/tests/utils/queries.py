@@ -0,0 +1,47 @@
+from contextlib import contextmanager
+from typing import Any, Iterator, List
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.db.session import async_engine, engine
+
+
+class QueryCounter:
+    def __init__(self) -> None:
+        self.statements: List[str] = []
+        self.commits = 0
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __call__(self, conn: Any, cursor: Any, statement: str, *args: Any) -> None:
+        self.statements.append(statement)
+
+    def on_commit(self, conn: Any) -> None:
+        self.commits += 1
+
+    @property
+    def round_trips(self) -> int:
+        return self.count + self.commits
+
+
+@contextmanager
+def count_queries(*binds: Engine) -> Iterator[QueryCounter]:
+    """
+    Record the SQL statements and the commits sent to the database by `binds`
+    inside the block, by default both the synchronous and the asynchronous
+    engines.
+    """
+    binds = binds or (engine, async_engine.sync_engine)
+    counter = QueryCounter()
+    for bind in binds:
+        event.listen(bind, "before_cursor_execute", counter)
+        event.listen(bind, "commit", counter.on_commit)
+    try:
+        yield counter
+    finally:
+        for bind in binds:
+            event.remove(bind, "before_cursor_execute", counter)
+            event.remove(bind, "commit", counter.on_commit)
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Optional
 
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
@@ -22,9 +22,9 @@ def user_authentication_headers(
     return headers
 
 
-def create_random_user(db: Session) -> User:
+def create_random_user(db: Session, password: Optional[str] = None) -> User:
     email = random_email()
-    password = random_lower_string()
+    password = password or random_lower_string()
     user_in = UserCreate(username=email, email=email, password=password)
     user = crud.user.create(db=db, obj_in=user_in)
     return user
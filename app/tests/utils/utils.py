@@ -1,10 +1,16 @@
+import asyncio
 import random
 import string
-from typing import Dict
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
 
+import anyio
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import settings
+from app.db.session import AsyncSessionLocal, async_engine
+
+T = TypeVar("T")
 
 
 def random_lower_string() -> str:
@@ -25,3 +31,73 @@ def get_superuser_token_headers(client: TestClient) -> Dict[str, str]:
     a_token = tokens["access_token"]
     headers = {"Authorization": f"Bearer {a_token}"}
     return headers
+
+
+def run_in_async_session(func: Callable[[AsyncSession], Awaitable[T]]) -> T:
+    """
+    Run `func` with a new `AsyncSession` in its own event loop.
+    """
+
+    async def run() -> T:
+        try:
+            async with AsyncSessionLocal() as db:
+                return await func(db)
+        finally:
+            # The pooled connections are bound to the event loop being closed
+            await async_engine.dispose()
+
+    return asyncio.run(run())
+
+
+def stream_without_buffering(
+    client: TestClient,
+    path: str,
+    headers: Dict[str, str],
+    query_string: str = "",
+    disconnect_after: Optional[int] = None,
+) -> Dict[str, int]:
+    """
+    GET `path` straight through the ASGI app on the event loop of `client`,
+    counting the chunks and the lines of the body instead of buffering it like
+    the test client. The client disconnects after `disconnect_after` chunks.
+    """
+    response = {"status": 0, "chunks": 0, "lines": 0}
+
+    async def run() -> None:
+        requested, disconnected = False, anyio.Event()
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal requested
+            if not requested:
+                requested = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                response["chunks"] += 1
+                response["lines"] += message.get("body", b"").count(b"\n")
+                if response["chunks"] == disconnect_after:
+                    disconnected.set()
+
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "server": ("testserver", 80),
+            "client": ("testclient", 50000),
+            "root_path": "",
+            "path": path,
+            "raw_path": path.encode(),
+            "query_string": query_string.encode(),
+            "headers": [(k.lower().encode(), v.encode()) for k, v in headers.items()],
+        }
+        await client.app(scope, receive, send)
+
+    client.portal.call(run)
+    return response
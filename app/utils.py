@@ -1,4 +1,7 @@
+import os
 import re
+import time
+import uuid
 
 
 def to_snake_case(class_name):
@@ -6,3 +9,18 @@ def to_snake_case(class_name):
     s1 = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", class_name)
     # Insert an underscore between lowercase and uppercase
     return re.sub("([a-z0-9])([A-Z])", r"\1_\2", s1).lower()
+
+
+def uuid7() -> uuid.UUID:
+    """
+    Time-ordered UUID, version 7 of RFC 9562: the Unix time in milliseconds in
+    the first 48 bits, random bits after. The new keys are appended at the end
+    of the primary key index instead of being scattered in it.
+    """
+    milliseconds, nanoseconds = divmod(time.time_ns(), 1_000_000)
+    # The fraction of millisecond in the 12 bits following the version orders
+    # the keys generated during the same millisecond (method 3 of the RFC)
+    fraction = nanoseconds * 4096 // 1_000_000
+    random = int.from_bytes(os.urandom(8)) & (1 << 62) - 1
+    value = milliseconds << 80 | 0x7 << 76 | fraction << 64 | 0x2 << 62 | random
+    return uuid.UUID(int=value)
@@ -47,6 +47,9 @@ graceful_timeout = int(graceful_timeout_str)
 timeout = int(timeout_str)
 keepalive = int(keepalive_str)
 
+# Shares the connections of DB_MAX_CONNECTIONS between the workers
+os.environ["WEB_CONCURRENCY"] = str(workers)
+
 
 # For debugging and testing
 log_data = {